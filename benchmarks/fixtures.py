@@ -0,0 +1,135 @@
+"""
+Synthetic WAD files for the benchmarks.
+
+IWADs cannot be shipped, so every fixture is generated from a fixed
+random seed: the same arguments always give the same bytes.
+"""
+
+import os
+import random
+
+import omg.palette
+from omg import *
+from omg.mapedit import Vertex, Linedef, Sidedef, Sector, Thing
+
+def many_lumps(path, count=20000, size=256, seed=1):
+    """A PWAD with `count` data and sound lumps of about `size` bytes,
+    a quarter of them duplicates of others."""
+    rnd = random.Random(seed)
+    w = WadIO(path)
+    payloads = []
+    for i in range(count):
+        if payloads and i % 4 == 3:
+            data = rnd.choice(payloads)
+        else:
+            n = rnd.randint(size // 2, size * 3 // 2)
+            data = ''.join(chr(rnd.randint(0, 255)) for j in range(16)) * (n // 16)
+            payloads.append(data)
+        if i % 2:
+            w.insert('DS%06d' % i, data)
+        else:
+            w.insert('L%07d' % i, data)
+    w.save()
+    w.close()
+
+def huge_map(path, cells=128, things=4000, seed=1):
+    """A PWAD with one map, MAP01: a grid of cells x cells square
+    sectors joined by two-sided linedefs, with things scattered over
+    it. The default makes about 33000 linedefs."""
+    rnd = random.Random(seed)
+    step = 64
+    n = cells + 1
+    vertexes = [Vertex(x * step, y * step) for y in range(n) for x in range(n)]
+    sectors = [Sector(z_floor=rnd.randint(0, 8) * 8, z_ceil=128,
+                      light=rnd.choice([128, 160, 192]))
+               for i in range(cells * cells)]
+    sidedefs, linedefs = [], []
+    def side(sector):
+        sidedefs.append(Sidedef(tx_low="STARTAN3", tx_up="STARTAN3",
+                                tx_mid="-", sector=sector))
+        return len(sidedefs) - 1
+    def line(a, b, right, left):
+        # the front side faces the sector on the right of a -> b
+        l = Linedef(vx_a=a, vx_b=b, front=side(right),
+                    back=left is None and 0xFFFF or side(left))
+        l.two_sided = left is not None
+        l.impassable = left is None
+        linedefs.append(l)
+    def cell(x, y):
+        if 0 <= x < cells and 0 <= y < cells:
+            return y*cells + x
+    for y in range(n):
+        for x in range(cells):
+            below, above = cell(x, y-1), cell(x, y)
+            a, b = y*n + x, y*n + x + 1
+            if below is None:
+                line(b, a, above, None)
+            else:
+                line(a, b, below, above)
+    for x in range(n):
+        for y in range(cells):
+            left, right = cell(x-1, y), cell(x, y)
+            a, b = y*n + x, (y+1)*n + x
+            if right is None:
+                line(b, a, left, None)
+            else:
+                line(a, b, right, left)
+    thing_list = [Thing(x=rnd.randint(8, cells*step - 8), y=rnd.randint(8, cells*step - 8),
+                        angle=rnd.choice([0, 90, 180, 270]), type=rnd.choice([1, 3001, 2011, 2035]),
+                        flags=7)
+                  for i in range(things)]
+    m = NameGroup()
+    m["_HEADER_"] = Lump("")
+    m["THINGS"]   = Lump(''.join(t.pack() for t in thing_list))
+    m["LINEDEFS"] = Lump(''.join(l.pack() for l in linedefs))
+    m["SIDEDEFS"] = Lump(''.join(s.pack() for s in sidedefs))
+    m["VERTEXES"] = Lump(''.join(v.pack() for v in vertexes))
+    m["SECTORS"]  = Lump(''.join(s.pack() for s in sectors))
+    wad = WAD()
+    wad.maps["MAP01"] = m
+    wad.to_file(path)
+
+def sprites(path, count=600, size=(48, 64), seed=1):
+    """A PWAD with `count` sprites of the given size, each a blob of
+    colour on a transparent background so that posts vary in length."""
+    rnd = random.Random(seed)
+    width, height = size
+    tran = chr(omg.palette.default.tran_index)
+    wad = WAD()
+    for i in range(count):
+        cx, cy = rnd.randint(0, width), rnd.randint(0, height)
+        r2 = rnd.randint(width, width * height // 4)
+        base = rnd.randint(0, 200)
+        rows = []
+        for y in range(height):
+            rows.append(''.join((x-cx)**2 + (y-cy)**2 < r2 and chr(base + (x+y) % 32) or tran
+                                for x in range(width)))
+        g = Graphic()
+        g.from_raw(''.join(rows), width, height, width // 2, height - 4)
+        wad.sprites['S%03d%c0' % (i // 26, 65 + i % 26)] = g
+    wad.to_file(path)
+
+fixtures = {
+    "many_lumps.wad": many_lumps,
+    "huge_map.wad":   huge_map,
+    "sprites.wad":    sprites,
+}
+
+def generate(directory, quick=False):
+    """Write all fixtures that do not exist yet to directory and return
+    a dict mapping fixture names to paths. quick gives smaller files
+    for a fast run."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    sizes = {
+        "many_lumps.wad": quick and {"count": 2000} or {},
+        "huge_map.wad":   quick and {"cells": 32, "things": 500} or {},
+        "sprites.wad":    quick and {"count": 100} or {},
+    }
+    paths = {}
+    for name, make in fixtures.items():
+        path = os.path.join(directory, (quick and "quick_" or "") + name)
+        if not os.path.exists(path):
+            make(path, **sizes[name])
+        paths[name] = path
+    return paths
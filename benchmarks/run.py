@@ -0,0 +1,297 @@
+#!/usr/bin/python
+#
+# Benchmarks for the core WAD, map and graphics paths
+#
+# Every operation runs in a process of its own so that its peak memory
+# can be measured. The fixtures are generated (see fixtures.py) in a
+# directory that is reused between runs.
+#
+import sys
+import os
+import getopt
+import json
+import random
+import resource
+import subprocess
+import tempfile
+import time
+
+# --- Add OMG module to Python path ---
+real_path  = os.path.realpath(__file__)
+currentdir = os.path.dirname(real_path)
+parentdir  = os.path.dirname(currentdir)
+moduledir  = os.path.dirname(parentdir)
+sys.path.insert(0, moduledir)
+sys.path.insert(0, currentdir)
+
+# -------------------------------------------------------------------------------------------------
+# Operations
+#
+# Each takes the path of its fixture and the quick flag and returns a
+# function that does the work once and returns the amount of work done,
+# in the unit given in ops.
+# Everything outside that function is setup and is not timed.
+# -------------------------------------------------------------------------------------------------
+def op_wadio_open(path, quick):
+    from omg import WadIO
+    def run():
+        w = WadIO(path)
+        n = len(w.entries)
+        w.close()
+        return n
+    return run
+
+def op_wad_load(path, quick):
+    from omg import WAD
+    def run():
+        return len(list(WAD(path).lumps()))
+    return run
+
+def op_wad_save(path, quick):
+    from omg import WAD
+    wad = WAD(path)
+    target = path + ".out"
+    def run():
+        wad.to_file(target)
+        os.remove(target)
+        return os.path.getsize(path)
+    return run
+
+def op_map_decode(path, quick):
+    from omg import WAD, MapEditor
+    group = WAD(path).maps["MAP01"]
+    def run():
+        # the lists are decoded on first use
+        edit = MapEditor(group)
+        for name in ("vertexes", "things", "linedefs", "sidedefs", "sectors"):
+            getattr(edit, name)
+        return len(edit.linedefs)
+    return run
+
+def op_map_encode(path, quick):
+    from omg import WAD, MapEditor
+    edit = MapEditor(WAD(path).maps["MAP01"])
+    lists = [edit.vertexes, edit.things, edit.linedefs, edit.sidedefs, edit.sectors]
+    def run():
+        # unchanged lists would be passed through without packing
+        for l in lists:
+            l.dirty = True
+        edit.to_lumps()
+        return len(edit.linedefs)
+    return run
+
+def op_graphic_to_raw(path, quick):
+    from omg import WAD
+    import omg.lump
+    sprites = WAD(path).sprites.values()
+    def run():
+        # start from an empty cache so that every run decodes
+        omg.lump.decoded.clear()
+        for g in sprites:
+            g.to_raw()
+        return len(sprites)
+    return run
+
+def op_graphic_to_raw_cached(path, quick):
+    from omg import WAD
+    sprites = WAD(path).sprites.values()
+    for g in sprites:
+        g.to_raw()
+    def run():
+        for i in range(10):
+            for g in sprites:
+                g.width, g.height, g.offsets
+                g.to_raw()
+        return 10 * len(sprites)
+    return run
+
+def op_graphic_from_raw(path, quick):
+    from omg import WAD, Graphic
+    raws = [(g.to_raw(), g.width, g.height) for g in WAD(path).sprites.values()]
+    def run():
+        for data, width, height in raws:
+            Graphic().from_raw(data, width, height)
+        return len(raws)
+    return run
+
+def _colors(n, seed=1):
+    rnd = random.Random(seed)
+    return [(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255))
+            for i in xrange(n)]
+
+def op_palette_match(path, quick):
+    import omg.palette
+    pal = omg.palette.default
+    colors = _colors(quick and 5000 or 50000)
+    def run():
+        # start from an empty memo so that every run does the same work
+        pal.memo = omg.palette.LRUCache(omg.palette.memo_size)
+        for c in colors:
+            pal.match(c)
+        return len(colors)
+    return run
+
+def op_palette_match_many(path, quick):
+    import omg.palette
+    pal = omg.palette.default
+    colors = ''.join(chr(c) for rgb in _colors(quick and 20000 or 200000) for c in rgb)
+    def run():
+        pal.match_many(colors)
+        return len(colors) // 3
+    return run
+
+# name: (function, fixture, unit)
+ops = {
+    "wadio_open":            (op_wadio_open,            "many_lumps.wad", "lumps"),
+    "wad_load":              (op_wad_load,              "many_lumps.wad", "lumps"),
+    "wad_save":              (op_wad_save,              "many_lumps.wad", "bytes"),
+    "map_decode":            (op_map_decode,            "huge_map.wad",   "linedefs"),
+    "map_encode":            (op_map_encode,            "huge_map.wad",   "linedefs"),
+    "graphic_to_raw":        (op_graphic_to_raw,        "sprites.wad",    "graphics"),
+    "graphic_to_raw_cached": (op_graphic_to_raw_cached, "sprites.wad",    "graphics"),
+    "graphic_from_raw":      (op_graphic_from_raw,      "sprites.wad",    "graphics"),
+    "palette_match":         (op_palette_match,         None,             "colors"),
+    "palette_match_many":    (op_palette_match_many,    None,             "colors"),
+}
+
+def _maxrss():
+    """Peak resident memory of this process in KB."""
+    # On Linux ru_maxrss survives exec, so a child would report the peak
+    # of the parent if it was higher; VmHWM starts over
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except IOError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+def child(name, path, repeat, quick):
+    """Run one operation in this process and print its result as JSON."""
+    func, fixture, unit = ops[name]
+    base = _maxrss()
+    run = func(path, quick)
+    setup = _maxrss()
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        units = run()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    print(json.dumps({"seconds": best, "units": units, "unit": unit,
+        "throughput": units / max(best, 1e-9),
+        "peak_kb": _maxrss(), "delta_kb": _maxrss() - setup,
+        "setup_kb": setup - base}))
+
+def measure(name, path, repeat, quick):
+    """Run one operation in a child process and return its result."""
+    out = subprocess.check_output([sys.executable, real_path, "--child",
+        name, path or "", str(repeat), str(int(quick))])
+    return json.loads(out.splitlines()[-1])
+
+def compare(results, baseline, threshold):
+    """Print the change in throughput against a baseline and return the
+    names of the operations that got slower by more than threshold."""
+    slower = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]["throughput"]
+        new = results[name]["throughput"]
+        change = (new - old) / old
+        mark = ""
+        if change < -threshold:
+            mark = "  REGRESSION"
+            slower.append(name)
+        print("{0:22} {1:+7.1%}  peak {2} -> {3} KB{4}".format(name, change,
+            baseline[name]["peak_kb"], results[name]["peak_kb"], mark))
+    return slower
+
+# -------------------------------------------------------------------------------------------------
+# main ()
+# -------------------------------------------------------------------------------------------------
+def usage():
+    print('Omgifol benchmarks')
+    print('Times WAD, map and graphics operations on generated WADs and reports their')
+    print('throughput and peak memory.\n')
+    print('Usage: run.py [options]\n')
+    print('  -q, --quick               Small fixtures and a single run')
+    print('  -r, --repeat n            Runs per operation, the best is reported. Defaults to 3')
+    print('  -o, --ops a,b,...         Operations to run. Defaults to all of them:')
+    print('                            ' + ', '.join(sorted(ops)))
+    print('  -d, --fixtures dir        Where to keep the generated WADs. Defaults to a')
+    print('                            directory in the system temporary directory')
+    print('      --json file           Write the results to a file as JSON')
+    print('      --save-baseline file  Write the results as a baseline')
+    print('      --compare file        Compare against a baseline and exit with status 1')
+    print('                            if an operation got slower')
+    print('      --threshold pct       Allowed slowdown in percent. Defaults to 10')
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        name, path, repeat, quick = sys.argv[2:6]
+        child(name, path, int(repeat), quick == "1")
+        sys.exit(0)
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hqr:o:d:', ['help', 'quick',
+            'repeat=', 'ops=', 'fixtures=', 'json=', 'save-baseline=', 'compare=',
+            'threshold='])
+    except getopt.GetoptError, e:
+        print(e)
+        usage()
+        sys.exit(2)
+    quick = False
+    repeat = None
+    names = sorted(ops)
+    directory = os.path.join(tempfile.gettempdir(), "omg-benchmarks")
+    output = save = against = None
+    threshold = 10.0
+    for o, a in opts:
+        if   o in ('-h', '--help'):     usage(); sys.exit(0)
+        elif o in ('-q', '--quick'):    quick = True
+        elif o in ('-r', '--repeat'):   repeat = int(a)
+        elif o in ('-o', '--ops'):      names = a.split(',')
+        elif o in ('-d', '--fixtures'): directory = a
+        elif o == '--json':             output = a
+        elif o == '--save-baseline':    save = a
+        elif o == '--compare':          against = a
+        elif o == '--threshold':        threshold = float(a)
+        else:
+            assert False, "Unhandled option"
+    for name in names:
+        if name not in ops:
+            print('Unknown operation {0}'.format(name))
+            sys.exit(2)
+    if repeat is None:
+        repeat = quick and 1 or 3
+
+    from fixtures import generate
+    paths = generate(directory, quick)
+    results = {}
+    for name in names:
+        fixture = ops[name][1]
+        r = measure(name, fixture and paths[fixture], repeat, quick)
+        r["quick"] = quick
+        results[name] = r
+        print("{0:22} {1:9.3f} s  {2:12.0f} {3}/s  peak {4} KB (+{5} KB)".format(
+            name, r["seconds"], r["throughput"], r["unit"], r["peak_kb"], r["delta_kb"]))
+
+    for filename in (output, save):
+        if filename is not None:
+            f = open(filename, 'w')
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.close()
+    if against is not None:
+        baseline = json.load(open(against))
+        if any(baseline[n].get("quick") != quick for n in baseline if n in results):
+            print('Warning: the baseline was made with{0} --quick'.format(
+                quick and "out" or ""))
+        print('\nAgainst {0}:'.format(against))
+        if compare(results, baseline, threshold / 100.0):
+            sys.exit(1)
+    sys.exit(0)
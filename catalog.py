@@ -0,0 +1,241 @@
+"""
+Index of the lumps and maps in a collection of WAD files.
+
+A Catalog keeps the directory of every WAD it has seen in an SQLite
+database, along with a hash of each lump, so that questions like
+"which WADs contain MAP07" can be answered without opening any WAD.
+Only the header and directory of a file are read to catalog it (plus
+the lump data once, if hashes are wanted), and files whose size and
+modification time have not changed since the last scan are skipped.
+"""
+
+import os
+import sqlite3
+from hashlib import sha1
+from omg.util import *
+from omg.wadio import read_directory
+from omg.wad import _maptail, _glmaptail
+
+_schema = """
+CREATE TABLE IF NOT EXISTS wads (
+    id       INTEGER PRIMARY KEY,
+    path     TEXT UNIQUE NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime    REAL NOT NULL,
+    type     TEXT,                -- IWAD, PWAD or NULL if unreadable
+    hashed   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lumps (
+    wad      INTEGER NOT NULL REFERENCES wads(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    hash     TEXT
+);
+CREATE TABLE IF NOT EXISTS maps (
+    wad      INTEGER NOT NULL REFERENCES wads(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    format   TEXT NOT NULL        -- doom, hexen or gl
+);
+CREATE INDEX IF NOT EXISTS lumps_name ON lumps(name);
+CREATE INDEX IF NOT EXISTS lumps_wad ON lumps(wad);
+CREATE INDEX IF NOT EXISTS maps_name ON maps(name);
+CREATE INDEX IF NOT EXISTS maps_wad ON maps(wad);
+"""
+
+def find_maps(names):
+    """Find the maps in a list of directory entry names, the same way
+    the maps and glmaps groups of a WAD do: a map is a header lump
+    followed by the lumps of a map. Returns a list of (position, name,
+    format, count) tuples where format is 'doom', 'hexen', 'udmf' or
+    'gl' and count is the number of map lumps after the header."""
+    maps = []
+    i, n = 0, len(names)
+    while i < n - 1:
+        if names[i+1] == 'TEXTMAP':
+            header = i
+            i += 1
+            while i < n:
+                i += 1
+                if names[i-1] == 'ENDMAP':
+                    break
+            maps.append((header, names[header], 'udmf', i - header - 1))
+            continue
+        for tail, format in ((_maptail, 'doom'), (_glmaptail, 'gl')):
+            if inwclist(names[i+1], tail):
+                header = i
+                i += 1
+                while i < n and inwclist(names[i], tail):
+                    if names[i] == 'BEHAVIOR':
+                        format = 'hexen'
+                    i += 1
+                maps.append((header, names[header], format, i - header - 1))
+                break
+        else:
+            i += 1
+    return maps
+
+def _lump_hashes(filename, entries):
+    """Hash the data of every entry, reading the file in order."""
+    hashes = [None] * len(entries)
+    f = open(filename, 'rb')
+    try:
+        for i in sorted(range(len(entries)), key=lambda i: entries[i].ptr):
+            f.seek(entries[i].ptr)
+            hashes[i] = sha1(f.read(entries[i].size)).hexdigest()
+    finally:
+        f.close()
+    return hashes
+
+
+class Catalog:
+    """An index of WAD files in an SQLite database.
+
+    Scanning a file stores its directory (lump names, sizes and
+    hashes) and the maps found in it. Queries go to the database only.
+    Use ':memory:' as the database for a throwaway catalog."""
+
+    def __init__(self, database=":memory:"):
+        self.db = sqlite3.connect(database)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(_schema)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def _remove(self, id):
+        self.db.execute("DELETE FROM lumps WHERE wad = ?", (id,))
+        self.db.execute("DELETE FROM maps WHERE wad = ?", (id,))
+        self.db.execute("DELETE FROM wads WHERE id = ?", (id,))
+
+    def add(self, filename, hashes=True):
+        """Catalog a WAD file unless it is unchanged since it was last
+        cataloged. Returns True if the file was (re)read. Files that
+        are not valid WADs are remembered too, so that they are not
+        read again until they change."""
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        row = self.db.execute("SELECT id, size, mtime, hashed FROM wads "
+            "WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            id, size, mtime, hashed = row
+            if size == st.st_size and mtime == st.st_mtime and \
+               (hashed or not hashes):
+                return False
+            self._remove(id)
+        try:
+            header, entries = read_directory(path)
+        except IOError:
+            header, entries = None, []
+        names = [e.name for e in entries]
+        digests = [None] * len(entries)
+        if hashes and entries:
+            digests = _lump_hashes(path, entries)
+        cur = self.db.execute("INSERT INTO wads (path, size, mtime, type, "
+            "hashed) VALUES (?, ?, ?, ?, ?)", (path, st.st_size, st.st_mtime,
+            header and header.type, int(bool(hashes))))
+        id = cur.lastrowid
+        self.db.executemany("INSERT INTO lumps VALUES (?, ?, ?, ?, ?)",
+            [(id, i, e.name, e.size, digests[i]) for i, e in enumerate(entries)])
+        self.db.executemany("INSERT INTO maps VALUES (?, ?, ?, ?)",
+            [(id,) + m[:3] for m in find_maps(names)])
+        self.db.commit()
+        return True
+
+    def remove(self, filename):
+        """Drop a file from the catalog."""
+        row = self.db.execute("SELECT id FROM wads WHERE path = ?",
+            (os.path.abspath(filename),)).fetchone()
+        if row is not None:
+            self._remove(row[0])
+            self.db.commit()
+
+    def prune(self):
+        """Drop the files that no longer exist from the catalog and
+        return their paths."""
+        gone = [(id, path) for id, path in
+            self.db.execute("SELECT id, path FROM wads") if not os.path.exists(path)]
+        for id, path in gone:
+            self._remove(id)
+        self.db.commit()
+        return [path for id, path in gone]
+
+    def scan(self, paths, hashes=True, pattern="*.[wW][aA][dD]"):
+        """Catalog files and, recursively, the files matching pattern
+        in directories. Returns the list of files that were read;
+        unchanged files are skipped."""
+        if isinstance(paths, str):
+            paths = [paths]
+        read = []
+        for path in paths:
+            if os.path.isdir(path):
+                files = []
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    files += [os.path.join(dirpath, f)
+                              for f in sorted(filenames) if wccmp(f, pattern)]
+            else:
+                files = [path]
+            for filename in files:
+                if self.add(filename, hashes):
+                    read.append(filename)
+        return read
+
+    def wads(self, type=None):
+        """Return the paths of all cataloged WADs, optionally only
+        those of the given type (IWAD or PWAD)."""
+        if type is None:
+            q = self.db.execute("SELECT path FROM wads WHERE type IS NOT NULL "
+                "ORDER BY path")
+        else:
+            q = self.db.execute("SELECT path FROM wads WHERE type = ? "
+                "ORDER BY path", (type,))
+        return [row[0] for row in q]
+
+    def lumps(self, filename):
+        """Return the directory of a cataloged WAD as a list of
+        (name, size, hash) tuples."""
+        return [tuple(row) for row in self.db.execute(
+            "SELECT lumps.name, lumps.size, lumps.hash FROM lumps "
+            "JOIN wads ON wads.id = lumps.wad WHERE wads.path = ? "
+            "ORDER BY lumps.position", (os.path.abspath(filename),))]
+
+    def maps(self, filename):
+        """Return the names of the maps in a cataloged WAD."""
+        return [row[0] for row in self.db.execute(
+            "SELECT maps.name FROM maps JOIN wads ON wads.id = maps.wad "
+            "WHERE wads.path = ? ORDER BY maps.position",
+            (os.path.abspath(filename),))]
+
+    def wads_with_map(self, name):
+        """Return the paths of the WADs containing a map. Wildcards
+        are supported."""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT wads.path FROM maps JOIN wads ON wads.id = maps.wad "
+            "WHERE maps.name GLOB ? AND maps.format != 'gl' ORDER BY wads.path",
+            (name.upper(),))]
+
+    def wads_with_lump(self, name):
+        """Return the paths of the WADs containing a lump. Wildcards
+        are supported."""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT wads.path FROM lumps JOIN wads ON wads.id = lumps.wad "
+            "WHERE lumps.name GLOB ? ORDER BY wads.path", (name.upper(),))]
+
+    def wads_replacing(self, name, base=None):
+        """Return the paths of the PWADs that replace a lump. If base
+        (the path of a cataloged IWAD) is given, PWADs whose copy of
+        the lump is identical to the one in base are left out; this
+        needs the lump hashes."""
+        q = ("SELECT DISTINCT wads.path FROM lumps JOIN wads ON wads.id = lumps.wad "
+             "WHERE lumps.name = ? AND wads.type = 'PWAD'")
+        args = [name.upper()]
+        if base is not None:
+            q += (" AND (lumps.hash IS NULL OR lumps.hash NOT IN "
+                  "(SELECT l.hash FROM lumps l JOIN wads w ON w.id = l.wad "
+                  "WHERE w.path = ? AND l.name = ? AND l.hash IS NOT NULL))")
+            args += [os.path.abspath(base), name.upper()]
+        return [row[0] for row in self.db.execute(q + " ORDER BY wads.path", args)]
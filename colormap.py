@@ -1,64 +1,214 @@
 import omg.palette
 import omg.lump
+from omg.palette import numpy
+
+class ColormapTable:
+    """A view of one 256-entry table in the data of a Colormap. Reading
+    and writing entries (or slices of entries) goes straight to the
+    colormap's bytearray."""
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def _span(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(256)
+            return slice(self.offset+start, self.offset+stop, step)
+        if index < 0:
+            index += 256
+        if not 0 <= index < 256:
+            raise IndexError("colormap table index out of range")
+        return self.offset + index
+
+    def __getitem__(self, index):
+        item = self.data[self._span(index)]
+        if isinstance(item, bytearray):
+            return list(item)
+        return item
+
+    def __setitem__(self, index, value):
+        span = self._span(index)
+        if isinstance(span, slice) and isinstance(value, str):
+            value = bytearray(value)
+        self.data[span] = value
+
+    def __len__(self):
+        return 256
+
+    def __iter__(self):
+        return iter(self.data[self.offset:self.offset+256])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def tostring(self):
+        """Returns the table as a 256-byte string."""
+        return str(self.data[self.offset:self.offset+256])
+
+
+class ColormapTables:
+    """The list of the 34 ColormapTable views of a Colormap. Assigning
+    a sequence of 256 indices to an item overwrites that table."""
+
+    def __init__(self, data):
+        self.data = data
+        self._tables = [ColormapTable(data, n*256) for n in range(34)]
+
+    def __getitem__(self, n):
+        return self._tables[n]
+
+    def __setitem__(self, n, table):
+        if len(table) != 256:
+            raise ValueError("colormap tables hold 256 entries")
+        if isinstance(table, ColormapTable):
+            table = table.tostring()
+        self._tables[n][:] = table
+
+    def __len__(self):
+        return 34
+
+    def __iter__(self):
+        return iter(self._tables)
+
 
 class Colormap:
     """An editor for Doom's COLORMAP lump. The colormap holds 34 tables
     of indices to the game's palette. The first 32 tables hold data
     for different brightness levels, the 33rd holds the indices used
-    by the invulnerability powerup, and the 34th is unused."""
+    by the invulnerability powerup, and the 34th is unused.
+
+    All tables are stored in a single 8704-byte bytearray, .data;
+    .tables is a list-like object of views of 256-byte rows in it."""
 
     def __init__(self, from_lump=None):
         """Create new, optionally from an existing lump."""
-        self.tables = [[0 for x in range(256)] for y in range(34)]
+        self.data = bytearray(34*256)
+        self.tables = ColormapTables(self.data)
         if from_lump:
             self.from_lump(from_lump)
 
-    def build_fade(self, palette=None, fade=(0,0,0)):
-        """Build fade tables. The default fade color is black;
-        this may be overriden. Light color is not yet supported."""
+    def build_fade(self, palette=None, fade=(0,0,0), light=(255,255,255),
+        exact=False):
+        """Build fade tables. The default fade color is black and the
+        default light color is white; these may be overriden. Colors
+        are matched with Palette.match, or with the exact (and faster)
+        Palette.match_many if 'exact' is set; a few entries may differ
+        between the two."""
         palette = palette or omg.palette.default
-        x, y, z = fade
-        for n in range(32):
-            e = 31-n
-            for c in range(256):
-                r, g, b = palette.colors[c]
-                r = (r*n + x*e) // 32
-                g = (g*n + y*e) // 32
-                b = (b*n + z*e) // 32
-                self.tables[e][c] = palette.match((r,g,b))
-
-    def build_invuln(self, palette=None, start=(0,0,0), end=(255,255,255)):
-        """Build range used by the invulnerability powerup."""
+        self.data[:32*256] = fade_tables(palette, [fade], [light], exact)[0]
+
+    def build_invuln(self, palette=None, start=(0,0,0), end=(255,255,255),
+        exact=False):
+        """Build range used by the invulnerability powerup. Colors are
+        matched as by build_fade."""
         palette = palette or omg.palette.default
         ar, ag, ab = start
         br, bg, bb = end
+        colors = []
         for i in range(256):
             bright = sum(palette.colors[i]) // 3
             r = (ar*bright + br*(256-bright)) // 256
             g = (ag*bright + bg*(256-bright)) // 256
             b = (ab*bright + bb*(256-bright)) // 256
-            self.tables[32][i] = palette.match((r,g,b))
+            colors.append((r,g,b))
+        self.tables[32] = _match(palette, colors, exact)
 
     def from_lump(self, lump):
         """Load from a COLORMAP lump."""
         assert len(lump.data) == 34*256
-        for n in range(34):
-            self.tables[n] = [ord(lump.data[i]) for i in range(n*256,(n+1)*256)]
+        self.data[:] = lump.data
 
     def to_lump(self):
         """Pack to a COLORMAP lump."""
-        
-        output = ""
-        for t in self.tables:
-            for c in t:
-                output += chr(c)
-                
-        return omg.lump.Lump(output)
-        
-        # packed = [''.join([chr(c) for c in t]) for t in self.tables]
-        # return omg.lump.Lump(''.join(packed))
-        
+        return omg.lump.Lump(str(self.data))
+
+    def as_array(self):
+        """Returns a (34, 256) NumPy uint8 array viewing the tables
+        (requires NumPy). Changes to the array affect the colormap."""
+        return numpy.frombuffer(self.data, numpy.uint8).reshape(34, 256)
+
+    def apply(self, raw, table=0):
+        """Map every pixel of a raw (8-bpp) image string through one
+        of the tables, e.g. to render a graphic at a light level.
+        Returns the converted string."""
+        return raw.translate(self.tables[table].tostring())
+
     def set_position(self,table,index,pal_index):
         """Sets a specified position in the colormap to the specified
         index in the playpal"""
-        self.tables[table][index] = pal_index
\ No newline at end of file
+        self.tables[table][index] = pal_index
+
+def _match(palette, colors, exact):
+    """Palette indices of colors (a sequence of (r,g,b) triples or a
+    NumPy array of them) as a string, found with match_many if exact
+    is set or else one color at a time with match."""
+    if exact:
+        indices = palette.match_many(colors)
+        if numpy is not None and isinstance(indices, numpy.ndarray):
+            indices = indices.tostring()
+        return indices
+    if numpy is not None and isinstance(colors, numpy.ndarray):
+        colors = map(tuple, colors.reshape(-1, 3).tolist())
+    match = palette.match
+    return "".join([chr(match(color)) for color in colors])
+
+def fade_tables(palette=None, fades=((0,0,0),), lights=((255,255,255),),
+    exact=False):
+    """Compute the 32 fade tables for every combination of a fade color
+    in 'fades' and a light color in 'lights'. Palette colors are first
+    scaled by the light color, then faded towards the fade color.
+    Returns a list of 8192-byte strings (tables 0-31 concatenated),
+    ordered [(fade0, light0), (fade0, light1), ..., (fade1, light0), ...].
+
+    All colors are computed at once. They are matched with
+    Palette.match, or with a single Palette.match_many call if 'exact'
+    is set (see Colormap.build_fade)."""
+    palette = palette or omg.palette.default
+    count = len(fades) * len(lights)
+    if numpy is not None:
+        base = numpy.array(palette.colors, numpy.int32)
+        lights = numpy.array(lights, numpy.int32).reshape(-1, 1, 3)
+        fades = numpy.array(fades, numpy.int32).reshape(-1, 1, 1, 1, 3)
+        lit = (base[None,:,:] * lights) // 255
+        # Table e uses n = 31-e parts of the color and e of the fade
+        e = numpy.arange(32).reshape(1, 1, 32, 1, 1)
+        colors = (lit[None,:,None,:,:] * (31 - e) + fades * e) // 32
+        indices = _match(palette, colors, exact)
+        return [indices[i*8192:(i+1)*8192] for i in range(count)]
+    colors = []
+    for x, y, z in fades:
+        for lr, lg, lb in lights:
+            lit = [(r*lr // 255, g*lg // 255, b*lb // 255)
+                for r, g, b in palette.colors]
+            for e in range(32):
+                n = 31-e
+                for r, g, b in lit:
+                    colors.append(((r*n + x*e) // 32,
+                                   (g*n + y*e) // 32,
+                                   (b*n + z*e) // 32))
+    indices = _match(palette, colors, exact)
+    return [indices[i*8192:(i+1)*8192] for i in range(count)]
+
+def build_colormaps(palette=None, fades=((0,0,0),), lights=((255,255,255),),
+    invuln=True, exact=False):
+    """Build a Colormap for every combination of a fade color in 'fades'
+    and a light color in 'lights', in the order used by fade_tables.
+    The invulnerability table is built too unless 'invuln' is False.
+    Colors are matched as by Colormap.build_fade."""
+    palette = palette or omg.palette.default
+    maps = []
+    inv = None
+    if invuln:
+        inv = Colormap()
+        inv.build_invuln(palette, exact=exact)
+    for tables in fade_tables(palette, fades, lights, exact):
+        c = Colormap()
+        c.data[:32*256] = tables
+        if inv:
+            c.tables[32] = inv.tables[32]
+        maps.append(c)
+    return maps
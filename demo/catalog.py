@@ -0,0 +1,48 @@
+#!/usr/bin/python
+#
+# Index a collection of WADs and query the index
+#
+import sys
+import os
+
+# --- Add OMG module to Python path ---
+real_path  = os.path.realpath(__file__)
+currentdir = os.path.dirname(real_path)
+parentdir  = os.path.dirname(currentdir)
+moduledir  = os.path.dirname(parentdir)
+sys.path.insert(0, moduledir) 
+from omg.catalog import Catalog
+
+# -------------------------------------------------------------------------------------------------
+# main ()
+# -------------------------------------------------------------------------------------------------
+if len(sys.argv) < 3:
+    print('Omgifol script: index WAD files and query the index')
+    print('Only the directories of new or changed WADs are read on each scan.\n')
+    print('Usage: catalog.py index.db scan dir_or_wad ...')
+    print('       catalog.py index.db map MAP07')
+    print('       catalog.py index.db lump NAME')
+    print('       catalog.py index.db replaces NAME [iwad]')
+    sys.exit(1)
+
+catalog = Catalog(sys.argv[1])
+command, args = sys.argv[2], sys.argv[3:]
+if command == 'scan':
+    for filename in catalog.scan(args):
+        print('Indexed "{0}"'.format(filename))
+    for filename in catalog.prune():
+        print('Removed "{0}"'.format(filename))
+elif command == 'map':
+    for filename in catalog.wads_with_map(args[0]):
+        print(filename)
+elif command == 'lump':
+    for filename in catalog.wads_with_lump(args[0]):
+        print(filename)
+elif command == 'replaces':
+    for filename in catalog.wads_replacing(*args[:2]):
+        print(filename)
+else:
+    print('Unknown command "{0}"'.format(command))
+    sys.exit(1)
+catalog.close()
+sys.exit(0)
@@ -3,15 +3,18 @@ import omg, sys
 if (len(sys.argv) < 3):
     print "\n    Omgifol script: merge WADs\n"
     print "    Usage:"
-    print "    merge.py input1.wad input2.wad ... [-o output.wad]\n"
+    print "    merge.py input1.wad input2.wad ... [-d] [-o output.wad]\n"
     print "    Default output is merged.wad"
+    print "    -d stores identical lumps only once"
 else:
-    w = omg.WAD()
+    inputs = []
     for a in sys.argv[1:]:
         if a == "-o":
             break
+        if a == "-d":
+            continue
         print "Adding %s..." % a
-        w += omg.WAD(a)
+        inputs.append(a)
     outpath = "merged.wad"
     if "-o" in sys.argv: outpath = sys.argv[-1]
-    w.to_file(outpath)
+    omg.merge_files(inputs, outpath, "-d" in sys.argv)
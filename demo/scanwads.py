@@ -0,0 +1,42 @@
+#!/usr/bin/python
+#
+# Map statistics for every WAD in a directory tree, as JSON Lines
+#
+import sys
+import os
+import getopt
+
+# --- Add OMG module to Python path ---
+real_path  = os.path.realpath(__file__)
+currentdir = os.path.dirname(real_path)
+parentdir  = os.path.dirname(currentdir)
+moduledir  = os.path.dirname(parentdir)
+sys.path.insert(0, moduledir) 
+from omg.scanner import scan, write_jsonl
+
+# -------------------------------------------------------------------------------------------------
+# main ()
+# -------------------------------------------------------------------------------------------------
+if len(sys.argv) < 2:
+    print('Omgifol script: scan directories of WADs')
+    print('Writes one JSON line per WAD with the number of things, linedefs, sectors,')
+    print('the bounding box and the node format of each map.\n')
+    print('Usage: scanwads.py [options] dir_or_wad ...\n')
+    print('  -o file     Output file. Defaults to standard output')
+    print('  -j jobs     Number of WADs read in parallel. Defaults to the number of CPUs')
+    sys.exit(1)
+
+opts, args = getopt.getopt(sys.argv[1:], 'o:j:')
+out = sys.stdout
+workers = None
+for o, a in opts:
+    if   o == '-o': out = open(a, 'w')
+    elif o == '-j': workers = int(a)
+    else:
+        assert False, "Unhandled option"
+
+n = write_jsonl(scan(args, workers), out)
+if out is not sys.stdout:
+    out.close()
+    print('Scanned {0} WADs'.format(n))
+sys.exit(0)
@@ -0,0 +1,689 @@
+# Import the Python Imaging Library if it is available. As in lump.py,
+# PIL being absent only affects the functions that actually draw.
+try:
+    from PIL import Image, ImageDraw
+except:
+    pass
+
+import math
+import os
+from omg.util import *
+from omg.palette import Palette, numpy
+from omg.lump import Lump, Flat
+from omg.wad import NameGroup
+from omg.mapedit import MapEditor
+
+BORDER_PERCENT = 8
+
+MAP_LINEDEFS = 100
+MAP_SECTORS  = 200
+MAP_NODES    = 300
+MAP_VERTEXES = 400
+MAP_FLATS    = 500
+
+#----------------------------------------------------------------------
+#
+# Map to screen transform
+#
+
+class LinearTransform:
+    """Maps map coordinates to pixel coordinates so that the box
+    (left, right, bottom, top) fits an image of px_size x py_size
+    pixels with a border (in percent) around it."""
+
+    def __init__(self, left, right, bottom, top, px_size, py_size, border):
+        self.left    = left
+        self.right   = right
+        self.bottom  = bottom
+        self.top     = top
+        self.x_size  = right - left
+        self.y_size  = top - bottom
+        # --- Shift map in x or y direction ---
+        self.pan_x  = 0
+        self.pan_y  = 0
+
+        # --- Calculate scale in [pixels] / [map_unit] ---
+        self.px_size = px_size
+        self.py_size = py_size
+        self.border  = border
+        self.border_x = px_size * border / 100
+        self.border_y = py_size * border / 100
+        self.pxsize_nob = px_size - 2*self.border_x
+        self.pysize_nob = py_size - 2*self.border_y
+        self.x_scale = self.pxsize_nob / float(self.x_size or 1)
+        self.y_scale = self.pysize_nob / float(self.y_size or 1)
+        if self.x_scale < self.y_scale:
+            self.scale   = self.x_scale
+            self.xoffset = self.border_x
+            self.yoffset = (py_size - int(self.y_size*self.scale)) / 2
+        else:
+            self.scale   = self.y_scale
+            self.xoffset = (px_size - int(self.x_size*self.scale)) / 2
+            self.yoffset = self.border_y
+
+    def MapToScreen(self, map_x, map_y):
+        screen_x = self.scale * (+map_x - self.left) + self.xoffset
+        screen_y = self.scale * (-map_y + self.top)  + self.yoffset
+
+        return (int(screen_x), int(screen_y))
+
+    def ScreenToMap(self, screen_x, screen_y):
+        map_x = +(screen_x - self.xoffset + self.scale * self.left) / self.scale
+        map_y = -(screen_y - self.yoffset - self.scale * self.top) / self.scale
+
+        return (int(map_x), int(map_y))
+
+    def map_points(self, xs, ys):
+        """Transform the sequences of map coordinates xs and ys in one
+        go. Returns a list of (x, y) pixel tuples, identical to calling
+        MapToScreen on every pair."""
+        s = self.scale
+        if numpy is not None and len(xs) > 64:
+            sx = (numpy.asarray(xs, float) - self.left) * s + self.xoffset
+            sy = (self.top - numpy.asarray(ys, float)) * s + self.yoffset
+            return zip(sx.astype(int).tolist(), sy.astype(int).tolist())
+        left, top = self.left, self.top
+        xo, yo = self.xoffset, self.yoffset
+        return [(int(s*(x - left) + xo), int(s*(top - y) + yo))
+                for x, y in zip(xs, ys)]
+
+def map_bounds(edit):
+    """Return (left, right, bottom, top) of the vertexes of a map."""
+    xs = [v.x for v in edit.vertexes]
+    ys = [v.y for v in edit.vertexes]
+    return min(xs), max(xs), min(ys), max(ys)
+
+def fit_transform(edit, px_size, py_size, border=BORDER_PERCENT):
+    """Return a LinearTransform fitting the whole map on an image."""
+    left, right, bottom, top = map_bounds(edit)
+    return LinearTransform(left, right, bottom, top, px_size, py_size, border)
+
+#----------------------------------------------------------------------
+#
+# Colour schemes
+#
+
+# See https://github.com/chocolate-doom/chocolate-doom/blob/sdl2-branch/src/doom/am_map.c
+class ColorScheme:
+    def __init__(self, back, wall, tswall, awall, fdwall, cdwall, thing):
+        self.BG      = back
+        self.WALL    = wall   # One sided linedef
+        self.TS_WALL = tswall # Two sided linedef
+        self.A_WALL  = awall  # Action wall
+        self.FD_WALL = fdwall # Two sided, floor level change
+        self.CD_WALL = cdwall # Two sided, ceiling level change and same floor level
+        self.THING   = thing  # Thing color
+
+CDoomWorld = ColorScheme(
+    (255, 255, 255),
+    (0, 0, 0),
+    (144, 144, 144),
+    (0, 255, 0),
+    (0, 0, 255),
+    (220, 130, 50),
+    (0, 255, 0)
+)
+
+CClassic = ColorScheme(
+    (0, 0, 0),       # BACK black
+    (255, 0, 0),     # WALL red
+    (150, 150, 150), # TS_WALL grey
+    (255, 255, 255), # A_WALL white
+    (139, 92, 55),   # FD_WALL brown
+    (255, 255, 0),   # CD_WALL yellow
+    (220, 130, 50),  # THING green
+)
+
+sector_colours = [
+    (255, 0, 0),
+    (0, 255, 0),
+    (0, 0, 255),
+]
+num_sector_colours = len(sector_colours)
+
+#----------------------------------------------------------------------
+#
+# Drawing utility functions
+#
+
+def draw_line(draw, p1x, p1y, p2x, p2y, color):
+    draw.line((p1x, p1y, p2x, p2y), fill = color)
+
+def draw_thick_line(draw, p1x, p1y, p2x, p2y, color):
+    draw.line((p1x, p1y, p2x, p2y), fill = color, width = 3)
+
+def draw_axis(draw, LT, color):
+    (pxzero, pyzero) = LT.MapToScreen(0, 0)
+    draw.line((0, pyzero, LT.px_size, pyzero), fill = color)
+    draw.line((pxzero, 0, pxzero, LT.py_size), fill = color)
+
+#
+# Draw the grid every 128 map units with origin at (0, 0)
+# I think the blockmap is similar to this grid.
+# Vanilla comment: "Draws flat (floor/ceiling tile) aligned grid lines."
+# See https://github.com/chocolate-doom/chocolate-doom/blob/sdl2-branch/src/doom/am_map.c#L1100
+#
+def draw_grid(draw, LT, color):
+    # --- Draw vertical gridlines ---
+    for x in range(LT.left, LT.right, 128):
+        (A_px, A_py) = LT.MapToScreen(x, LT.bottom)
+        (B_px, B_py) = LT.MapToScreen(x, LT.top)
+        draw.line((A_px, A_py, B_px, B_py), fill = color)
+
+    # --- Draw horizontal gridlines ---
+    for y in range(LT.bottom, LT.top, 128):
+        (A_px, A_py) = LT.MapToScreen(LT.left, y)
+        (B_px, B_py) = LT.MapToScreen(LT.right, y)
+        draw.line((A_px, A_py, B_px, B_py), fill = color)
+
+#
+# A level must be contained within a 16384-unit radius as measured from its center point.
+# Point A is the top-left corner.
+#
+# A---------B---------C   A-C gap 327 map units
+# |         |         |   A-B gap 163 map units
+# |         E         |   A-D gap is 163/2 map units
+# D                   F   B-E gap is 163/4 map units
+#
+def draw_scale(draw, LT, color):
+    (A_px, A_py) = LT.MapToScreen(LT.right-256, LT.top)
+    (B_px, B_py) = LT.MapToScreen(LT.right-128, LT.top)
+    (C_px, C_py) = LT.MapToScreen(LT.right, LT.top)
+    (D_px, D_py) = LT.MapToScreen(LT.right-256, LT.top-128/2)
+    (E_px, E_py) = LT.MapToScreen(LT.right-128, LT.top-128/4)
+    (F_px, F_py) = LT.MapToScreen(LT.right, LT.top-128/2)
+
+    draw.line((A_px, A_py, C_px, C_py), fill = color) # A -> C
+    draw.line((A_px, A_py, D_px, D_py), fill = color) # A -> D
+    draw.line((B_px, B_py, E_px, E_py), fill = color) # B -> E
+    draw.line((C_px, C_py, F_px, F_py), fill = color) # C -> F
+
+#
+# Draw a triangle with same size as in Vanilla Doom
+# https://github.com/chocolate-doom/chocolate-doom/blob/sdl2-branch/src/doom/am_map.c#L186
+# https://github.com/chocolate-doom/chocolate-doom/blob/sdl2-branch/src/doom/am_map.c#L1314
+#
+thintriangle_guy = [(-8, -11.2), (16, 0.0), (-8, 11.2)]
+
+def draw_thing(draw, LT, map_x, map_y, angle, color):
+    angle_rad = math.radians(angle)
+    c = math.cos(angle_rad)
+    s = math.sin(angle_rad)
+    # --- Rotate and translate to thing coordinates on map ---
+    xs = [x*c - y*s + map_x for x, y in thintriangle_guy]
+    ys = [x*s + y*c + map_y for x, y in thintriangle_guy]
+    points = LT.map_points(xs, ys)
+    draw.line(points + points[:1], fill = color)
+
+#----------------------------------------------------------------------
+#
+# Map drawing
+#
+
+def _line_colors(edit, cscheme):
+    """Vanilla Doom automap colours for every linedef, following
+    AM_drawWalls() with the cheating variable set. In vanilla secret
+    walls have the same colours as walls.
+    https://github.com/chocolate-doom/chocolate-doom/blob/sdl2-branch/src/doom/am_map.c#L1146"""
+    sidedefs = edit.sidedefs
+    sectors = edit.sectors
+    colors = []
+    for line in edit.linedefs:
+        if line.back < 0:
+            colors.append(cscheme.WALL)
+            continue
+        front = sectors[sidedefs[line.front].sector]
+        back  = sectors[sidedefs[line.back].sector]
+        if back.z_floor != front.z_floor:
+            colors.append(cscheme.FD_WALL)
+        elif back.z_ceil != front.z_ceil:
+            colors.append(cscheme.CD_WALL)
+        else:
+            colors.append(cscheme.TS_WALL)
+    return colors
+
+def _draw_vertexes(draw, edit, points):
+    """Plot linedef vertexes in one colour and vertexes not belonging
+    to a linedef (added by the node builder) in another."""
+    SIZE = 2
+    linedefs_vertexes = set()
+    for line in edit.linedefs:
+        linedefs_vertexes.add(line.vx_a)
+        linedefs_vertexes.add(line.vx_b)
+    for v_index, (p1x, p1y) in enumerate(points):
+        color = (0, 255, 255)
+        if v_index not in linedefs_vertexes: color = (255, 255, 0)
+        draw.rectangle((p1x-SIZE, p1y-SIZE, p1x+SIZE, p1y+SIZE), fill = color)
+
+def _sector_fills(edit, points):
+    """Return (sector, outer, holes) for every sector polygon, in pixel
+    coordinates and sorted largest first so that painting them in
+    order leaves every sector on top of the sectors around it."""
+    fills = []
+    for sector, polygons in enumerate(edit.sector_polygons()):
+        for outer, holes in polygons:
+            outer = [points[i] for i in outer]
+            area = 0
+            (lx, ly) = outer[-1]
+            for (x, y) in outer:
+                area += lx*y - x*ly
+                (lx, ly) = (x, y)
+            fills.append((abs(area), sector, outer,
+                [[points[i] for i in hole] for hole in holes]))
+    fills.sort(key=lambda f: -f[0])
+    return [f[1:] for f in fills]
+
+def _flat_image(flat, palette=None):
+    """Convert a flat (a Flat lump or its raw data) to an RGB Image."""
+    if not isinstance(flat, Lump):
+        flat = Flat(flat)
+    if palette is None:
+        palette = flat.palette
+    size = flat.dimensions
+    data = flat.data[:size[0]*size[1]]
+    # Pillow renamed fromstring() to frombytes()
+    if hasattr(Image, 'frombytes'):
+        im = Image.frombytes('P', size, data)
+    else:
+        im = Image.fromstring('P', size, data)
+    im.putpalette(palette.bytes)
+    return im.convert('RGB')
+
+def _tile(im, size):
+    """Repeat im over an image of the given size, doubling a strip of
+    copies at a time rather than pasting every copy."""
+    strip = im
+    while strip.size[0] < size[0]:
+        wide = Image.new(strip.mode, (strip.size[0]*2, strip.size[1]))
+        wide.paste(strip, (0, 0))
+        wide.paste(strip, (strip.size[0], 0))
+        strip = wide
+    while strip.size[1] < size[1]:
+        tall = Image.new(strip.mode, (strip.size[0], strip.size[1]*2))
+        tall.paste(strip, (0, 0))
+        tall.paste(strip, (0, strip.size[1]))
+        strip = tall
+    return strip.crop((0, 0) + tuple(size))
+
+def _paint_flats(im, edit, fills, LT, flats, palette, cscheme):
+    """Paint the floor flat of every sector, aligned to the map grid.
+    The sectors are first drawn into a label image, one grey level per
+    flat, which then serves as the mask for pasting each tiled flat.
+    Flats missing from `flats` are painted in the two sided wall
+    colour."""
+    names = [edit.sectors[sector].tx_floor.upper() for sector, o, h in fills]
+    unique = sorted(set(names))
+    (ox, oy) = LT.MapToScreen(0, 0)
+    # --- Label 0 is the background, so 255 flats fit in each pass ---
+    for base in range(0, len(unique), 255):
+        labels = dict((n, i+1) for i, n in enumerate(unique[base:base+255]))
+        label_im = Image.new('L', im.size, 0)
+        draw = ImageDraw.Draw(label_im)
+        for name, (sector, outer, holes) in zip(names, fills):
+            k = labels.get(name, 0)
+            draw.polygon(outer, fill = k, outline = k)
+            for hole in holes:
+                draw.polygon(hole, fill = 0, outline = 0)
+        del draw
+        for name, k in labels.items():
+            mask = label_im.point([255*(i == k) for i in range(256)])
+            box = mask.getbbox()
+            if box is None:
+                continue
+            size = (box[2]-box[0], box[3]-box[1])
+            if name not in flats:
+                im.paste(cscheme.TS_WALL, box, mask.crop(box))
+                continue
+            flat = _flat_image(flats[name], palette)
+            tw = max(1, int(round(flat.size[0] * LT.scale)))
+            th = max(1, int(round(flat.size[1] * LT.scale)))
+            flat = flat.resize((tw, th), Image.BILINEAR)
+            dx = (box[0] - ox) % tw
+            dy = (box[1] - oy) % th
+            tiled = _tile(flat, (size[0] + dx, size[1] + dy))
+            im.paste(tiled.crop((dx, dy, dx + size[0], dy + size[1])),
+                box, mask.crop(box))
+
+def drawmap(edit, map_type, px_size, py_size, cscheme, LT=None,
+    flats=None, palette=None):
+    """Draw the map in a MapEditor and return it as an RGB Image.
+    LT may be given to reuse a transform, by default the map is
+    fitted to the image.
+
+    MAP_FLATS needs `flats`, a dict mapping flat names to Flat lumps
+    or their raw data (such as wad.flats). The flats are drawn with
+    their own palette unless `palette` is given."""
+    if LT is None:
+        LT = fit_transform(edit, px_size, py_size)
+
+    # --- All vertexes go to screen coordinates in one pass ---
+    points = LT.map_points([v.x for v in edit.vertexes],
+                           [v.y for v in edit.vertexes])
+
+    # --- Create image ---
+    im = Image.new('RGB', (px_size, py_size), cscheme.BG)
+    draw = ImageDraw.Draw(im)
+
+    if map_type == MAP_LINEDEFS:
+        # --- Two sided lines first so that walls are drawn on top ---
+        colors = _line_colors(edit, cscheme)
+        order = sorted(range(len(edit.linedefs)),
+            key=lambda i: not edit.linedefs[i].two_sided)
+        for i in order:
+            line = edit.linedefs[i]
+            draw.line(points[line.vx_a] + points[line.vx_b],
+                fill = colors[i], width = 3)
+
+        # --- Draw things ---
+        for thing in edit.things:
+            draw_thing(draw, LT, thing.x, thing.y, thing.angle, cscheme.THING)
+
+    elif map_type == MAP_VERTEXES:
+        for line in sorted(edit.linedefs, key=lambda l: not l.two_sided):
+            draw.line(points[line.vx_a] + points[line.vx_b], fill = cscheme.WALL)
+        _draw_vertexes(draw, edit, points)
+
+    elif map_type in (MAP_SECTORS, MAP_FLATS):
+        # Approach A: paint each sector surface with a different colour. Colours will be picked
+        #             sequentially from a list.
+        # Approach B: paint the floor texture of each sector, aligned to the 64x64 grid.
+        fills = _sector_fills(edit, points)
+        if map_type == MAP_SECTORS:
+            for sector, outer, holes in fills:
+                colour = sector_colours[sector % num_sector_colours]
+                draw.polygon(outer, fill = colour, outline = colour)
+                for hole in holes:
+                    draw.polygon(hole, fill = cscheme.BG, outline = cscheme.BG)
+        else:
+            _paint_flats(im, edit, fills, LT, flats or {}, palette, cscheme)
+
+        # --- Outline the sectors ---
+        colors = _line_colors(edit, cscheme)
+        for i, line in enumerate(edit.linedefs):
+            draw.line(points[line.vx_a] + points[line.vx_b], fill = colors[i])
+
+    elif map_type == MAP_NODES:
+        # NOTE The implicit lines of the subsectors are the partition lines of the nodes.
+        # Segs are only defined on linedefs and have implicit edges, only the
+        # segs that do not follow their linedef exactly are drawn here.
+        # http://doom.wikia.com/wiki/Subsector
+        # http://doom.wikia.com/wiki/User_talk:Fraggle#Making_polygons
+        #
+        # --- Draw linedefs ---
+        for line in edit.linedefs:
+            draw.line(points[line.vx_a] + points[line.vx_b], fill = cscheme.WALL)
+
+        # --- Draw segs ---
+        for seg in edit.segs:
+            line = edit.linedefs[seg.line]
+            if seg.vx_a != line.vx_a or seg.vx_b != line.vx_b:
+                draw.line(points[seg.vx_a] + points[seg.vx_b], fill = cscheme.FD_WALL)
+
+        _draw_vertexes(draw, edit, points)
+
+    # --- Draw map scale ---
+    draw_scale(draw, LT, (256, 256, 256))
+
+    del draw
+    return im
+
+def drawmap_fit(wad, map_name, filename, format, map_type, px_size, py_size, cscheme):
+    """Draw a map of a WAD fitted to an image of the given size and
+    save it to filename."""
+    edit = MapEditor(wad.maps[map_name])
+    drawmap(edit, map_type, px_size, py_size, cscheme).save(filename, format)
+
+#----------------------------------------------------------------------
+#
+# Batch rendering
+#
+
+# Flats and palette for MAP_FLATS, set up in every worker process
+_flats = {}
+_palette = None
+
+def _init_worker(flats, palette):
+    global _flats, _palette
+    _flats = flats
+    _palette = palette and Palette(palette)
+
+def _render_job(job):
+    """Render one map in several styles. job is a (lumps, outputs)
+    tuple, where lumps is a list of (name, data) pairs of the map and
+    outputs a list of (filename, format, map_type, px_size, py_size,
+    cscheme) tuples. Returns the list of files written."""
+    lumps, outputs = job
+    group = NameGroup()
+    for name, data in lumps:
+        group[name] = Lump(data)
+    edit = MapEditor(group)
+    bounds = map_bounds(edit)
+    transforms = {}
+    written = []
+    for filename, format, map_type, px_size, py_size, cscheme in outputs:
+        size = (px_size, py_size)
+        if size not in transforms:
+            transforms[size] = LinearTransform(*(bounds + size + (BORDER_PERCENT,)))
+        im = drawmap(edit, map_type, px_size, py_size, cscheme,
+            transforms[size], _flats, _palette)
+        im.save(filename, format)
+        written.append(filename)
+    return written
+
+def render_many(jobs, workers=None, flats=None, palette=None):
+    """Render a sequence of jobs (see _render_job) using a pool of
+    worker processes, one map per job. flats maps flat names to raw
+    flat data and palette is a PLAYPAL string, both for MAP_FLATS.
+    Returns an iterator over the lists of files written, in the order
+    of the jobs."""
+    return parallel_map(_render_job, jobs, workers,
+        initializer=_init_worker, initargs=(flats or {}, palette))
+
+def render_maps(wad, styles, pattern="*", prefix="", format="PNG",
+    workers=None, flats=None):
+    """Render every map of wad matching pattern in every style, in
+    parallel. styles is a list of (suffix, map_type, px_size, py_size,
+    cscheme) tuples and each image is saved as prefix + map name +
+    suffix + extension. Returns the list of files written.
+
+    MAP_FLATS uses the flats of wad and its PLAYPAL, if any. For a
+    PWAD that relies on the flats of the IWAD, pass the IWAD's flats
+    group as `flats`."""
+    palette = None
+    if MAP_FLATS in [style[1] for style in styles]:
+        if flats is None:
+            flats = wad.flats
+        flats = dict((name, flats[name].data) for name in flats)
+        if "PLAYPAL" in wad.data:
+            palette = wad.data["PLAYPAL"].data[:768]
+    ext = "." + format.lower()
+    jobs = []
+    for name in wad.maps.find(pattern):
+        m = wad.maps[name]
+        lumps = [(k, m[k].data) for k in m]
+        outputs = [(prefix + name + suffix + ext, format, map_type,
+                    px_size, py_size, cscheme)
+                   for suffix, map_type, px_size, py_size, cscheme in styles]
+        jobs.append((lumps, outputs))
+    written = []
+    for files in render_many(jobs, workers, flats, palette):
+        written.extend(files)
+    return written
+
+#----------------------------------------------------------------------
+#
+# Tile pyramid
+#
+
+class SpatialGrid:
+    """Uniform grid of cells `cell` map units wide, for finding the
+    items whose bounding boxes overlap a box without testing them
+    all."""
+
+    def __init__(self, cell=512):
+        self.cell = cell
+        self.cells = {}
+
+    def _span(self, left, right, bottom, top):
+        c = self.cell
+        return (int(math.floor(left / float(c))), int(math.floor(right / float(c))),
+                int(math.floor(bottom / float(c))), int(math.floor(top / float(c))))
+
+    def insert(self, item, left, right, bottom, top):
+        x0, x1, y0, y1 = self._span(left, right, bottom, top)
+        for cx in xrange(x0, x1+1):
+            for cy in xrange(y0, y1+1):
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def query(self, left, right, bottom, top):
+        """Return the set of items in the cells overlapping the box."""
+        x0, x1, y0, y1 = self._span(left, right, bottom, top)
+        found = set()
+        for cx in xrange(x0, x1+1):
+            for cy in xrange(y0, y1+1):
+                found.update(self.cells.get((cx, cy), ()))
+        return found
+
+def _crosses(a, b, left, right, bottom, top):
+    """True if the segment from vertex a to vertex b meets the box."""
+    if max(a.x, b.x) < left or min(a.x, b.x) > right or \
+       max(a.y, b.y) < bottom or min(a.y, b.y) > top:
+        return False
+    # --- The box corners must not all lie on one side of the line ---
+    dx, dy = b.x - a.x, b.y - a.y
+    sides = [dx*(y - a.y) - dy*(x - a.x)
+             for x, y in ((left, bottom), (left, top), (right, bottom), (right, top))]
+    return min(sides) <= 0 <= max(sides)
+
+def tile_extent(edit, tile_size=256):
+    """Return (left, top, side, max_zoom) of the square covering the
+    map at zoom level 0. max_zoom is the first level with at least
+    one pixel per map unit."""
+    left, right, bottom, top = map_bounds(edit)
+    side = max(right - left, top - bottom, 1) * (1 + BORDER_PERCENT / 100.0)
+    cx = (left + right) / 2.0
+    cy = (bottom + top) / 2.0
+    max_zoom = max(0, int(math.ceil(math.log(side / tile_size, 2))))
+    return cx - side/2, cy + side/2, side, max_zoom
+
+def map_hash(group, *params):
+    """Hash the lumps of a map (a lump group or a list of (name, data)
+    pairs) together with the given rendering parameters."""
+    from hashlib import sha1
+    if not isinstance(group, list):
+        group = [(name, group[name].data) for name in group]
+    h = sha1(repr(params))
+    for name, data in sorted(group):
+        h.update(name + "\0" + str(len(data)) + "\0")
+        h.update(data)
+    return h.hexdigest()
+
+# Map, index and style for tile rendering, set up in every worker process
+_tiles = None
+
+def _init_tile_worker(lumps, extent, tile_size, cscheme):
+    global _tiles
+    group = NameGroup()
+    for name, data in lumps:
+        group[name] = Lump(data)
+    edit = MapEditor(group)
+    lines = SpatialGrid()
+    for i, line in enumerate(edit.linedefs):
+        a, b = edit.vertexes[line.vx_a], edit.vertexes[line.vx_b]
+        lines.insert(i, min(a.x, b.x), max(a.x, b.x), min(a.y, b.y), max(a.y, b.y))
+    things = SpatialGrid()
+    for i, thing in enumerate(edit.things):
+        things.insert(i, thing.x, thing.x, thing.y, thing.y)
+    _tiles = (edit, lines, things, _line_colors(edit, cscheme),
+              extent, tile_size, cscheme)
+
+def _render_tile(tile):
+    """Draw the tile (z, x, y, filename, format) and save it."""
+    edit, lines, things, colors, extent, tile_size, cscheme = _tiles
+    z, x, y, filename, format = tile
+    x0, y0, side = extent
+    span = side / 2**z
+    left = x0 + x*span
+    top = y0 - y*span
+    right, bottom = left + span, top - span
+    LT = LinearTransform(left, right, bottom, top, tile_size, tile_size, 0)
+
+    im = Image.new('RGB', (tile_size, tile_size), cscheme.BG)
+    draw = ImageDraw.Draw(im)
+
+    # --- Widen the box by what a line or thing may stick out of it ---
+    width = 1 if LT.scale < 0.5 else 3
+    pad = width / LT.scale
+    vertexes = edit.vertexes
+    selected = [i for i in lines.query(left - pad, right + pad, bottom - pad, top + pad)
+                if _crosses(vertexes[edit.linedefs[i].vx_a],
+                            vertexes[edit.linedefs[i].vx_b],
+                            left - pad, right + pad, bottom - pad, top + pad)]
+    selected.sort(key=lambda i: (not edit.linedefs[i].two_sided, i))
+    used = sorted(set([edit.linedefs[i].vx_a for i in selected] +
+                      [edit.linedefs[i].vx_b for i in selected]))
+    points = dict(zip(used, LT.map_points([vertexes[v].x for v in used],
+                                          [vertexes[v].y for v in used])))
+    for i in selected:
+        line = edit.linedefs[i]
+        draw.line(points[line.vx_a] + points[line.vx_b], fill = colors[i], width = width)
+
+    pad += 16
+    for i in sorted(things.query(left - pad, right + pad, bottom - pad, top + pad)):
+        thing = edit.things[i]
+        draw_thing(draw, LT, thing.x, thing.y, thing.angle, cscheme.THING)
+
+    del draw
+    im.save(filename, format)
+    return filename
+
+def render_tiles(wad, map_name, directory, max_zoom=None, tile_size=256,
+    cscheme=CClassic, format="PNG", workers=None):
+    """Render a map as a pyramid of square tiles for a zoomable viewer.
+    Level z has 2**z by 2**z tiles, saved as directory/z/x/y.png with
+    y counting down from the top. By default the deepest level is the
+    first with at least a pixel per map unit.
+
+    The tiles are drawn in parallel in the automap style of
+    MAP_LINEDEFS. A manifest, tiles.json, records the extent of the
+    pyramid and a hash of the map and style; tiles that exist and
+    match the hash are skipped when rendering again. Returns the list
+    of files written."""
+    import json
+    m = wad.maps[map_name]
+    lumps = [(name, m[name].data) for name in m]
+    edit = MapEditor(m)
+    x0, y0, side, zoom = tile_extent(edit, tile_size)
+    if max_zoom is None:
+        max_zoom = zoom
+    ext = "." + format.lower()
+    digest = map_hash(lumps, tile_size, format, sorted(vars(cscheme).items()))
+
+    manifest_path = os.path.join(directory, "tiles.json")
+    old = {}
+    if os.path.exists(manifest_path):
+        old = json.load(open(manifest_path))
+    reuse = old.get("hash") == digest
+
+    tiles = []
+    for z in range(max_zoom + 1):
+        for x in range(2**z):
+            column = os.path.join(directory, str(z), str(x))
+            if not os.path.isdir(column):
+                os.makedirs(column)
+            for y in range(2**z):
+                filename = os.path.join(column, str(y) + ext)
+                if reuse and os.path.exists(filename):
+                    continue
+                tiles.append((z, x, y, filename, format))
+
+    written = list(parallel_map(_render_tile, tiles, workers, 16,
+        _init_tile_worker, (lumps, (x0, y0, side), tile_size, cscheme)))
+
+    manifest = {"map": map_name, "hash": digest, "tile_size": tile_size,
+        "max_zoom": max(max_zoom, old.get("max_zoom", 0) if reuse else 0),
+        "format": format, "left": x0, "top": y0, "side": side}
+    f = open(manifest_path, "w")
+    json.dump(manifest, f, indent=1, sort_keys=True)
+    f.close()
+    return written
@@ -0,0 +1,127 @@
+"""
+Timing and I/O counters for loading and saving WADs.
+
+Instrumentation is off unless a Recorder is installed, and then costs
+one global lookup per hook. Use it as a context manager:
+
+    with recording() as rec:
+        w = WAD("doom2.wad")
+    print rec.summary()
+
+While it is installed the recorder collects:
+
+    timers      {phase: [calls, seconds]} for the phases "directory"
+                (reading the WAD directory), "classify" (sorting
+                entries into groups), "read" (reading lump data),
+                "construct" (creating Lump objects), "write" (saving
+                lumps) and "write_directory"
+    counters    {name: value} for "bytes_read", "bytes_written",
+                "reads", "writes" and "seeks"
+    loaded      {group name: number of lumps loaded}
+    saved       {group name: number of lumps saved}
+
+and an event (a dict) for each WAD loaded or saved and for each group
+within, which is passed to the callback, if any, as soon as it is
+complete. write_jsonl() writes the events and the summary as JSON Lines.
+"""
+
+import time
+
+# The installed Recorder, or None
+recorder = None
+
+timer = time.time
+
+class Recorder:
+    """Collects timers, counters and events; see the module
+    documentation. `callback` is called with each event."""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timers = {}
+        self.counters = dict.fromkeys(["bytes_read", "bytes_written",
+            "reads", "writes", "seeks"], 0)
+        self.loaded = {}
+        self.saved = {}
+        self.events = []
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def read(self, size):
+        """Count a seek and a read of size bytes."""
+        c = self.counters
+        c["seeks"] += 1
+        c["reads"] += 1
+        c["bytes_read"] += size
+
+    def write(self, size, seek=True):
+        """Count a write of size bytes, after a seek unless told not to."""
+        c = self.counters
+        c["seeks"] += seek
+        c["writes"] += 1
+        c["bytes_written"] += size
+
+    def time(self, phase, seconds, calls=1):
+        """Add to the time spent in a phase."""
+        t = self.timers.get(phase)
+        if t is None:
+            t = self.timers[phase] = [0, 0.0]
+        t[0] += calls
+        t[1] += seconds
+
+    def seconds(self, phase):
+        return self.timers.get(phase, (0, 0.0))[1]
+
+    def group(self, name, lumps, saved=False):
+        """Count lumps loaded into, or saved from, a group."""
+        if saved:
+            groups = self.saved
+        else:
+            groups = self.loaded
+        groups[name] = groups.get(name, 0) + lumps
+
+    def event(self, **fields):
+        """Record an event and pass it to the callback."""
+        self.events.append(fields)
+        if self.callback is not None:
+            self.callback(fields)
+
+    def summary(self):
+        """Return the timers, counters and lump counts as a dict."""
+        return {"timers": dict((k, list(v)) for k, v in self.timers.items()),
+                "counters": dict(self.counters),
+                "loaded": dict(self.loaded),
+                "saved": dict(self.saved)}
+
+    def write_jsonl(self, out):
+        """Write the events, then the summary (as an event named
+        "summary"), to a file object as JSON Lines."""
+        import json
+        for event in self.events:
+            out.write(json.dumps(event, sort_keys=True) + "\n")
+        summary = self.summary()
+        summary["event"] = "summary"
+        out.write(json.dumps(summary, sort_keys=True) + "\n")
+
+def install(rec):
+    """Install a Recorder (or None to turn instrumentation off) and
+    return the one installed before."""
+    global recorder
+    old, recorder = recorder, rec
+    return old
+
+class recording:
+    """Context manager that installs a Recorder for the duration of
+    the with block, and gives it as the target of the `as` clause."""
+
+    def __init__(self, callback=None, rec=None):
+        self.recorder = rec or Recorder(callback)
+
+    def __enter__(self):
+        self.previous = install(self.recorder)
+        return self.recorder
+
+    def __exit__(self, *exc_info):
+        install(self.previous)
+        return False
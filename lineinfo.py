@@ -443,88 +443,132 @@ trigcompat = \
   0, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2,
   2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2]
 
+# Boom generalized trigger fields. Each category is given as
+# (first number, end number, name, fields), where each field is
+# (bit mask, shift, options) and the option selected by the masked
+# bits is a term in the description. Empty terms are left out.
+_triggers = ("W1","WR","S1","SR","G1","GR","P1","PR")
+_speeds   = ("SLOW","NORMAL","FAST","TURBO")
+
+generalized = [
+  (0x2F80, 0x3000, "CRUSHER",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("MONSTER","")),
+     (0x00c0, 6, ("SILENT",""))]),
+  (0x3000, 0x3400, "STAIR",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("","MONSTER")),
+     (0x00c0, 6, ("4","8","16","24")),
+     (0x0100, 8, ("DOWN","UP")),
+     (0x0200, 9, ("", "IGNTXT"))]),
+  (0x3400, 0x3800, "PLATFORM",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("MONSTER","")),
+     (0x00c0, 6, ("1","3","5","10")),
+     (0x0300, 8, ("LNF","NNF","LNC","PERP"))]),
+  (0x3800, 0x3c00, "DOOR",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("OWC","OSO")),
+     (0x01c0, 6, ("ANY","RED","YELLOW","BLUE","RED","BLUE","YELLOW","ALL")),
+     (0x0200, 9, ("3KEYS","6KEYS"))]),
+  (0x3c00, 0x4000, "DOOR",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0060, 5, ("OWC","OSO","CWO","CSC")),
+     (0x0080, 7, ("MONSTER","")),
+     (0x0300, 8, ("1SECS","4SECS","9SECS","30SECS"))]),
+  (0x4000, 0x6000, "CEIL",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("TRIG","NUM")),
+     (0x0040, 6, ("DOWN","UP")),
+     (0x0380, 7, ("HNC","LNC","NNC","HNF","FLR","SUT","24","32")),
+     (0x0c00, 10, ("","CPYTEX+DELTYPE","CPYTEX","CHGTYPE")),
+     (0x1000, 12, ("CRUSH",""))]),
+  (0x6000, 0x8000, "FLOOR",
+    [(0x0007, 0, _triggers),
+     (0x0018, 3, _speeds),
+     (0x0020, 5, ("TRIG","NUM")),
+     (0x0040, 6, ("DOWN","UP")),
+     (0x0380, 7, ("HNF","LNF","NNF","LNC","CL","SLT","24","32")),
+     (0x0c00, 10, ("","CPYTEX+DELTYPE","CPYTEX","CHGTYPE")),
+     (0x1000, 12, ("CRUSH",""))])
+]
+
+# Lookup tables for all 65536 trigger numbers, built on first use
+_decode_table = None
+_compat_table = None
+
+def _build_decode_table():
+    global _decode_table
+    table = ["UNKNOWN"] * 8192 + [""] * (65536 - 8192)
+    for n, d in num2desc.items():
+        if 0 <= n < 8192:
+            table[n] = d
+    for first, end, name, fields in generalized:
+        for n in xrange(end - first):
+            d = [name]
+            for mask, shift, options in fields:
+                term = options[(n & mask) >> shift]
+                if term:
+                    d.append(term)
+            table[first + n] = " ".join(d)
+    _decode_table = table
+    return table
+
+def _build_compat_table():
+    global _compat_table
+    names = ["UNKNOWN", "DOOM19", "BOOM EXTENDED"]
+    table = [names[c] for c in trigcompat]
+    table += ["UNKNOWN"] * (8192 - len(table))
+    table += ["BOOM GENERALIZED"] * (32768 - 8192)
+    table += ["UNKNOWN"] * (65536 - 32768)
+    _compat_table = table
+    return table
+
+def _actions(seq):
+    """Accept either trigger numbers or linedefs."""
+    seq = list(seq)
+    if seq and hasattr(seq[0], "action"):
+        return [line.action for line in seq]
+    return seq
+
 def check_compat(num):
     """Check the compatibility for a trigger number"""
-    if 8192 <= num < 32768:
-        return "BOOM GENERALIZED"
+    if 0 <= num < 65536:
+        return (_compat_table or _build_compat_table())[num]
     try:
         return ["UNKNOWN", "DOOM19", "BOOM EXTENDED"][trigcompat[num]]
     except:
         return "UNKNOWN"
 
+def check_compat_many(actions):
+    """Check the compatibility for a sequence of trigger numbers (or
+    linedefs, e.g. MapEditor.linedefs). Returns a list of strings."""
+    table = _compat_table or _build_compat_table()
+    return [table[n] if 0 <= n < 65536 else check_compat(n)
+        for n in _actions(actions)]
+
 def decode(n):
     """Generate a description code for a number."""
-    d = []
     if n < 8192:
         if n in num2desc:
             return num2desc[n]
         return "UNKNOWN"
-    # Boom generalized
-    elif 0x2F80 <= n < 0x3000:
-        n -= 0x2F80
-        d += ["CRUSHER"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("MONSTER","")                            [(n&0x0020)>>5]]
-        d += [("SILENT","")                             [(n&0x00c0)>>6]]
-    elif 0x3000 <= n < 0x3400:
-        n -= 0x3000
-        d += ["STAIR"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("","MONSTER")                            [(n&0x0020)>>5]]
-        d += [("4","8","16","24")                       [(n&0x00c0)>>6]]
-        d += [("DOWN","UP")                             [(n&0x0100)>>8]]
-        d += [("", "IGNTXT")                            [(n&0x0200)>>9]]
-    elif 0x3400 <= n < 0x3800:
-        n -= 0x3400
-        d += ["PLATFORM"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("MONSTER","")                            [(n&0x0020)>>5]]
-        d += [("1","3","5","10")                        [(n&0x00c0)>>6]]
-        d += [("LNF","NNF","LNC","PERP")                [(n&0x0300)>>8]]
-    elif 0x3800 <= n < 0x3c00:
-        n -= 0x3800
-        d += ["DOOR"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("OWC","OSO")                             [(n&0x0020)>>5]]
-        d += [("ANY","RED","YELLOW","BLUE","RED",
-               "BLUE","YELLOW","ALL")                   [(n&0x01c0)>>6]]
-        d += [("3KEYS","6KEYS")                         [(n&0x0200)>>9]]
-    elif 0x3c00 <= n < 0x4000:
-        n -= 0x3c00
-        d += ["DOOR"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("OWC","OSO","CWO","CSC")                 [(n&0x0060)>>5]]
-        d += [("MONSTER","")                            [(n&0x0080)>>7]]
-        d += [("1SECS","4SECS","9SECS","30SECS")        [(n&0x0300)>>8]]
-    elif 0x4000 <= n < 0x6000:
-        n -= 0x4000
-        d += ["CEIL"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("TRIG","NUM")                            [(n&0x0020)>>5]]
-        d += [("DOWN","UP")                             [(n&0x0040)>>6]]
-        d += [("HNC","LNC","NNC","HNF","FLR",
-               "SUT","24","32")                         [(n&0x0380)>>7]]
-        d += [("","CPYTEX+DELTYPE","CPYTEX","CHGTYPE")  [(n&0x0c00)>>10]]
-        d += [("CRUSH","")                              [(n&0x1000)>>12]]
-    elif 0x6000 <= n < 0x8000:
-        n -= 0x6000
-        d += ["FLOOR"]
-        d += [("W1","WR","S1","SR","G1","GR","P1","PR") [n&0x0007]]
-        d += [("SLOW","NORMAL","FAST","TURBO")          [(n&0x0018)>>3]]
-        d += [("TRIG","NUM")                            [(n&0x0020)>>5]]
-        d += [("DOWN","UP")                             [(n&0x0040)>>6]]
-        d += [("HNF","LNF","NNF","LNC","CL",
-               "SLT","24","32")                         [(n&0x0380)>>7]]
-        d += [("","CPYTEX+DELTYPE","CPYTEX","CHGTYPE")  [(n&0x0c00)>>10]]
-        d += [("CRUSH","")                              [(n&0x1000)>>12]]
-    # Bit of a hack, but works
-    return (" ".join(d)).replace("  "," ").rstrip(" ")
+    if n < 65536:
+        return (_decode_table or _build_decode_table())[n]
+    return ""
+
+def decode_many(actions):
+    """Generate description codes for a sequence of trigger numbers (or
+    linedefs, e.g. MapEditor.linedefs). Returns a list of strings."""
+    table = _decode_table or _build_decode_table()
+    return [table[n] if 0 <= n < 65536 else decode(n)
+        for n in _actions(actions)]
 
 def encode_std(desc):
     """Encode an exact description of a trigger into its corresponding number.
@@ -534,61 +578,59 @@ def encode_std(desc):
     except:
         raise Exception, "Description not recognized"
 
+# Alternative spellings accepted by encode_gen
+_aliases = {"NORM":"NORMAL", "TURB":"TURBO", "BLU":"BLUE", "YEL":"YELLOW",
+            "PLAT":"PLATFORM", "CEILING":"CEIL"}
+
+_locks = set(["ANY", "RED", "YELLOW", "BLUE", "ALL"])
+
 def encode_gen(desc):
     """Encode a generalized (Boom) trigger description to a trigger
     number. Invalid or incompatible terms get converted to the default
-    value."""
-    desc = desc.upper()
-    num = 0
-    def pk(seq, shift):
-        for i in range(len(seq)):
-            if seq[i] in desc:
-                return i << shift
-        return 0
-    num |= pk(("W1","WR","S1","SR","G1","GR","P1","PR"), 0)
-    num |= pk(("SLOW","NORMAL","FAST","TURBO"), 3)
-    if ("FLOOR" in desc) or ("CEIL" in desc):
-        num |= pk(("TRIG","NUM"), 5)
-        num |= pk(("DOWN","UP"), 6)
-        num |= pk(("xx","CPYTEX+DELTYPE","CPYTEX","CHGTYPE"), 10)
-        num |= pk(("CRUSH",), 12)
-        if "FLOOR" in desc:
-            num |= pk(("HNF","LNF","NNF","LNC","CL","SLT","24","32"), 7)
-            num += 0x6000
-        else:
-            num |= pk(("HNC","LNC","NNC","HNF","FLR","SUT","24","32"), 7)
-            num += 0x4000
-    elif "CRUSHER" in desc:
-        num |= pk(("MONSTER",), 5)
-        num |= pk(("SILENT",), 6)
-        num += 0x2F80
-    elif "STAIR" in desc:
-        num |= pk(("xx","MONSTER"), 5)
-        num |= pk(("4","8","16","24"), 6)
-        num |= pk(("DOWN","UP"), 8)
-        num |= pk(("xx","IGNTXT"), 9)
-        num += 0x3000
-    elif "PLATFORM" in desc:
-        num |= pk(("MONSTER",), 5)
-        num |= pk(("1","3","5","10"), 6)
-        num |= pk(("LNF","NNF","LNC","PERP"), 8)
-        num += 0x3400
-    elif "DOOR" in desc:
-        num |= pk(("SLOW","NORMAL","FAST","TURBO"), 3)
-        if ("BLU" in desc) or ("YEL" in desc) or ("RED" in desc) or\
-           ("ALL" in desc) or ("ANY" in desc):
-            num |= pk(("OWC","OSO"), 5)
-            num |= pk(("ANY","RED","YELLOW","BLUE","RED","BLUE","YELLOW","ALL"), 6)
-            num |= pk(("3KEYS","6KEYS"), 9)
-            num += 0x3800
-        else:
-            num |= pk(("OWC","OSO","CWO","CSC"), 5)
-            num |= pk(("MONSTER",), 7)
-            num |= pk(("1SECS","4SECS","9SECS","30SECS"), 8)
-            num += 0x3c00
+    value; a field whose options include an empty term (such as
+    MONSTER or CRUSH) is encoded as absent unless its term is given."""
+    terms = set(_aliases.get(t, t) for t in desc.upper().split())
+    if ("FLOOR" in terms) or ("CEIL" in terms):
+        category = ["CEIL", "FLOOR"]["FLOOR" in terms]
+    elif "DOOR" in terms:
+        category = "DOOR"
     else:
-        raise LookupError, "Insufficient information provided"
-    return num
+        for category in ("CRUSHER", "STAIR", "PLATFORM"):
+            if category in terms:
+                break
+        else:
+            raise LookupError, "Insufficient information provided"
+    for first, end, name, fields in generalized:
+        if name != category:
+            continue
+        # Locked doors (0x3800) need a lock term, normal doors none
+        if name == "DOOR" and (first == 0x3800) != bool(terms & _locks):
+            continue
+        num = first
+        for mask, shift, options in fields:
+            for i, term in enumerate(options):
+                if term in terms:
+                    break
+            else:
+                i = 0
+                if "" in options:
+                    i = options.index("")
+            num |= i << shift
+        return num
+    raise LookupError, "No generalized trigger matches %r" % desc
+
+# Index from description terms to standard descriptions, built on
+# first use by find_std
+_term_index = None
+
+def _build_term_index():
+    global _term_index
+    index = {}
+    for dsc in num2desc.values():
+        for key in dsc.split():
+            index.setdefault(key, set()).add(dsc)
+    _term_index = index
+    return index
 
 def find_std(desc):
     """Search the standard (non-generalized) triggers. A list of
@@ -598,18 +640,21 @@ def find_std(desc):
        find_std("CEIL UP S?")        should return:
 
        ['CEIL S1 UP SLOW HNC', 'CEIL SR UP SLOW HNC']"""
-    desc = desc.upper()
-    terms = desc.split()
-    matches = []
-    for dsc in num2desc.values():
-        d = dsc.split()
-        matchedterms = 0
-        for term in terms:
-            for key in d:
+    index = _term_index or _build_term_index()
+    found = None
+    for term in desc.upper().split():
+        if "*" in term or "?" in term or "[" in term:
+            matches = set()
+            for key in index:
                 if fnmatchcase(key, term):
-                    matchedterms += 1
-        if matchedterms == len(terms):
-            matches.append(dsc)
-    return matches
+                    matches |= index[key]
+        else:
+            matches = index.get(term, set())
+        if found is None:
+            found = matches
+        else:
+            found = found & matches
+    return [dsc for dsc in num2desc.values() if found is None or dsc in found]
 
-__all__ = [find_std, encode_std, encode_gen, decode, check_compat]
\ No newline at end of file
+__all__ = ['find_std', 'encode_std', 'encode_gen', 'decode', 'check_compat',
+           'decode_many', 'check_compat_many']
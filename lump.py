@@ -12,6 +12,13 @@ import os
 import omg.palette
 from omg.util import *
 
+# Pixels decoded from graphics (see Graphic.to_raw and to_alpha), shared
+# by all graphics and keyed by their data, so that a graphic used over
+# and over (such as a patch in many textures) is decoded once. Set its
+# maxbytes to change how much memory it may take, counting the data of
+# the graphics as well as the pixels.
+decoded = LRUCache(4096, 32 << 20, lambda key, value: len(key[1]) + len(value))
+
 
 class Lump(object):
     """Basic lump class. Instances of Lump (and its subclasses)
@@ -32,12 +39,35 @@ class Lump(object):
         a path to a file or a file-like object to load from."""
         self.data = ""
         if issubclass(type(data), Lump):
-            self.data = data.data
+            if data.source is not None:
+                self.source = data.source
+            else:
+                self.data = data.data
         elif data is not None:
             self.data = data or ""
         if from_file:
             self.from_file(from_file)
 
+    def _get_data(self):
+        if self._source is not None:
+            self._data = self._source.read()
+            self._source = None
+        return self._data
+
+    def _set_data(self, data):
+        self._data = data
+        self._source = None
+
+    def _set_source(self, source):
+        self._source = source
+        self._data = None
+
+    data = property(_get_data, _set_data)
+
+    # A lump loaded lazily (see WAD.from_file) has a source, an object
+    # whose read() method returns the data, until .data is first used.
+    source = property(lambda self: self._source, _set_source)
+
     def from_file(self, source):
         """Load data from a file. Source may be a path name string
         or a file-like object (with a `write` method)."""
@@ -49,7 +79,15 @@ class Lump(object):
         writefile(target, self.data)
 
     def copy(self):
-        return deepcopy(self)
+        """Return a copy of the lump. Lump data is an immutable string,
+        so the copy shares it with the original until either of them
+        is given new data; copying costs the same for any lump size.
+        Other attributes (such as the palette of a graphic) are shared
+        as well."""
+        c = copy(self)
+        if isinstance(c._data, bytearray):
+            c._data = bytearray(c._data)
+        return c
 
 
 class Music(Lump):
@@ -74,15 +112,43 @@ class Graphic(Lump):
         .height         -- height of the image
         .x_offset       -- x offset
         .y_offset       -- y offset
+
+    The header is read once and the pixels are decoded once (see the
+    `decoded` cache), until the data is changed.
     """
 
+    # (width, height, x offset, y offset), once read from the data
+    _header = None
+
     def __init__(self, data=None, from_file=None, palette=None):
         self.palette = palette or omg.palette.default
         Lump.__init__(self, data, from_file)
 
+    def _set_data(self, data):
+        Lump._set_data(self, data)
+        self._header = None
+
+    def _set_source(self, source):
+        Lump._set_source(self, source)
+        self._header = None
+
+    data = property(Lump._get_data, _set_data)
+    source = property(lambda self: self._source, _set_source)
+
+    def _get_header(self):
+        header = self._header
+        if header is None:
+            data = self.data
+            header = unpack('<4h', data[0:8])
+            # a bytearray may be changed in place, so only keep the
+            # header of immutable data
+            if isinstance(data, str):
+                self._header = header
+        return header
+
     def get_offsets(self):
         """Retrieve the (x, y) offsets of the graphic."""
-        return unpack('<hh', self.data[4:8])
+        return self._get_header()[2:]
 
     def set_offsets(self, xy):
         """Set the (x, y) offsets of the graphic."""
@@ -90,7 +156,7 @@ class Graphic(Lump):
 
     def get_dimensions(self):
         """Retrieve the (width, height) dimensions of the graphic."""
-        return unpack('<hh', self.data[0:4])
+        return self._get_header()[:2]
 
     offsets = property(get_offsets, set_offsets)
     x_offset = property(lambda self: self.offsets[0],
@@ -145,18 +211,47 @@ class Graphic(Lump):
         transparent pixels. The value defaults to that of the
         Graphic object's palette instance."""
         data = self.data
-        width, height = self.dimensions
         tran_index = tran_index or self.palette.tran_index
-        output = [chr(tran_index)] * (width*height)
+        if not isinstance(data, str):
+            data = str(data)
+        key = ("raw", data, tran_index)
+        raw = decoded.get(key)
+        if raw is None:
+            raw = decoded[key] = self._decode(data, chr(tran_index), None)
+        return raw
+
+    def to_alpha(self):
+        """Returns the transparency mask of the graphic, a string with a
+        byte per pixel in the same order as to_raw: '\\xff' where the
+        graphic has a pixel and '\\x00' where it is transparent."""
+        data = self.data
+        if not isinstance(data, str):
+            data = str(data)
+        key = ("alpha", data, None)
+        alpha = decoded.get(key)
+        if alpha is None:
+            alpha = decoded[key] = self._decode(data, '\x00', '\xff')
+        return alpha
+
+    def _decode(self, data, background, opaque):
+        """Draw the posts of the graphic on the background color, in
+        their own colors or, if given, in the opaque color."""
+        width, height = self.dimensions
+        output = [background] * (width*height)
         pointers = unpack('<%ii'%width, data[8 : 8 + width*4])
         for x in xrange(width):
             pointer = pointers[x]
             while data[pointer] != '\xff':
                 post_length = ord(data[pointer+1])
                 op = ord(data[pointer])*width + x
-                for p in range(pointer + 3, pointer + post_length + 3):
-                    output[op] = data[p]
-                    op += width
+                if opaque is None:
+                    for p in range(pointer + 3, pointer + post_length + 3):
+                        output[op] = data[p]
+                        op += width
+                else:
+                    for p in xrange(post_length):
+                        output[op] = opaque
+                        op += width
                 pointer += post_length + 4
         return join(output)
 
@@ -164,9 +259,14 @@ class Graphic(Lump):
         """Convert to a PIL Image instance"""
         im = Image.new('P', self.dimensions, None)
         if isinstance(self, Flat):
-            im.fromstring(self.data)
+            pixels = self.data
+        else:
+            pixels = self.to_raw()
+        # Pillow renamed fromstring() to frombytes()
+        if hasattr(im, 'frombytes'):
+            im.frombytes(pixels)
         else:
-            im.fromstring(self.to_raw())
+            im.fromstring(pixels)
         im.putpalette(self.palette.save_bytes)
         return im
 
@@ -180,34 +280,40 @@ class Graphic(Lump):
         from the input image. To properly translate colors between
         palettes, set the `translate` parameter."""
 
-        pixels = im.tostring()
+        # Pillow renamed tostring() to tobytes()
+        if hasattr(im, 'tobytes'):
+            pixels = im.tobytes()
+        else:
+            pixels = im.tostring()
         width, height = im.size
         # High resolution graphics not supported yet, so truncate
         height = min(254, height)
         xoff, yoff = (width // 2)-1, height-5
         if im.mode == "RGB":
-            pixels = join([chr(self.palette.match(unpack('BBB', \
-                pixels[i*3:(i+1)*3]))) for i in range(width*height)])
+            pixels = self.palette.match_many(pixels[:width*height*3])
         elif im.mode == 'P':
-            srcpal = im.palette.tostring()
+            if hasattr(im.palette, 'tobytes'):
+                srcpal = im.palette.tobytes()
+            else:
+                srcpal = im.palette.tostring()
             if translate:
                 R = [ord(c) for c in srcpal[0::3]]
                 G = [ord(c) for c in srcpal[1::3]]
                 B = [ord(c) for c in srcpal[2::3]]
                 # Work around PIL bug: "RGB" loads as "BGR" from bmps (?)
-                if filename[-4:].lower() == '.bmp':
+                if im.format == 'BMP':
                     srcpal = zip(B, G, R)
                 else:
                     srcpal = zip(R, G, B)
-                lexicon = [chr(self.palette.match(c)) for c in srcpal]
-                pixels = join([lexicon[ord(b)] for b in pixels])
+                lexicon = self.palette.match_many(srcpal).ljust(256, '\0')
+                pixels = pixels.translate(lexicon)
             else:
                 # Simply copy pixels. However, make sure to translate
                 # all colors matching the transparency color to the
                 # right index. This is necessary because programs
                 # aren't consistent in choice of position for the
                 # transparent entry.
-                packed_color = pack("BBB", *pal.tran_color)
+                packed_color = pack("BBB", *self.palette.tran_color)
                 ri = 0
                 while ri != -1:
                     ri = srcpal.find(packed_color, ri+3)
@@ -254,16 +360,17 @@ class Graphic(Lump):
 
     def translate(self, pal):
         """Translate (in-place) the graphic to another palette."""
-        lexicon = [chr(pal.match(self.palette.colors[i])) for i in range(256)]
+        lexicon = list(pal.match_many(self.palette.colors).ljust(256, '\0'))
         lexicon[self.palette.tran_index] = chr(pal.tran_index)
+        lexicon = join(lexicon)
         if isinstance(self, Flat):
-            self.data = join([lexicon[ord(b)] for b in self.data])
+            self.data = self.data.translate(lexicon)
         else:
             raw = self.to_raw()
-            #raw = raw.replace(chr(self.palette.tran_index), chr(pal.tran_index))
-            self.load_raw(join([lexicon[ord(b)] for b in raw]),
+            self.from_raw(raw.translate(lexicon),
                 self.width, self.height,
-                self.x_offset, self.y_offset)
+                self.x_offset, self.y_offset, pal)
+        self.palette = pal
 
 
 class Flat(Graphic):
@@ -287,3 +394,6 @@ class Flat(Graphic):
 
     def to_raw(self):
         return self.data
+
+    def to_alpha(self):
+        return '\xff' * len(self.data)
@@ -2,19 +2,28 @@ from omg.util import *
 from omg.lump import *
 from omg.wad import NameGroup
 
+import os, tempfile, zlib
+from math import atan2, pi
+from struct import error as StructError
+from weakref import ref
+
 import omg.lineinfo as lineinfo
 import omg.thinginfo as thinginfo
+import omg.udmf as udmf
+from omg.wadio import LumpRef
 
 Vertex = make_struct(
   "Vertex", """Represents a map vertex""",
   [["x", "h", 0],
-   ["y", "h", 0]]
+   ["y", "h", 0]],
+  track=True
 )
 
 GLVertex = make_struct(
-  "GLVertex", """Represents a map GL vertex""",
+  "GLVertex", """Represents a map GL vertex (16.16 fixed point)""",
   [["x", "i", 0],
-   ["y", "i", 0]]
+   ["y", "i", 0]],
+  track=True
 )
 
 Sidedef = make_struct(
@@ -24,7 +33,8 @@ Sidedef = make_struct(
    ["tx_up",  '8s', "-"],
    ["tx_low", '8s', "-"],
    ["tx_mid", '8s', "-"],
-   ["sector", 'H',   0 ]]
+   ["sector", 'H',   0 ]],
+  track=True
 )
 
 Linedef = make_struct(
@@ -38,7 +48,8 @@ Linedef = make_struct(
    ["back",   'H', -1]],
   ["impassable", "block_monsters", "two_sided",
    "upper_unpeg", "lower_unpeg", "secret",
-   "block_sound", "invisible", "automap"]
+   "block_sound", "invisible", "automap"],
+  track=True
 )
 
 # TODO: an enum or something for triggers
@@ -59,7 +70,8 @@ ZLinedef = make_struct(
    "upper_unpeg", "lower_unpeg", "secret",
    "block_sound", "invisible", "automap",
    "repeat", ("trigger", 3),
-   "activate_any", None, "block_all"]
+   "activate_any", None, "block_all"],
+  track=True
 )
 
 Thing = make_struct(
@@ -69,7 +81,8 @@ Thing = make_struct(
    ["angle", 'H', 0],
    ["type",  'H', 0],
    ["flags", 'H', 0]],
-  ["easy", "medium", "hard", "deaf", "multiplayer"]
+  ["easy", "medium", "hard", "deaf", "multiplayer"],
+  track=True
 )
 
 ZThing = make_struct(
@@ -88,7 +101,8 @@ ZThing = make_struct(
    ["arg3",   'B', 0],
    ["arg4",   'B', 0]],
   ["easy", "medium", "hard", "deaf", "dormant",
-   "fighter", "cleric", "mage", "solo", "multiplayer", "deathmatch"]
+   "fighter", "cleric", "mage", "solo", "multiplayer", "deathmatch"],
+  track=True
 )
 
 Sector = make_struct(
@@ -99,7 +113,8 @@ Sector = make_struct(
    ["tx_ceil",  '8s', "CEIL3_5"],
    ["light",    'H',  160],
    ["type",     'H',  0],
-   ["tag",      'H',  0]]
+   ["tag",      'H',  0]],
+  track=True
 )
 
 Node = make_struct(
@@ -117,7 +132,8 @@ Node = make_struct(
    ["left_bbox_left",    'h', 0],
    ["left_bbox_right",   'h', 0],
    ["right_index",       'H', 0],
-   ["left_index",        'H', 0]]
+   ["left_index",        'H', 0]],
+  track=True
 )
 
 Seg = make_struct(
@@ -127,13 +143,15 @@ Seg = make_struct(
    ["angle",  'H', 0],
    ["line",   'H', 0],
    ["side",   'H', 0],
-   ["offset", 'H', 0]]
+   ["offset", 'H', 0]],
+  track=True
 )
 
 SubSector = make_struct(
   "SubSector", """Represents a map subsector""",
   [["numsegs", 'H', 0],
-   ["seg_a",   'H', 0]]
+   ["seg_a",   'H', 0]],
+  track=True
 )
 
 GLSeg = make_struct(
@@ -145,6 +163,340 @@ GLSeg = make_struct(
    ["partner", 'H', 0]]
 )
 
+GLSeg3 = make_struct(
+  "GLSeg3", """Represents a map GL seg (GL nodes v3 and later)""",
+  [["vx_a",    'I', 0],
+   ["vx_b",    'I', 0],
+   ["line",    'H', 0],
+   ["side",    'H', 0],
+   ["partner", 'I', 0]]
+)
+
+GLSubSector3 = make_struct(
+  "GLSubSector3", """Represents a map GL subsector (GL nodes v3 and later)""",
+  [["numsegs", 'I', 0],
+   ["seg_a",   'I', 0]]
+)
+
+# ZDoom extended nodes. Subsectors hold only the number of segs (they
+# are stored in order), and GL segs only their first vertex (the second
+# is the first of the next seg in the subsector).
+
+ZSubSector = make_struct(
+  "ZSubSector", """Represents a map subsector (extended nodes)""",
+  [["numsegs", 'I', 0]],
+  track=True
+)
+
+ZSeg = make_struct(
+  "ZSeg", """Represents a map seg (XNOD/ZNOD nodes)""",
+  [["vx_a", 'I', 0],
+   ["vx_b", 'I', 0],
+   ["line", 'H', 0],
+   ["side", 'B', 0]],
+  track=True
+)
+
+ZGLSeg = make_struct(
+  "ZGLSeg", """Represents a map GL seg (XGLN/ZGLN nodes)""",
+  [["vx_a",    'I', 0],
+   ["partner", 'I', 0],
+   ["line",    'H', 0],
+   ["side",    'B', 0]],
+  track=True
+)
+
+ZGL2Seg = make_struct(
+  "ZGL2Seg", """Represents a map GL seg (XGL2/ZGL2/XGL3/ZGL3 nodes)""",
+  [["vx_a",    'I', 0],
+   ["partner", 'I', 0],
+   ["line",    'I', 0],
+   ["side",    'B', 0]],
+  track=True
+)
+
+_bbox_fields = \
+  [["right_bbox_top",    'h', 0],
+   ["right_bbox_bottom", 'h', 0],
+   ["right_bbox_left",   'h', 0],
+   ["right_bbox_right",  'h', 0],
+   ["left_bbox_top",     'h', 0],
+   ["left_bbox_bottom",  'h', 0],
+   ["left_bbox_left",    'h', 0],
+   ["left_bbox_right",   'h', 0],
+   ["right_index",       'I', 0],
+   ["left_index",        'I', 0]]
+
+ZNode = make_struct(
+  "ZNode", """Represents a BSP tree node (extended and GL v5 nodes)""",
+  [["x_start",  'h', 0],
+   ["y_start",  'h', 0],
+   ["x_vector", 'h', 0],
+   ["y_vector", 'h', 0]] + _bbox_fields,
+  track=True
+)
+
+ZGL3Node = make_struct(
+  "ZGL3Node", """Represents a BSP tree node (XGL3/ZGL3 nodes, 16.16
+  fixed point partition line)""",
+  [["x_start",  'i', 0],
+   ["y_start",  'i', 0],
+   ["x_vector", 'i', 0],
+   ["y_vector", 'i', 0]] + _bbox_fields,
+  track=True
+)
+
+# signature: (compressed, seg class, node class, lump)
+_znode_formats = {
+    'XNOD': (False, ZSeg,    ZNode,    "NODES"),
+    'ZNOD': (True,  ZSeg,    ZNode,    "NODES"),
+    'XGLN': (False, ZGLSeg,  ZNode,    "SSECTORS"),
+    'ZGLN': (True,  ZGLSeg,  ZNode,    "SSECTORS"),
+    'XGL2': (False, ZGL2Seg, ZNode,    "SSECTORS"),
+    'ZGL2': (True,  ZGL2Seg, ZNode,    "SSECTORS"),
+    'XGL3': (False, ZGL2Seg, ZGL3Node, "SSECTORS"),
+    'ZGL3': (True,  ZGL2Seg, ZGL3Node, "SSECTORS"),
+}
+
+def unpack_znodes(data):
+    """Decode ZDoom extended nodes (the data of the lump, starting with
+    its signature). Returns a (format, orgverts, vertexes, ssectors,
+    segs, nodes) tuple: the signature, the number of vertexes in the
+    VERTEXES lump, and lists of GLVertex, ZSubSector, seg and node
+    objects. Raises ValueError if the data is invalid."""
+    format = data[:4]
+    if format not in _znode_formats:
+        raise ValueError, "unknown node format %r" % format
+    compressed, seg_class, node_class, lumpname = _znode_formats[format]
+    try:
+        data = data[4:]
+        if compressed:
+            data = zlib.decompress(data)
+        lists = []
+        orgverts, = unpack_from('<I', data)
+        pos = 4
+        for class_ in (GLVertex, ZSubSector, seg_class, node_class):
+            count, = unpack_from('<I', data, pos)
+            pos += 4
+            lists.append(unpack_array(class_, data, pos, count))
+            pos += count * class_._fmtsize
+    except (StructError, zlib.error), e:
+        raise ValueError, "invalid %s nodes: %s" % (format, e)
+    return tuple([format, orgverts] + lists)
+
+def pack_znodes(format, orgverts, vertexes, ssectors, segs, nodes):
+    """Encode ZDoom extended nodes; the reverse of unpack_znodes. The
+    segs and nodes must be of the classes used by the format."""
+    parts = [pack('<I', orgverts)]
+    for items in (vertexes, ssectors, segs, nodes):
+        parts.append(pack('<I', len(items)))
+        parts.extend([x.pack() for x in items])
+    data = join(parts)
+    if _znode_formats[format][0]:
+        data = zlib.compress(data)
+    return format + data
+
+def _ring_area(vertexes, ring):
+    """Signed area of a ring of vertex numbers, positive if it goes
+    counter-clockwise."""
+    area = 0
+    last = vertexes[ring[-1]]
+    for i in ring:
+        v = vertexes[i]
+        area += last.x*v.y - v.x*last.y
+        last = v
+    return area / 2.0
+
+def _ring_contains(vertexes, ring, other):
+    """True if the ring `other` lies inside `ring` (even-odd rule,
+    tested on a vertex of `other` that is not on `ring`)."""
+    on_ring = set(ring)
+    points = [vertexes[i] for i in other if i not in on_ring]
+    if points:
+        px, py = points[0].x, points[0].y
+    else:
+        px = sum(vertexes[i].x for i in other) / float(len(other))
+        py = sum(vertexes[i].y for i in other) / float(len(other))
+    inside = False
+    last = vertexes[ring[-1]]
+    for i in ring:
+        v = vertexes[i]
+        if (v.y > py) != (last.y > py) and \
+           px < (last.x-v.x) * (py-v.y) / float(last.y-v.y) + v.x:
+            inside = not inside
+        last = v
+    return inside
+
+def _trace_rings(vertexes, edges):
+    """Join directed edges (pairs of vertex numbers) into closed rings.
+    Where several edges leave a vertex the sharpest right turn is
+    taken, which keeps the area on the right of the edges within the
+    smallest ring."""
+    targets = {}
+    for a, b in edges:
+        targets.setdefault(a, []).append(b)
+
+    def turn(prev, cur, nxt):
+        p, c, n = vertexes[prev], vertexes[cur], vertexes[nxt]
+        if nxt == prev:
+            return 2*pi
+        angle = atan2(n.y-c.y, n.x-c.x) - atan2(p.y-c.y, p.x-c.x)
+        if angle <= 0:
+            angle += 2*pi
+        return angle
+
+    rings = []
+    for start, first in edges:
+        if first not in targets.get(start, ()):
+            continue
+        targets[start].remove(first)
+        ring = [start]
+        index = {start: 0}
+        prev, cur = start, first
+        while True:
+            if cur in index:
+                # closed a loop, possibly leaving a tail behind
+                loop = ring[index[cur]:]
+                del ring[index[cur]:]
+                for i in loop:
+                    del index[i]
+                if len(loop) > 2:
+                    rings.append(loop)
+                if not ring:
+                    break
+            index[cur] = len(ring)
+            ring.append(cur)
+            out = targets.get(cur)
+            if not out:
+                break
+            if len(out) == 1:
+                nxt = out[0]
+            else:
+                nxt = min(out, key=lambda n: turn(prev, cur, n))
+            out.remove(nxt)
+            prev, cur = cur, nxt
+    return rings
+
+def _sector_polygons(vertexes, linedefs, sidedefs, num_sectors):
+    # vertexes in the same place are the same point
+    where = {}
+    canon = [where.setdefault((v.x, v.y), i) for i, v in enumerate(vertexes)]
+
+    # directed edges with the sector on their right hand side
+    edges = [[] for i in xrange(num_sectors)]
+    nv, ns = len(vertexes), len(sidedefs)
+    for line in linedefs:
+        if line.vx_a >= nv or line.vx_b >= nv:
+            continue
+        a, b = canon[line.vx_a], canon[line.vx_b]
+        front = back = None
+        if 0 <= line.front < ns: front = sidedefs[line.front].sector
+        if 0 <= line.back  < ns: back  = sidedefs[line.back].sector
+        if a == b or front == back:
+            continue
+        if front is not None and front < num_sectors:
+            edges[front].append((a, b))
+        if back is not None and back < num_sectors:
+            edges[back].append((b, a))
+
+    polygons = []
+    for sector_edges in edges:
+        outers, holes = [], []
+        for ring in _trace_rings(vertexes, sector_edges):
+            area = _ring_area(vertexes, ring)
+            if area < 0:
+                outers.append((-area, ring, []))
+            elif area > 0:
+                holes.append(ring)
+        outers.sort(key=lambda o: o[0])
+        for hole in holes:
+            for area, ring, inner in outers:
+                if _ring_contains(vertexes, ring, hole):
+                    inner.append(hole)
+                    break
+            else:
+                # drawn the wrong way round; treat it as an outline
+                outers.append((0, hole[::-1], []))
+        polygons.append([(ring, inner) for area, ring, inner in outers])
+    return polygons
+
+
+class _TextmapRef(LumpRef):
+    """Refers to a TEXTMAP written to a temporary file one block at a
+    time (see udmf.write), so that saving copies it into the WAD
+    without the text ever being in memory as a whole. The file is
+    deleted along with the last reference to it."""
+
+    def __init__(self, fields, blocks):
+        fd, path = tempfile.mkstemp(".textmap")
+        LumpRef.__init__(self, path, 0, 0)
+        f = os.fdopen(fd, "wb")
+        try:
+            udmf.write(f, fields, blocks)
+            self.size = f.tell()
+        finally:
+            f.close()
+
+    def __del__(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class _TrackedList(list):
+    """A list of structs decoded from a lump. `dirty` is set when the
+    list is changed, and by the (tracked) structs in it when they are
+    changed; while it is not set, `lump` still holds the contents."""
+
+    def __init__(self, items, lump):
+        list.__init__(self, items)
+        self.lump = lump
+        self.dirty = False
+        owner = ref(self)
+        for item in self:
+            item.__dict__["_owner"] = owner
+
+    def _changed(method):
+        def changed(self, *args, **kwargs):
+            self.dirty = True
+            return method(self, *args, **kwargs)
+        changed.__name__ = method.__name__
+        return changed
+
+    for _name in ["__setitem__", "__delitem__", "__setslice__",
+                  "__delslice__", "__iadd__", "__imul__", "append",
+                  "extend", "insert", "pop", "remove", "reverse", "sort"]:
+        locals()[_name] = _changed(getattr(list, _name))
+    del _name, _changed
+
+def _pack_linedefs(linedefs):
+    """Pack linedefs, writing -1 (no sidedef) as 0xFFFF, without
+    changing them."""
+    packed = []
+    for line in linedefs:
+        if line.front == -1 or line.back == -1:
+            line = copy(line)
+            d = line.__dict__
+            if d["front"] == -1: d["front"] = 0xFFFF
+            if d["back"]  == -1: d["back"]  = 0xFFFF
+        packed.append(line.pack())
+    return join(packed)
+
+# Attributes of MapEditor that hold a list of structs, and their lumps
+_map_lists = [("vertexes", "VERTEXES"), ("things",   "THINGS"),
+              ("linedefs", "LINEDEFS"), ("sidedefs", "SIDEDEFS"),
+              ("sectors",  "SECTORS"),  ("nodes",    "NODES"),
+              ("segs",     "SEGS"),     ("ssectors", "SSECTORS")]
+
+# Attributes of MapEditor decoded from ZDoom extended nodes
+_znode_lists = ["nodes_vertexes", "ssectors", "segs", "nodes"]
+
+# Attributes of MapEditor decoded from a TEXTMAP, and the block types
+# in the lists
+_udmf_lists = [("things",   "thing"),   ("vertexes", "vertex"),
+               ("linedefs", "linedef"), ("sidedefs", "sidedef"),
+               ("sectors",  "sector")]
+
 class MapEditor:
     """Doom map editor
 
@@ -153,7 +505,42 @@ class MapEditor:
         sidedefs      List containing Sidedef objects
         linedefs      List containing Linedef objects
         sectors       List containing Sector objects
-        things        List containing Thing objects"""
+        things        List containing Thing objects
+        segs, ssectors, nodes
+                      Lists containing the BSP tree
+        nodes_format  Format of the BSP tree: "doom", one of the ZDoom
+                      extended formats ("XNOD", "ZNOD", "XGLN", "ZGLN",
+                      "XGL2", "ZGL2", "XGL3" or "ZGL3"), or None if the
+                      map has no (readable) nodes. The extended formats
+                      use ZSeg or ZGL*Seg, ZSubSector and ZNode or
+                      ZGL3Node objects, and seg vertex numbers from
+                      nodes_orgverts on refer to
+        nodes_vertexes
+                      a list of the GLVertex objects added by the node
+                      builder (empty for Doom nodes)
+        nodes_orgverts
+                      the number of map vertexes when the extended nodes
+                      were built, or None to use len(vertexes) (and for
+                      Doom nodes)
+
+    UDMF maps (with a TEXTMAP lump) are read as well. Their lists hold
+    udmf.Block objects instead (udmf.Thing, udmf.Vertex and so on),
+    whose attributes are the fields of the blocks, and there are two
+    more members:
+        udmf_fields   Dict of the global fields of the TEXTMAP, such
+                      as "namespace"
+        udmf_blocks   List of the blocks of other types
+    The nodes of a UDMF map are in its ZNODES lump, if any; the lumps
+    that MapEditor does not know about are kept as they are. When a
+    UDMF map has changed, to_lumps() writes its TEXTMAP to a temporary
+    file and the lump reads it from there, so that saving a large map
+    does not build the text in memory.
+
+    When loaded from lumps, each list is decoded the first time it is
+    used, so that only reading e.g. the things of a map does not pay
+    for decoding its segs and nodes. The decoded lists keep track of
+    changes to themselves and to the objects in them, and to_lumps()
+    returns the original lumps for those that are unchanged."""
 
     def __init__(self, from_lumps=None):
         """Create new, optionally from a lump group"""
@@ -168,24 +555,97 @@ class MapEditor:
             self.segs     = []
             self.ssectors = []
             self.nodes    = []
+            self.nodes_vertexes = []
+            self.nodes_orgverts = None
+            self.nodes_format   = None
             self.blockmap = Lump("")
             self.reject   = Lump("")
+            self._pending = {}
+            self._node_lumps = None
+            self._textmap = None
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set: decode a list
+        # that is still pending
+        pending = self.__dict__.get("_pending")
+        if not pending or name not in pending:
+            raise AttributeError, name
+        class_, lump = pending[name]
+        if class_ is None:
+            # extended nodes: all of the lists are in one lump
+            self._unpack_znodes(lump)
+            return self.__dict__[name]
+        if class_ == "TEXTMAP":
+            self._unpack_textmap(lump)
+            return self.__dict__[name]
+        value = self._unpack_lump(class_, lump.data)
+        if name == "linedefs":
+            # use -1 for unused sidedefs instead of 0xFFFF
+            for line in value:
+                if line.front == 0xFFFF: line.front = -1
+                if line.back  == 0xFFFF: line.back  = -1
+        value = self.__dict__[name] = _TrackedList(value, lump)
+        return value
 
     def _unpack_lump(self, class_, data):
         s = class_._fmtsize
+        if 's' not in class_._fmt and not len(data) % s:
+            return unpack_array(class_, data)
         return [class_(bytes=data[i:i+s]) for i in xrange(0,len(data),s)]
 
+    def _unpack_znodes(self, lump):
+        nodes = unpack_znodes(lump.data)
+        for name, value in zip(_znode_lists, nodes[2:]):
+            if name not in self.__dict__:
+                self.__dict__[name] = _TrackedList(value, None)
+        if "nodes_orgverts" not in self.__dict__:
+            self.nodes_orgverts = nodes[1]
+
+    def _unpack_textmap(self, lump):
+        fields, blocks = udmf.parse(lump.data)
+        lists = dict((type, []) for name, type in _udmf_lists)
+        other = []
+        for block in blocks:
+            lists.get(block._type, other).append(block)
+        d = self.__dict__
+        for name, type in _udmf_lists:
+            if name not in d:
+                d[name] = _TrackedList(lists[type], None)
+        if "udmf_blocks" not in d:
+            d["udmf_blocks"] = _TrackedList(other, None)
+        if "udmf_fields" not in d:
+            d["udmf_fields"] = fields
+        self._textmap_fields = fields.copy()
+
+    def _unchanged(self, name):
+        """True if a list is still as decoded (or not decoded yet)."""
+        value = self.__dict__.get(name)
+        return value is None or \
+            (isinstance(value, _TrackedList) and not value.dirty)
+
     def from_lumps(self, lumpgroup):
-        """Load entries from a lump group."""
+        """Load entries from a lump group. The lumps are only checked
+        here; see the class documentation."""
         m = lumpgroup
+        for name, lumpname in _map_lists:
+            self.__dict__.pop(name, None)
+        for name in ("nodes_vertexes", "nodes_orgverts", "udmf_fields",
+                     "udmf_blocks", "_polygons"):
+            self.__dict__.pop(name, None)
+        self._node_lumps = None
+        self._textmap = None
+        if "TEXTMAP" in m:
+            self._from_textmap(m)
+            return
+        pending = {}
         try:
-            self.vertexes = self._unpack_lump(Vertex,    m["VERTEXES"].data)
-            self.sidedefs = self._unpack_lump(Sidedef,   m["SIDEDEFS"].data)
-            self.sectors  = self._unpack_lump(Sector,    m["SECTORS"].data)
+            pending["vertexes"] = Vertex,  m["VERTEXES"].copy()
+            pending["sidedefs"] = Sidedef, m["SIDEDEFS"].copy()
+            pending["sectors"]  = Sector,  m["SECTORS"].copy()
             
             if "BEHAVIOR" in m: # Hexen / ZDoom map
-                self.things   = self._unpack_lump(ZThing,    m["THINGS"].data)
-                self.linedefs = self._unpack_lump(ZLinedef,  m["LINEDEFS"].data)
+                pending["things"]   = ZThing,   m["THINGS"].copy()
+                pending["linedefs"] = ZLinedef, m["LINEDEFS"].copy()
                 
                 self.behavior = m["BEHAVIOR"].data
                 if "SCRIPTS" in m:
@@ -193,57 +653,147 @@ class MapEditor:
                 else:
                     self.scripts = []
             else:
-                self.things   = self._unpack_lump(Thing,     m["THINGS"].data)
-                self.linedefs = self._unpack_lump(Linedef,   m["LINEDEFS"].data)
+                pending["things"]   = Thing,   m["THINGS"].copy()
+                pending["linedefs"] = Linedef, m["LINEDEFS"].copy()
         except KeyError as e:
             raise ValueError("map is missing %s lump" % e)
         
-        # use -1 for unused sidedefs instead of 0xFFFF
-        for line in self.linedefs:
-            if line.front == 0xFFFF: line.front = -1
-            if line.back  == 0xFFFF: line.back  = -1
+        znodes = [name for name in ("NODES", "SSECTORS")
+                  if name in m and m[name].data[:4] in _znode_formats]
+        if znodes:
+            lump = m[znodes[0]].copy()
+            self.nodes_format = lump.data[:4]
+            self._node_lumps = self.nodes_format, dict((name, m[name].copy())
+                for name in ("NODES", "SEGS", "SSECTORS") if name in m)
+            for name in _znode_lists + ["nodes_orgverts"]:
+                pending[name] = None, lump
+            self.blockmap = Lump("")
+            self.reject   = Lump("")
+            if "BLOCKMAP" in m: self.blockmap = m["BLOCKMAP"]
+            if "REJECT"   in m: self.reject   = m["REJECT"]
+            self._pending = pending
+            return
         
-        from struct import error as StructError
+        self.nodes_vertexes = []
+        self.nodes_orgverts = None
         try:
-            self.ssectors = self._unpack_lump(SubSector, m["SSECTORS"].data)
-            self.segs     = self._unpack_lump(Seg,       m["SEGS"].data)
+            nodes = [(SubSector, m["SSECTORS"].copy()), (Seg, m["SEGS"].copy()),
+                     (Node, m["NODES"].copy())]
             self.blockmap = m["BLOCKMAP"]
             self.reject   = m["REJECT"]
-            self.nodes    = self._unpack_lump(Node,      m["NODES"].data)
-        except (KeyError, StructError):
+            for class_, lump in nodes:
+                if len(lump.data) % class_._fmtsize:
+                    raise KeyError
+            pending["ssectors"], pending["segs"], pending["nodes"] = nodes
+            self.nodes_format = "doom"
+        except KeyError:
             # nodes failed to build - we don't really care
-            # TODO: this also "handles" (read: ignores) expanded zdoom nodes)
             self.ssectors = []
             self.segs     = []
             self.blockmap = []
             self.reject   = []
             self.nodes    = []
+            self.nodes_format = None
+        self._pending = pending
+
+    def _from_textmap(self, m):
+        lump = m["TEXTMAP"].copy()
+        pending = {}
+        for name in [name for name, type in _udmf_lists] + \
+                    ["udmf_blocks", "udmf_fields"]:
+            pending[name] = "TEXTMAP", lump
+        self._textmap = lump
+        self._udmf_lumps = [(name, m[name].copy()) for name in m
+            if name not in ("_HEADER_", "TEXTMAP", "ENDMAP")]
+        self.blockmap = Lump("")
+        self.reject   = Lump("")
+        if "BLOCKMAP" in m: self.blockmap = m["BLOCKMAP"]
+        if "REJECT"   in m: self.reject   = m["REJECT"]
+        if "ZNODES" in m and m["ZNODES"].data[:4] in _znode_formats:
+            znodes = m["ZNODES"].copy()
+            self.nodes_format = znodes.data[:4]
+            self._node_lumps = self.nodes_format, {"ZNODES": znodes}
+            for name in _znode_lists + ["nodes_orgverts"]:
+                pending[name] = None, znodes
+        else:
+            self.nodes_vertexes = []
+            self.nodes_orgverts = None
+            self.ssectors = []
+            self.segs     = []
+            self.nodes    = []
+            self.nodes_format = None
+        self._pending = pending
 
     def load_gl(self, mapobj):
-        """Load GL nodes entries from a map"""
-        vxdata = mapobj["GL_VERT"].data[4:]  # s[:4] == "gNd3" ?
-        self.gl_vert  = self._unpack_lump(GLVertex,  vxdata)
-        self.gl_segs  = self._unpack_lump(GLSeg,     mapobj["GL_SEGS"].data)
-        self.gl_ssect = self._unpack_lump(SubSector, mapobj["GL_SSECT"].data)
+        """Load GL nodes entries from a map (the lumps of its GL_ map).
+        Versions 1 to 5 of the glBSP format are read; the version goes
+        in gl_version and the entries in gl_vert, gl_segs, gl_ssect and
+        gl_nodes."""
+        vert  = mapobj["GL_VERT"].data
+        segs  = mapobj["GL_SEGS"].data
+        ssect = mapobj["GL_SSECT"].data
+        nodes = ""
+        if "GL_NODES" in mapobj:
+            nodes = mapobj["GL_NODES"].data
+        if vert[:4] in ("gNd4", "gNd5"):
+            version = int(vert[3])
+            classes = GLVertex, GLSeg3, GLSubSector3, ZNode
+            vert = vert[4:]
+        elif vert[:4] == "gNd2":
+            vert = vert[4:]
+            if segs[:4] == "gNd3":
+                version = 3
+                classes = GLVertex, GLSeg3, GLSubSector3, Node
+                segs, ssect = segs[4:], ssect[4:]
+            else:
+                version = 2
+                classes = GLVertex, GLSeg, SubSector, Node
+        else:
+            version = 1
+            classes = Vertex, GLSeg, SubSector, Node
+        self.gl_version = version
+        self.gl_vert, self.gl_segs, self.gl_ssect, self.gl_nodes = \
+            [self._unpack_lump(class_, data)
+             for class_, data in zip(classes, (vert, segs, ssect, nodes))]
+
+    def gl_to_lumps(self):
+        """Encode the GL nodes loaded by load_gl, in the same version.
+        Returns a NameGroup with the GL_VERT, GL_SEGS, GL_SSECT and
+        GL_NODES lumps."""
+        version = self.gl_version
+        magic = {1: "", 2: "gNd2", 3: "gNd2", 4: "gNd4", 5: "gNd5"}[version]
+        magic3 = version == 3 and "gNd3" or ""
+        m = NameGroup()
+        m["GL_VERT"]  = Lump(magic  + join([x.pack() for x in self.gl_vert ]))
+        m["GL_SEGS"]  = Lump(magic3 + join([x.pack() for x in self.gl_segs ]))
+        m["GL_SSECT"] = Lump(magic3 + join([x.pack() for x in self.gl_ssect]))
+        m["GL_NODES"] = Lump(join([x.pack() for x in self.gl_nodes]))
+        return m
 
     def to_lumps(self):
+        if self.__dict__.get("_textmap") is not None:
+            return self._udmf_to_lumps()
         m = NameGroup()
-        
-        # change -1 to 0xFFFF so linedefs pack correctly
-        linedefs = self.linedefs[:]
-        for line in linedefs:
-            if line.front == -1: line.front = 0xFFFF
-            if line.back  == -1: line.back  = 0xFFFF
-        
         m["_HEADER_"] = Lump("")
-        m["VERTEXES"] = Lump(join([x.pack() for x in self.vertexes]))
-        m["THINGS"  ] = Lump(join([x.pack() for x in self.things  ]))
-        m["LINEDEFS"] = Lump(join([x.pack() for x in linedefs     ]))
-        m["SIDEDEFS"] = Lump(join([x.pack() for x in self.sidedefs]))
-        m["SECTORS" ] = Lump(join([x.pack() for x in self.sectors ]))
-        m["NODES"]    = Lump(join([x.pack() for x in self.nodes   ]))
-        m["SEGS"]     = Lump(join([x.pack() for x in self.segs    ]))
-        m["SSECTORS"] = Lump(join([x.pack() for x in self.ssectors]))
+        pending = self.__dict__.get("_pending", {})
+        extended = self.__dict__.get("nodes_format") in _znode_formats
+        for name, lumpname in _map_lists:
+            value = self.__dict__.get(name)
+            if extended and name in _znode_lists:
+                continue
+            if value is None and name in pending:
+                # never decoded, so the lump is still up to date
+                m[lumpname] = pending[name][1].copy()
+            elif isinstance(value, _TrackedList) and not value.dirty:
+                m[lumpname] = value.lump.copy()
+            elif name == "linedefs":
+                m[lumpname] = Lump(_pack_linedefs(self.linedefs))
+            else:
+                m[lumpname] = Lump(join([x.pack() for x in getattr(self, name)]))
+        if extended:
+            for lumpname, lump in self._pack_znodes().items():
+                m[lumpname] = lump
+        
         m["BLOCKMAP"] = self.blockmap
         m["REJECT"]   = self.reject
         
@@ -256,6 +806,81 @@ class MapEditor:
         
         return m
     
+    def _udmf_to_lumps(self):
+        m = NameGroup()
+        m["_HEADER_"] = Lump("")
+        names = [name for name, type in _udmf_lists] + ["udmf_blocks"]
+        if not [name for name in names if not self._unchanged(name)] and \
+           ("udmf_fields" not in self.__dict__ or
+            self.udmf_fields == self._textmap_fields):
+            m["TEXTMAP"] = self._textmap.copy()
+        else:
+            blocks = []
+            for name in names:
+                blocks += getattr(self, name)
+            m["TEXTMAP"] = Lump()
+            m["TEXTMAP"].source = _TextmapRef(self.udmf_fields, blocks)
+        for name, lump in self._udmf_lumps:
+            if name == "ZNODES":
+                if self.nodes_format in _znode_formats:
+                    m[name] = self._pack_znodes("ZNODES")["ZNODES"]
+            elif name == "BLOCKMAP":
+                m[name] = self.blockmap
+            elif name == "REJECT":
+                m[name] = self.reject
+            else:
+                m[name] = lump.copy()
+        m["ENDMAP"] = Lump("")
+        return m
+
+    def _pack_znodes(self, target=None):
+        """The NODES, SEGS and SSECTORS lumps for extended nodes: the
+        original ones if nothing has changed, else newly encoded. With
+        a target lump (ZNODES for UDMF maps), only that one."""
+        if target is None:
+            lumps = {"NODES": Lump(""), "SEGS": Lump(""), "SSECTORS": Lump("")}
+        else:
+            lumps = {target: Lump("")}
+        original = self.__dict__.get("_node_lumps")
+        if original is not None and original[0] == self.nodes_format and \
+           not [name for name in _znode_lists if not self._unchanged(name)]:
+            for lumpname, lump in original[1].items():
+                lumps[lumpname] = lump.copy()
+            return lumps
+        format = self.nodes_format
+        orgverts = self.nodes_orgverts
+        if orgverts is None:
+            orgverts = len(self.vertexes)
+        lumps[target or _znode_formats[format][3]] = Lump(pack_znodes(format,
+            orgverts, self.nodes_vertexes, self.ssectors,
+            self.segs, self.nodes))
+        return lumps
+
+    def sector_polygons(self, refresh=False):
+        """Reconstruct the outlines of all sectors from the linedefs.
+        Returns a list with one entry per sector, each a list of
+        (outer, holes) pairs: outer is a ring of vertex numbers going
+        clockwise, and holes the counter-clockwise rings inside it.
+        Outlines that do not close are left out.
+
+        The result is cached while vertexes, linedefs and sidedefs are
+        the lists decoded from the lumps and none of them has changed
+        (see the class documentation); otherwise, or with refresh=True,
+        the outlines are reconstructed."""
+        lists = self.vertexes, self.linedefs, self.sidedefs
+        cached = self.__dict__.get("_polygons")
+        if refresh or cached is None or cached[1] != len(self.sectors) or \
+           [a for a, b in zip(lists, cached[0]) if a is not b or a.dirty]:
+            polygons = _sector_polygons(self.vertexes, self.linedefs,
+                self.sidedefs, len(self.sectors))
+            cached = None
+            if not [a for a in lists
+                    if not isinstance(a, _TrackedList) or a.dirty]:
+                cached = lists, len(self.sectors), polygons
+            self._polygons = cached
+            return polygons
+        return cached[2]
+
     def draw_sector(self, vertexes, sector=None, sidedef=None):
         """Draw a polygon from a list of vertexes. The vertexes may be
         either Vertex objects or simple (x, y) tuples. A sector object
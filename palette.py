@@ -1,8 +1,55 @@
+import weakref
+from bisect  import bisect_left
+from hashlib import md5
 from struct  import pack, unpack
 from omg.util import *
-
+
+# NumPy is optional; it only speeds up batch color lookups.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Maximum number of entries kept in each memo table
+memo_size = 65536
+
+# Maximum number of entries kept in each table of exact lookups
+inverse_size = 262144
+
+# Memo tables shared by palettes with identical colors, keyed by
+# (digest, tran_index). Entries disappear with the last palette
+# using them.
+_memos = weakref.WeakValueDictionary()
+
+# Exact lookup tables of match_many, shared the same way, keyed by
+# (digest, tran_index, tran_color)
+_inverses = weakref.WeakValueDictionary()
+
+class _Inverse:
+    """Table of match_many results. With NumPy, `keys` is a sorted array
+    of the colors found so far as 0xRRGGBB integers and `values` the
+    array of their indices (both None until the first call). Without
+    it, `found` maps (r, g, b) tuples to index characters, and `order`
+    holds the palette sorted by red for searching it, or None until
+    the first search."""
+
+    def __init__(self):
+        self.keys = self.values = None
+        self.found = {}
+        self.order = None
+
+    def add(self, keys, values):
+        """Add colors (as integers) and their indices to the arrays,
+        keeping the entries already there."""
+        if self.keys is not None:
+            keys = numpy.concatenate((self.keys, keys))
+            values = numpy.concatenate((self.values, values))
+        keys, first = numpy.unique(keys, return_index=True)
+        self.keys = keys
+        self.values = values[first]
+
 class Palette:
-
+
     """Used for storing a list of colors and doing things with them
     (such as looking up the best match for arbitrary RGB values).
 
@@ -22,29 +69,37 @@ class Palette:
 
     The following fields are intended for internal use:
 
-        .memo         Table for RGB lookup memoization
+        .memo         Table for RGB lookup memoization (an LRUCache
+                      shared by all palettes with the same colors)
+        .inverse      Table of exact lookups made by match_many, shared
+                      the same way; it is kept across calls and can be
+                      given to other processes (see share_inverse)
+        .digest       MD5 digest of .bytes, identifying the colors
         .grays        List of indices of colors with zero saturation
         .bright_lut   Brightness LUT, used internally to speed up
-                      lookups (when not memoized).
+                      lookups (when not memoized). None until the
+                      first lookup; see build_lut.
     """
 
     def __init__(self, colors=None, tran_index=None, tran_color=None):
-
+
         """Creates a new Palette object. The 'colors' argument may be
         either a list of (r,g,b) tuples or an RGBRGBRGB... string.
         'tran_index' specifies the index in the palette where the 
         transparent color should be placed. Note that this is only used
         when saving images, and thus doesn't affect color lookups.
         'tran_color' is the color to use for transparency."""
-
-        colors = colors or default_colors
-        tran_index = tran_index or default_tran_index
-        tran_color = tran_color or default_tran_color
+
+
+        colors = colors or default_colors
+        tran_index = tran_index or default_tran_index
+        tran_color = tran_color or default_tran_color
 
         if isinstance(colors, list):
             self.colors = colors[:]
         elif isinstance(colors, str):
-            self.colors = [unpack('BBB', colors[i:i+3]) for i in xrange(0,768,3)]
+            b = bytearray(colors[:768])
+            self.colors = zip(b[0::3], b[1::3], b[2::3])
         else:
             raise TypeError, "Argument 'colors' must be list or string"
 
@@ -59,15 +114,27 @@ class Palette:
         # conversions significantly, in particular when converting
         # lots of graphics in one session. See docstring for build_lut
         # below for description of what bright_lut does.
-        self.memo = {}
-        self.bright_lut = []
+        self.memo = None
+        self.bright_lut = None
         self.reset_memo()
-        self.build_lut()
+
+    def __deepcopy__(self, memo):
+        """Copy the colors, but keep sharing the lookup tables."""
+        p = copy(self)
+        p.colors = self.colors[:]
+        p.grays = self.grays[:]
+        memo[id(self)] = p
+        return p
+
+    def copy(self):
+        """Returns a copy sharing the lookup tables with this palette."""
+        return deepcopy(self)
 
     def make_bytes(self):
-        """Create/update 'bytes' and 'save_bytes' from the current set of
-        colors and the 'tran_index' and 'tran_color' fields."""
-        self.bytes = "".join([pack('BBB', *rgb) for rgb in self.colors])
+        """Create/update 'bytes', 'save_bytes' and 'digest' from the current
+        set of colors and the 'tran_index' and 'tran_color' fields."""
+        self.bytes = str(bytearray([c for rgb in self.colors for c in rgb]))
+        self.digest = md5(self.bytes).digest()
         self.save_bytes = \
             self.bytes[:self.tran_index*3] + \
             pack('BBB', *self.tran_color) + \
@@ -78,13 +145,42 @@ class Palette:
         in the current set of colors"""
         self.grays = [i for i, rgb in enumerate(self.colors) \
             if (rgb[0]==rgb[1]==rgb[2])]
-
+
     def reset_memo(self):
-        """Clear the memo table (but (re)add the palette's colors)"""
-        self.memo = {}
-        for i in xrange(len(self.colors)):
-            if i != self.tran_index:
-                self.memo[self.colors[i]] = i
+        """Attach the memo table for the current set of colors, creating
+        it (with the palette's colors added) if no other palette with
+        the same colors is alive."""
+        key = (self.digest, self.tran_index)
+        self.memo = _memos.get(key)
+        if self.memo is None:
+            self.memo = _memos[key] = LRUCache(memo_size)
+            for i in xrange(len(self.colors)):
+                if i != self.tran_index:
+                    self.memo[self.colors[i]] = i
+        key += (tuple(self.tran_color),)
+        self.inverse = _inverses.get(key)
+        if self.inverse is None:
+            self.inverse = _inverses[key] = _Inverse()
+
+    def share_inverse(self):
+        """Returns what a palette with the same colors in another
+        process needs to start from this palette's exact lookups:
+        pass it to update_inverse there."""
+        table = self.inverse
+        return dict(table.found), table.keys, table.values
+
+    def update_inverse(self, shared):
+        """Add exact lookups made by another palette with the same
+        colors (see share_inverse)."""
+        found, keys, values = shared
+        self.inverse.found.update(found)
+        if keys is not None:
+            self.inverse.add(keys, values)
+
+    def memo_stats(self):
+        """Returns a (hits, misses, size, maxsize) tuple for the
+        memo table."""
+        return self.memo.stats()
 
     def build_lut(self, distance=16):
         """Build 256-entry LUT for looking up colors in the palette
@@ -97,47 +193,40 @@ class Palette:
         but worse precision.
 
         A good value for Doom is 10. Anything over 32 only wastes time.
+
+        The LUT is built automatically (with the default distance) on
+        the first lookup, and shared by all palettes with the same
+        colors. Returns the LUT.
         """
-        self.bright_lut = []
         assert 0 <= distance <= 256
-        for level in xrange(256):
-            candidates = []
-            for j, rgb in enumerate(self.colors):
-                if abs(level - (sum(rgb) // 3)) < distance:
-                    candidates.append(j)
-            # Make sure each entry contains at least one gray
-            # color that can be relied on in the worst case
-            best_d = 256
-            best_i = 0
-            for gray_index in self.grays:
-                r, g, b = self.colors[gray_index]
-                dist = abs(r - level)
-                if dist < best_d:
-                    best_i = gray_index
-                    if dist == 0:
-                        break
-                    best_d = dist
-            if best_i not in candidates:
-                candidates.append(best_i)
-            self.bright_lut.append(candidates)
-
+        key = (self.digest, distance)
+        lut = _luts.get(key)
+        if lut is None:
+            lut = _luts[key] = _make_lut(self.colors, self.grays, distance)
+        self.bright_lut = lut
+        return lut
+
     def match(self, color):
         """Find the closest match in the palette for a color.
         Takes an (r,g,b) tuple as argument and returns a palette index."""
         if color == self.tran_color:
             return self.tran_index
-        if color in self.memo:
-            return self.memo[color]
+        best_i = self.memo.get(color)
+        if best_i is not None:
+            return best_i
+        lut = self.bright_lut
+        if lut is None:
+            lut = self.build_lut()
         best_dist = 262144
         best_i = 0
         ar, ag, ab = color
-        candidates = self.bright_lut[int(sum(color)) // 3]
+        candidates = lut[int(sum(color)) // 3]
         for i in candidates:
             br, bg, bb = self.colors[i]
-            dr = ar-br
-            dg = ag-bg
-            db = ab-bb
-            dist = dr*dr + dg*dg + db*db
+            dr = ar-br
+            dg = ag-bg
+            db = ab-bb
+            dist = dr*dr + dg*dg + db*db
             if dist < best_dist:
                 if dist == 0:
                     return i
@@ -146,6 +235,115 @@ class Palette:
         self.memo[color] = best_i
         return best_i
 
+    def match_many(self, colors):
+        """Find the closest matches in the palette for many colors at
+        once. 'colors' may be a sequence of (r,g,b) tuples, an RGBRGB...
+        string or a NumPy array with RGB triples along its last axis.
+        Returns a string of palette indices (or, for NumPy input, an
+        array of uint8 indices shaped like the input minus its last axis).
+
+        Unlike match(), the search is exact: each color maps to the
+        palette entry at the smallest Euclidean distance (the lowest
+        index on ties). The transparency color still maps to
+        'tran_index'."""
+        if numpy is not None:
+            if isinstance(colors, numpy.ndarray):
+                return self._match_array(colors)
+            if isinstance(colors, (str, bytearray, buffer)):
+                a = numpy.frombuffer(colors, numpy.uint8)
+                return self._match_array(a[:len(a)//3*3]).tostring()
+            a = numpy.array(colors, numpy.int32).reshape(-1, 3)
+            return self._match_array(a).tostring()
+        if isinstance(colors, (str, bytearray, buffer)):
+            b = bytearray(colors)
+            colors = zip(b[0::3], b[1::3], b[2::3])
+        # Pure Python: search each distinct color once, scanning the
+        # palette sorted by red outwards from the color's red value
+        # until the red difference alone exceeds the best distance.
+        # The results are kept for the next call, up to inverse_size
+        table = self.inverse
+        if table.order is None:
+            order = sorted((rgb[0], i) for i, rgb in enumerate(self.colors))
+            table.order = ([r for r, i in order],
+                           [self.colors[i] for r, i in order],
+                           [i for r, i in order])
+        reds, pal, index = table.order
+        found = table.found
+        n = len(reds)
+        if len(found) > inverse_size:
+            found.clear()
+        found[tuple(self.tran_color)] = chr(self.tran_index)
+        out = []
+        for color in colors:
+            color = tuple(color)
+            c = found.get(color)
+            if c is None:
+                ar, ag, ab = color
+                best_dist = 262144
+                best_i = 0
+                lo = bisect_left(reds, ar) - 1
+                hi = lo + 1
+                while lo >= 0 or hi < n:
+                    for j in (lo, hi):
+                        if not 0 <= j < n:
+                            continue
+                        br, bg, bb = pal[j]
+                        dist = (ar-br)**2 + (ag-bg)**2 + (ab-bb)**2
+                        if dist < best_dist or \
+                           (dist == best_dist and index[j] < best_i):
+                            best_dist = dist
+                            best_i = index[j]
+                    lo -= 1
+                    hi += 1
+                    if (lo < 0 or (ar-reds[lo])**2 > best_dist) and \
+                       (hi >= n or (reds[hi]-ar)**2 > best_dist):
+                        break
+                c = found[color] = chr(best_i)
+            out.append(c)
+        return join(out)
+
+    def _match_array(self, colors, chunk=1024):
+        """match_many for a NumPy array."""
+        shape = colors.shape[:-1] if colors.ndim > 1 else (-1,)
+        keys = colors.reshape(-1, 3).astype(numpy.int32)
+        keys = (keys[:,0] << 16) | (keys[:,1] << 8) | keys[:,2]
+        uniq, inverse = numpy.unique(keys, return_inverse=True)
+        # Colors found by earlier calls come from the table of exact
+        # lookups; only the others are searched, and added to it
+        table = self.inverse
+        if table.keys is None or len(table.keys) > inverse_size:
+            r, g, b = self.tran_color
+            table.keys = numpy.array([(r << 16) | (g << 8) | b], numpy.int32)
+            table.values = numpy.array([self.tran_index], numpy.uint8)
+        pos = numpy.minimum(numpy.searchsorted(table.keys, uniq),
+                            len(table.keys) - 1)
+        result = table.values[pos]
+        new = table.keys[pos] != uniq
+        if new.any():
+            rgb = uniq[new]
+            rgb = numpy.column_stack((rgb >> 16, (rgb >> 8) & 255, rgb & 255))
+            best = self._search(rgb.astype(numpy.float64), chunk)
+            result[new] = best
+            table.add(uniq[new], best)
+        return result[inverse].reshape(shape)
+
+    def _search(self, rgb, chunk):
+        """Indices of the nearest palette entries to an (n, 3) array of
+        colors, by brute force over the whole palette. The distance
+        |c-p|^2 = |c|^2 - 2c.p + |p|^2 is compared without the |c|^2
+        term, which is the same for every entry; all the values are
+        whole numbers well within the exact range of doubles, so the
+        comparison and the ties come out as with the plain distance."""
+        pal = numpy.array(self.colors, numpy.float64)
+        norms = (pal*pal).sum(axis=1)
+        pal2 = -2 * pal.T
+        best = numpy.empty(len(rgb), numpy.uint8)
+        # in chunks to bound the size of the distance matrix
+        for start in xrange(0, len(rgb), chunk):
+            dist = numpy.dot(rgb[start:start+chunk], pal2) + norms
+            best[start:start+chunk] = dist.argmin(axis=1)
+        return best
+
     def blend(self, color, intensity=0.5):
         """Blend the entire palette against a color (given as an RGB triple).
         Intensity must be a floating-point number in the range 0-1."""
@@ -162,62 +360,88 @@ class Palette:
         self.make_bytes()
         self.make_grays()
         self.reset_memo()
-        self.build_lut()
-
-# Colors of the Doom palette, used by default
-default_colors = (
-   "\x00\x00\x00\x1f\x17\x0b\x17\x0f\x07\x4b\x4b\x4b\xff\xff\xff\x1b"
-   "\x1b\x1b\x13\x13\x13\x0b\x0b\x0b\x07\x07\x07\x2f\x37\x1f\x23\x2b"
-   "\x0f\x17\x1f\x07\x0f\x17\x00\x4f\x3b\x2b\x47\x33\x23\x3f\x2b\x1b"
-   "\xff\xb7\xb7\xf7\xab\xab\xf3\xa3\xa3\xeb\x97\x97\xe7\x8f\x8f\xdf"
-   "\x87\x87\xdb\x7b\x7b\xd3\x73\x73\xcb\x6b\x6b\xc7\x63\x63\xbf\x5b"
-   "\x5b\xbb\x57\x57\xb3\x4f\x4f\xaf\x47\x47\xa7\x3f\x3f\xa3\x3b\x3b"
-   "\x9b\x33\x33\x97\x2f\x2f\x8f\x2b\x2b\x8b\x23\x23\x83\x1f\x1f\x7f"
-   "\x1b\x1b\x77\x17\x17\x73\x13\x13\x6b\x0f\x0f\x67\x0b\x0b\x5f\x07"
-   "\x07\x5b\x07\x07\x53\x07\x07\x4f\x00\x00\x47\x00\x00\x43\x00\x00"
-   "\xff\xeb\xdf\xff\xe3\xd3\xff\xdb\xc7\xff\xd3\xbb\xff\xcf\xb3\xff"
-   "\xc7\xa7\xff\xbf\x9b\xff\xbb\x93\xff\xb3\x83\xf7\xab\x7b\xef\xa3"
-   "\x73\xe7\x9b\x6b\xdf\x93\x63\xd7\x8b\x5b\xcf\x83\x53\xcb\x7f\x4f"
-   "\xbf\x7b\x4b\xb3\x73\x47\xab\x6f\x43\xa3\x6b\x3f\x9b\x63\x3b\x8f"
-   "\x5f\x37\x87\x57\x33\x7f\x53\x2f\x77\x4f\x2b\x6b\x47\x27\x5f\x43"
-   "\x23\x53\x3f\x1f\x4b\x37\x1b\x3f\x2f\x17\x33\x2b\x13\x2b\x23\x0f"
-   "\xef\xef\xef\xe7\xe7\xe7\xdf\xdf\xdf\xdb\xdb\xdb\xd3\xd3\xd3\xcb"
-   "\xcb\xcb\xc7\xc7\xc7\xbf\xbf\xbf\xb7\xb7\xb7\xb3\xb3\xb3\xab\xab"
-   "\xab\xa7\xa7\xa7\x9f\x9f\x9f\x97\x97\x97\x93\x93\x93\x8b\x8b\x8b"
-   "\x83\x83\x83\x7f\x7f\x7f\x77\x77\x77\x6f\x6f\x6f\x6b\x6b\x6b\x63"
-   "\x63\x63\x5b\x5b\x5b\x57\x57\x57\x4f\x4f\x4f\x47\x47\x47\x43\x43"
-   "\x43\x3b\x3b\x3b\x37\x37\x37\x2f\x2f\x2f\x27\x27\x27\x23\x23\x23"
-   "\x77\xff\x6f\x6f\xef\x67\x67\xdf\x5f\x5f\xcf\x57\x5b\xbf\x4f\x53"
-   "\xaf\x47\x4b\x9f\x3f\x43\x93\x37\x3f\x83\x2f\x37\x73\x2b\x2f\x63"
-   "\x23\x27\x53\x1b\x1f\x43\x17\x17\x33\x0f\x13\x23\x0b\x0b\x17\x07"
-   "\xbf\xa7\x8f\xb7\x9f\x87\xaf\x97\x7f\xa7\x8f\x77\x9f\x87\x6f\x9b"
-   "\x7f\x6b\x93\x7b\x63\x8b\x73\x5b\x83\x6b\x57\x7b\x63\x4f\x77\x5f"
-   "\x4b\x6f\x57\x43\x67\x53\x3f\x5f\x4b\x37\x57\x43\x33\x53\x3f\x2f"
-   "\x9f\x83\x63\x8f\x77\x53\x83\x6b\x4b\x77\x5f\x3f\x67\x53\x33\x5b"
-   "\x47\x2b\x4f\x3b\x23\x43\x33\x1b\x7b\x7f\x63\x6f\x73\x57\x67\x6b"
-   "\x4f\x5b\x63\x47\x53\x57\x3b\x47\x4f\x33\x3f\x47\x2b\x37\x3f\x27"
-   "\xff\xff\x73\xeb\xdb\x57\xd7\xbb\x43\xc3\x9b\x2f\xaf\x7b\x1f\x9b"
-   "\x5b\x13\x87\x43\x07\x73\x2b\x00\xff\xff\xff\xff\xdb\xdb\xff\xbb"
-   "\xbb\xff\x9b\x9b\xff\x7b\x7b\xff\x5f\x5f\xff\x3f\x3f\xff\x1f\x1f"
-   "\xff\x00\x00\xef\x00\x00\xe3\x00\x00\xd7\x00\x00\xcb\x00\x00\xbf"
-   "\x00\x00\xb3\x00\x00\xa7\x00\x00\x9b\x00\x00\x8b\x00\x00\x7f\x00"
-   "\x00\x73\x00\x00\x67\x00\x00\x5b\x00\x00\x4f\x00\x00\x43\x00\x00"
-   "\xe7\xe7\xff\xc7\xc7\xff\xab\xab\xff\x8f\x8f\xff\x73\x73\xff\x53"
-   "\x53\xff\x37\x37\xff\x1b\x1b\xff\x00\x00\xff\x00\x00\xe3\x00\x00"
-   "\xcb\x00\x00\xb3\x00\x00\x9b\x00\x00\x83\x00\x00\x6b\x00\x00\x53"
-   "\xff\xff\xff\xff\xeb\xdb\xff\xd7\xbb\xff\xc7\x9b\xff\xb3\x7b\xff"
-   "\xa3\x5b\xff\x8f\x3b\xff\x7f\x1b\xf3\x73\x17\xeb\x6f\x0f\xdf\x67"
-   "\x0f\xd7\x5f\x0b\xcb\x57\x07\xc3\x4f\x00\xb7\x47\x00\xaf\x43\x00"
-   "\xff\xff\xff\xff\xff\xd7\xff\xff\xb3\xff\xff\x8f\xff\xff\x6b\xff"
-   "\xff\x47\xff\xff\x23\xff\xff\x00\xa7\x3f\x00\x9f\x37\x00\x93\x2f"
-   "\x00\x87\x23\x00\x4f\x3b\x27\x43\x2f\x1b\x37\x23\x13\x2f\x1b\x0b"
-   "\x00\x00\x53\x00\x00\x47\x00\x00\x3b\x00\x00\x2f\x00\x00\x23\x00"
-   "\x00\x17\x00\x00\x0b\x00\x00\x00\xff\x9f\x43\xff\xe7\x4b\xff\x7b"
-   "\xff\xff\x00\xff\xcf\x00\xcf\x9f\x00\x9b\x6f\x00\x6b\xa7\x6b\x6b"
-)
-
-# Defaults for image transparency
-default_tran_index = 247
+        self.bright_lut = None
+
+# Brightness LUTs, keyed by (digest, distance)
+_luts = LRUCache(64)
+
+def _make_lut(colors, grays, distance):
+    """Build the brightness LUT described in Palette.build_lut."""
+    # Sort the colors into buckets by brightness, so each level only
+    # has to look at the buckets within the distance
+    buckets = [[] for level in xrange(256)]
+    for i, (r, g, b) in enumerate(colors):
+        buckets[(r + g + b) // 3].append(i)
+    lut = []
+    for level in xrange(256):
+        candidates = []
+        for bucket in buckets[max(0, level-distance+1):level+distance]:
+            candidates.extend(bucket)
+        candidates.sort()
+        # Make sure each entry contains at least one gray
+        # color that can be relied on in the worst case
+        best_i = 0
+        if grays:
+            best_i = min(grays, key=lambda i: abs(colors[i][0] - level))
+        if best_i not in candidates:
+            candidates.append(best_i)
+        lut.append(candidates)
+    return lut
+
+# Colors of the Doom palette, used by default
+default_colors = (
+   "\x00\x00\x00\x1f\x17\x0b\x17\x0f\x07\x4b\x4b\x4b\xff\xff\xff\x1b"
+   "\x1b\x1b\x13\x13\x13\x0b\x0b\x0b\x07\x07\x07\x2f\x37\x1f\x23\x2b"
+   "\x0f\x17\x1f\x07\x0f\x17\x00\x4f\x3b\x2b\x47\x33\x23\x3f\x2b\x1b"
+   "\xff\xb7\xb7\xf7\xab\xab\xf3\xa3\xa3\xeb\x97\x97\xe7\x8f\x8f\xdf"
+   "\x87\x87\xdb\x7b\x7b\xd3\x73\x73\xcb\x6b\x6b\xc7\x63\x63\xbf\x5b"
+   "\x5b\xbb\x57\x57\xb3\x4f\x4f\xaf\x47\x47\xa7\x3f\x3f\xa3\x3b\x3b"
+   "\x9b\x33\x33\x97\x2f\x2f\x8f\x2b\x2b\x8b\x23\x23\x83\x1f\x1f\x7f"
+   "\x1b\x1b\x77\x17\x17\x73\x13\x13\x6b\x0f\x0f\x67\x0b\x0b\x5f\x07"
+   "\x07\x5b\x07\x07\x53\x07\x07\x4f\x00\x00\x47\x00\x00\x43\x00\x00"
+   "\xff\xeb\xdf\xff\xe3\xd3\xff\xdb\xc7\xff\xd3\xbb\xff\xcf\xb3\xff"
+   "\xc7\xa7\xff\xbf\x9b\xff\xbb\x93\xff\xb3\x83\xf7\xab\x7b\xef\xa3"
+   "\x73\xe7\x9b\x6b\xdf\x93\x63\xd7\x8b\x5b\xcf\x83\x53\xcb\x7f\x4f"
+   "\xbf\x7b\x4b\xb3\x73\x47\xab\x6f\x43\xa3\x6b\x3f\x9b\x63\x3b\x8f"
+   "\x5f\x37\x87\x57\x33\x7f\x53\x2f\x77\x4f\x2b\x6b\x47\x27\x5f\x43"
+   "\x23\x53\x3f\x1f\x4b\x37\x1b\x3f\x2f\x17\x33\x2b\x13\x2b\x23\x0f"
+   "\xef\xef\xef\xe7\xe7\xe7\xdf\xdf\xdf\xdb\xdb\xdb\xd3\xd3\xd3\xcb"
+   "\xcb\xcb\xc7\xc7\xc7\xbf\xbf\xbf\xb7\xb7\xb7\xb3\xb3\xb3\xab\xab"
+   "\xab\xa7\xa7\xa7\x9f\x9f\x9f\x97\x97\x97\x93\x93\x93\x8b\x8b\x8b"
+   "\x83\x83\x83\x7f\x7f\x7f\x77\x77\x77\x6f\x6f\x6f\x6b\x6b\x6b\x63"
+   "\x63\x63\x5b\x5b\x5b\x57\x57\x57\x4f\x4f\x4f\x47\x47\x47\x43\x43"
+   "\x43\x3b\x3b\x3b\x37\x37\x37\x2f\x2f\x2f\x27\x27\x27\x23\x23\x23"
+   "\x77\xff\x6f\x6f\xef\x67\x67\xdf\x5f\x5f\xcf\x57\x5b\xbf\x4f\x53"
+   "\xaf\x47\x4b\x9f\x3f\x43\x93\x37\x3f\x83\x2f\x37\x73\x2b\x2f\x63"
+   "\x23\x27\x53\x1b\x1f\x43\x17\x17\x33\x0f\x13\x23\x0b\x0b\x17\x07"
+   "\xbf\xa7\x8f\xb7\x9f\x87\xaf\x97\x7f\xa7\x8f\x77\x9f\x87\x6f\x9b"
+   "\x7f\x6b\x93\x7b\x63\x8b\x73\x5b\x83\x6b\x57\x7b\x63\x4f\x77\x5f"
+   "\x4b\x6f\x57\x43\x67\x53\x3f\x5f\x4b\x37\x57\x43\x33\x53\x3f\x2f"
+   "\x9f\x83\x63\x8f\x77\x53\x83\x6b\x4b\x77\x5f\x3f\x67\x53\x33\x5b"
+   "\x47\x2b\x4f\x3b\x23\x43\x33\x1b\x7b\x7f\x63\x6f\x73\x57\x67\x6b"
+   "\x4f\x5b\x63\x47\x53\x57\x3b\x47\x4f\x33\x3f\x47\x2b\x37\x3f\x27"
+   "\xff\xff\x73\xeb\xdb\x57\xd7\xbb\x43\xc3\x9b\x2f\xaf\x7b\x1f\x9b"
+   "\x5b\x13\x87\x43\x07\x73\x2b\x00\xff\xff\xff\xff\xdb\xdb\xff\xbb"
+   "\xbb\xff\x9b\x9b\xff\x7b\x7b\xff\x5f\x5f\xff\x3f\x3f\xff\x1f\x1f"
+   "\xff\x00\x00\xef\x00\x00\xe3\x00\x00\xd7\x00\x00\xcb\x00\x00\xbf"
+   "\x00\x00\xb3\x00\x00\xa7\x00\x00\x9b\x00\x00\x8b\x00\x00\x7f\x00"
+   "\x00\x73\x00\x00\x67\x00\x00\x5b\x00\x00\x4f\x00\x00\x43\x00\x00"
+   "\xe7\xe7\xff\xc7\xc7\xff\xab\xab\xff\x8f\x8f\xff\x73\x73\xff\x53"
+   "\x53\xff\x37\x37\xff\x1b\x1b\xff\x00\x00\xff\x00\x00\xe3\x00\x00"
+   "\xcb\x00\x00\xb3\x00\x00\x9b\x00\x00\x83\x00\x00\x6b\x00\x00\x53"
+   "\xff\xff\xff\xff\xeb\xdb\xff\xd7\xbb\xff\xc7\x9b\xff\xb3\x7b\xff"
+   "\xa3\x5b\xff\x8f\x3b\xff\x7f\x1b\xf3\x73\x17\xeb\x6f\x0f\xdf\x67"
+   "\x0f\xd7\x5f\x0b\xcb\x57\x07\xc3\x4f\x00\xb7\x47\x00\xaf\x43\x00"
+   "\xff\xff\xff\xff\xff\xd7\xff\xff\xb3\xff\xff\x8f\xff\xff\x6b\xff"
+   "\xff\x47\xff\xff\x23\xff\xff\x00\xa7\x3f\x00\x9f\x37\x00\x93\x2f"
+   "\x00\x87\x23\x00\x4f\x3b\x27\x43\x2f\x1b\x37\x23\x13\x2f\x1b\x0b"
+   "\x00\x00\x53\x00\x00\x47\x00\x00\x3b\x00\x00\x2f\x00\x00\x23\x00"
+   "\x00\x17\x00\x00\x0b\x00\x00\x00\xff\x9f\x43\xff\xe7\x4b\xff\x7b"
+   "\xff\xff\x00\xff\xcf\x00\xcf\x9f\x00\x9b\x6f\x00\x6b\xa7\x6b\x6b"
+)
+
+# Defaults for image transparency
+default_tran_index = 247
 default_tran_color = (255, 0, 255)
 
 # Default palette object, using the default values
@@ -1,4 +1,5 @@
 from omg.lump import Lump
+from omg.util import *
 import omg.palette
 
 class Playpal:
@@ -58,6 +59,7 @@ class Playpal:
 
     def set_base(self, palette=None):
         """Set all palettes to copies of a given Palette object. If the
-        palette parameter is not provided, the default palette is used."""
+        palette parameter is not provided, the default palette is used.
+        The copies share their lookup tables until blended."""
         palette = palette or omg.palette.default
-        self.palettes = [deepcopy(palette) for i in range(14)]
+        self.palettes = [palette.copy() for i in range(14)]
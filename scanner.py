@@ -0,0 +1,154 @@
+"""
+Statistics for whole directory trees of WAD files.
+
+scan() walks directories and reads, in a pool of worker processes,
+only what it needs from each WAD: the directory, the VERTEXES lump of
+every map for its bounding box, and the first bytes of the node lumps
+to tell their format. Every other count comes from the lump sizes.
+One dict per WAD is returned as soon as it is ready, and write_jsonl()
+writes them out as JSON Lines, so memory use does not grow with the
+size of the collection.
+"""
+
+import os
+import sys
+from array import array
+from omg.util import *
+from omg.wadio import _read_directory
+from omg.catalog import find_maps
+from omg.mapedit import Vertex, Thing, ZThing, Linedef, ZLinedef, \
+    Sidedef, Sector, Seg, SubSector, Node
+
+# Signatures at the start of NODES/SSECTORS (ZDoom extended nodes),
+# GL_VERT (glBSP) and NODES (DeePBSP)
+_node_signatures = ['XNOD', 'ZNOD', 'XGLN', 'ZGLN', 'XGL2', 'ZGL2',
+                    'XGL3', 'ZGL3', 'xNd4']
+_gl_signatures = ['gNd2', 'gNd3', 'gNd4', 'gNd5']
+
+def _bounds(data):
+    """Bounding box (left, right, bottom, top) of VERTEXES data."""
+    v = array('h')
+    v.fromstring(data[:len(data) // 4 * 4])
+    if sys.byteorder == 'big':
+        v.byteswap()
+    if not v:
+        return None
+    xs, ys = v[0::2], v[1::2]
+    return [min(xs), max(xs), min(ys), max(ys)]
+
+def _node_format(signatures):
+    """Name the node format from the first bytes of NODES, SSECTORS
+    and GL_VERT."""
+    nodes, ssectors, gl_vert = signatures
+    if nodes in _node_signatures:
+        return nodes
+    if ssectors in _node_signatures:
+        return ssectors
+    if gl_vert in _gl_signatures:
+        return gl_vert
+    if nodes is None:
+        return None
+    return 'doom'
+
+def map_stats(f, entries, position, count, format):
+    """Statistics of the map whose header is entries[position], read
+    from the open file f."""
+    lumps = dict((e.name, e) for e in entries[position+1:position+1+count])
+    def size(name, record):
+        return name in lumps and lumps[name].size // record._fmtsize or 0
+    def head(entry, n=4):
+        if entry is None or entry.size < n:
+            return None
+        f.seek(entry.ptr)
+        return f.read(n)
+    if format == 'udmf':
+        # the counts would need the TEXTMAP to be parsed
+        stats = dict.fromkeys(["things", "linedefs", "sidedefs", "vertexes",
+            "sectors", "segs", "ssectors", "nodes", "bbox"])
+        stats["name"] = entries[position].name
+        stats["format"] = format
+        stats["node_format"] = _node_format([head(lumps.get("ZNODES")), None, None])
+        return stats
+    hexen = format == 'hexen'
+    stats = {
+        "name":     entries[position].name,
+        "format":   format,
+        "things":   size("THINGS", hexen and ZThing or Thing),
+        "linedefs": size("LINEDEFS", hexen and ZLinedef or Linedef),
+        "sidedefs": size("SIDEDEFS", Sidedef),
+        "vertexes": size("VERTEXES", Vertex),
+        "sectors":  size("SECTORS", Sector),
+        "segs":     size("SEGS", Seg),
+        "ssectors": size("SSECTORS", SubSector),
+        "nodes":    size("NODES", Node),
+        "bbox":     None,
+    }
+    if "VERTEXES" in lumps:
+        f.seek(lumps["VERTEXES"].ptr)
+        stats["bbox"] = _bounds(f.read(lumps["VERTEXES"].size))
+    # --- GL nodes are in a GL_ map right after the map, if anywhere ---
+    gl_vert = None
+    after = position + 1 + count
+    if after < len(entries) and entries[after].name == "GL_" + stats["name"][:5]:
+        for e in entries[after+1:after+5]:
+            if e.name == "GL_VERT":
+                gl_vert = e
+    stats["node_format"] = _node_format([head(lumps.get("NODES")),
+        head(lumps.get("SSECTORS")), head(gl_vert)])
+    if stats["node_format"] not in (None, 'doom'):
+        # the extended formats reuse the lumps, so the sizes say nothing
+        stats["segs"] = stats["ssectors"] = stats["nodes"] = None
+    return stats
+
+def wad_stats(filename):
+    """Return a dict of statistics for a WAD file: path, size, type,
+    number of lumps and a list of map statistics (see map_stats). If
+    the file cannot be read the dict has an 'error' entry instead."""
+    stats = {"path": filename}
+    try:
+        f = open(filename, 'rb')
+        try:
+            stats["size"] = os.fstat(f.fileno())[6]
+            header, entries = _read_directory(f)
+            stats["type"] = header.type
+            stats["lumps"] = len(entries)
+            stats["maps"] = [map_stats(f, entries, position, count, format)
+                for position, name, format, count in find_maps([e.name for e in entries])
+                if format != 'gl']
+        finally:
+            f.close()
+    except (IOError, OSError), e:
+        stats["error"] = str(e)
+    return stats
+
+def find_wads(paths, pattern="*.[wW][aA][dD]"):
+    """Generate the files matching pattern under the given files and
+    directories, walking the directories lazily."""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if wccmp(name, pattern):
+                    yield os.path.join(dirpath, name)
+
+def scan(paths, workers=None, pattern="*.[wW][aA][dD]"):
+    """Compute wad_stats for every WAD under the given files and
+    directories in a pool of worker processes. Returns an iterator
+    over the results in the order they complete."""
+    return parallel_map(wad_stats, find_wads(paths, pattern), workers,
+        chunksize=4, ordered=False)
+
+def write_jsonl(results, out):
+    """Write an iterable of dicts to a file object as JSON Lines,
+    one at a time. Returns the number of lines written."""
+    import json
+    n = 0
+    for stats in results:
+        out.write(json.dumps(stats, sort_keys=True) + "\n")
+        n += 1
+    return n
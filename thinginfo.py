@@ -1,28 +1,93 @@
 # Map thing types... this needs to be expanded
 
+from collections import Counter
+from struct      import unpack
+
+# NumPy is optional; it only speeds up classify().
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Map descriptions to numbers and vice versa
 all_desc2num = {}
 all_num2desc = {}
 
+# All categories, in order of creation
+categories = []
+
+# Category bit mask for every thing type; bit n is set if the type
+# belongs to categories[n]. The masks are Python integers, so there
+# is no limit on the number of categories.
+type_bits = [0] * 65536
+
 class ThingCategory:
-    def __init__(self, table):
+    def __init__(self, table, name=None):
         global all_desc2num
         global all_num2desc
         rev = dict([(b, a) for a, b in table.items()])
         all_desc2num.update(table)
         all_num2desc.update(rev)
         self.table = dict([(x, None) for x in table])
+        self.name = name
+        self.bit = 1 << len(categories)
+        categories.append(self)
+        for num in table.values():
+            type_bits[num] |= self.bit
     def __contains__(self, item):
-        global all_desc2num
-        global all_num2desc
         if isinstance(item, str):
             return item in self.table
-        elif isinstance(item, int):
-            return all_num2desc[item] in self.table
+        elif isinstance(item, (int, long)):
+            return 0 <= item < 65536 and bool(type_bits[item] & self.bit)
         else:
             raise TypeError
 
+def classify(things, hexen=False):
+    """Count things per category and skill level. 'things' may be a
+    list of Thing/ZThing objects (e.g. MapEditor.things) or the raw
+    data of a THINGS lump; in the latter case 'hexen' selects the
+    Hexen format. Returns a dict mapping each category name, and
+    "unknown" for things in no category, to a dict of "total",
+    "easy", "medium" and "hard" counts. Categories created without
+    a name are left out."""
+    if isinstance(things, str):
+        # All thing fields up to the flags are 16-bit
+        step, index = (10, 5) if hexen else (5, 3)
+        count = len(things) // (step*2)
+        shorts = unpack('<%iH' % (count*step), things[:count*step*2])
+        types, flags = shorts[index::step], shorts[index+1::step]
+    else:
+        types = [t.type for t in things]
+        flags = [t.flags for t in things]
+    # Count things by (type, skill flags), then distribute the counts
+    if numpy is not None:
+        keys = numpy.array(types, numpy.int64) << 3
+        keys |= numpy.array(flags, numpy.int64) & 7
+        counts = numpy.bincount(keys, minlength=8)
+        pairs = [(int(k) >> 3, int(k) & 7, int(counts[k]))
+            for k in numpy.flatnonzero(counts)]
+    else:
+        pairs = [(k >> 3, k & 7, n) for k, n in
+            Counter([(t << 3) | (f & 7) for t, f in zip(types, flags)]).items()]
+    named = [c for c in categories if c.name]
+    stats = {}
+    for name in [c.name for c in named] + ["unknown"]:
+        stats[name] = {"total":0, "easy":0, "medium":0, "hard":0}
+    for type, skill, n in pairs:
+        bits = type_bits[type]
+        for c in named:
+            if bits & c.bit:
+                _count(stats[c.name], skill, n)
+        if not bits:
+            _count(stats["unknown"], skill, n)
+    return stats
+
+def _count(entry, skill, n):
+    entry["total"] += n
+    if skill & 1: entry["easy"] += n
+    if skill & 2: entry["medium"] += n
+    if skill & 4: entry["hard"] += n
+
 monsters = ThingCategory({
   "zombie":3004,
   "sergeant":9,
@@ -46,7 +111,7 @@ monsters = ThingCategory({
   "spawn shooter":89,
   "romero head":88,
   "commander keen":72
-})
+}, "monsters")
 
 weapons = ThingCategory({
   "shotgun":2001,
@@ -56,7 +121,7 @@ weapons = ThingCategory({
   "plasma gun":2004,
   "chainsaw":2005,
   "bfg 9000":2006
-})
+}, "weapons")
 
 ammo = ThingCategory({
   "ammo clip":2007,
@@ -68,7 +133,7 @@ ammo = ThingCategory({
   "cell charge":2047,
   "cell pack":17,
   "backpack":8
-})
+}, "ammo")
 
 powerups = ThingCategory({
   "stimpack":2011,
@@ -85,7 +150,7 @@ powerups = ThingCategory({
   "computer map":2026,
   "goggles":2048,
   "megasphere":83
-})
+}, "powerups")
 
 keys = ThingCategory({
   "red keycard":13,
@@ -94,7 +159,7 @@ keys = ThingCategory({
   "red skull key":38,
   "yellow skull key":39,
   "blue skull key":40
-})
+}, "keys")
 
 starts = ThingCategory({
   "player 1 start":1,
@@ -103,7 +168,7 @@ starts = ThingCategory({
   "player 4 start":4,
   "deathmatch start":11,
   "teleport destination":14
-})
+}, "starts")
 
 """
 doom2_only = ThingCategory([
@@ -151,7 +216,7 @@ corpses = ThingCategory({
   "hangman 3 (passable)":61,
   "hangman 5 (passable)":62,
   "hangman 1 (passable)":63
-})
+}, "corpses")
 
 decorations = ThingCategory({
   "green pillar":30,
@@ -176,4 +241,4 @@ decorations = ThingCategory({
   "short red torch":57,
   "floor lamp":2028,
   "barrel":2035
-})
\ No newline at end of file
+}, "decorations")
\ No newline at end of file
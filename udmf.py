@@ -0,0 +1,238 @@
+"""
+Reading and writing UDMF maps (the TEXTMAP lump).
+
+parse() reads a TEXTMAP in a single pass with one regular expression
+that matches a whole statement at a time, and returns the global
+fields and the blocks. write() writes them back one block at a time,
+so the text is never built in memory as a whole; dumps() returns it
+as a string.
+
+A block is a Block object whose fields are its attributes. The block
+types of the UDMF specification (thing, vertex, linedef, sidedef and
+sector) have subclasses that give the defaults of the standard fields
+as class attributes; blocks of other types are plain Blocks.
+"""
+
+import re
+
+# Whitespace and comments, allowed between any two tokens
+_gap = r"\s*(?:(?://[^\n]*|/\*.*?\*/)\s*)*"
+
+# One statement: an assignment, the start of a block or its end,
+# after any whitespace and comments. Numbers are split by kind so that
+# the common ones need no further inspection.
+_statement = re.compile(r"""
+    %(gap)s
+    (?:
+        (?P<key>[A-Za-z_][A-Za-z0-9_]*) %(gap)s
+        (?:
+            = %(gap)s
+            (?:
+                (?P<float>[+-]?(?:[0-9]+\.[0-9]*(?:[eE][+-]?[0-9]+)?
+                                 |\.[0-9]+(?:[eE][+-]?[0-9]+)?
+                                 |[0-9]+[eE][+-]?[0-9]+))
+              | (?P<based>[+-]?0(?:[xX][0-9A-Fa-f]+|[0-7]+))
+              | (?P<int>[+-]?[0-9]+)
+              | "(?P<str>(?:[^"\\]|\\.)*)"
+              | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+            )
+            %(gap)s ;
+          | (?P<open>\{)
+        )
+      | (?P<close>\})
+    )""" % {"gap": _gap}, re.X | re.S)
+
+_blank = re.compile(_gap + r"\Z", re.S)
+
+_escape = re.compile(r"\\(.)", re.S)
+
+_keywords = {"true": True, "false": False}
+
+
+class _Memo(dict):
+    """Memo of a conversion of strings. Identifiers and numbers repeat
+    a lot in a TEXTMAP, and a lookup is cheaper than converting."""
+
+    def __init__(self, convert):
+        dict.__init__(self)
+        self.convert = convert
+
+    def __missing__(self, key):
+        value = self[key] = self.convert(key)
+        return value
+
+class Block(object):
+    """A block of a TEXTMAP. Its fields are its attributes; fields()
+    returns them as a dict. `_type` is the block type, e.g. "thing".
+
+    Setting a field marks the list owning the block as changed, in the
+    same way as the structs of binary maps (see make_struct)."""
+
+    _type = None
+
+    def __init__(self, _type=None, **fields):
+        d = self.__dict__
+        if _type is not None:
+            d["_type"] = _type
+        d.update(fields)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        owner = self.__dict__.get("_owner")
+        if owner is not None:
+            owner = owner()
+            if owner is not None:
+                owner.dirty = True
+
+    def fields(self):
+        """Return the fields that are set as a dict."""
+        return dict((k, v) for k, v in self.__dict__.items() if k[0] != "_")
+
+    def __repr__(self):
+        return "<%s %s>" % (self._type, self.fields())
+
+class Thing(Block):
+    _type = "thing"
+    id = 0
+    height = 0.0
+    angle = 0
+    special = 0
+    arg0 = arg1 = arg2 = arg3 = arg4 = 0
+
+class Vertex(Block):
+    _type = "vertex"
+
+class Linedef(Block):
+    _type = "linedef"
+    id = -1
+    special = 0
+    arg0 = arg1 = arg2 = arg3 = arg4 = 0
+    sideback = -1
+
+class Sidedef(Block):
+    _type = "sidedef"
+    offsetx = 0
+    offsety = 0
+    texturetop = "-"
+    texturebottom = "-"
+    texturemiddle = "-"
+
+class Sector(Block):
+    _type = "sector"
+    heightfloor = 0
+    heightceiling = 0
+    lightlevel = 160
+    special = 0
+    id = 0
+
+block_types = dict((c._type, c) for c in (Thing, Vertex, Linedef, Sidedef, Sector))
+
+
+def _based(s):
+    """Value of a hexadecimal or octal number."""
+    sign = 1
+    if s[0] in "+-":
+        sign, s = s[0] == "-" and -1 or 1, s[1:]
+    if s[1:2] in "xX":
+        return sign * int(s[2:], 16)
+    return sign * int(s, 8)
+
+def parse(text):
+    """Parse the text of a TEXTMAP. Returns a (fields, blocks) tuple:
+    a dict of the global fields (such as "namespace") and a list of
+    Block objects in the order of the text. Identifiers are converted
+    to lower case, numbers to int or float and the keywords true and
+    false to bool. Raises ValueError on a syntax error."""
+    fields = {}
+    blocks = []
+    block = None
+    target = fields
+    types = block_types
+    lower = _Memo(str.lower)
+    integer = _Memo(int)
+    m = None
+    for m in iter(_statement.scanner(text).match, None):
+        key, f, based, i, s, word, open, close = m.groups()
+        if i is not None:
+            target[lower[key]] = integer[i]
+        elif f is not None:
+            target[lower[key]] = float(f)
+        elif s is not None:
+            if "\\" in s:
+                s = _escape.sub(r"\1", s)
+            target[lower[key]] = s
+        elif close is not None:
+            if block is None:
+                pos = m.start()
+                break
+            blocks.append(block)
+            block = None
+            target = fields
+        elif open is not None:
+            if block is not None:
+                pos = m.start()
+                break
+            key = lower[key]
+            class_ = types.get(key)
+            if class_ is None:
+                block = Block(key)
+            else:
+                block = class_.__new__(class_)
+            target = block.__dict__
+        elif word is not None:
+            word = lower[word]
+            target[lower[key]] = _keywords.get(word, word)
+        else:
+            target[lower[key]] = _based(based)
+    else:
+        pos = m is not None and m.end() or 0
+        if block is None and _blank.match(text, pos):
+            return fields, blocks
+    line = text.count("\n", 0, pos) + 1
+    raise ValueError, "TEXTMAP syntax error on line %i" % line
+
+def _float(value):
+    s = repr(value)
+    if "." not in s:
+        s = s.replace("e", ".0e")
+    return s
+
+def _string(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+# How to write a field value, by type
+_formats = {
+    bool:    lambda value: value and "true" or "false",
+    int:     str,
+    long:    str,
+    float:   _float,
+    str:     _string,
+    unicode: _string,
+}
+
+def _assignments(items):
+    formats = _formats
+    try:
+        return "".join(["%s = %s;\n" % (k, formats[type(v)](v)) for k, v in items])
+    except KeyError:
+        for k, v in items:
+            if type(v) not in formats:
+                raise TypeError, "cannot write field %s = %r" % (k, v)
+
+def iterdump(fields, blocks):
+    """Generate the text of a TEXTMAP in pieces: the global fields
+    (the namespace first), then one piece per block."""
+    items = sorted(fields.items(), key=lambda (k, v): (k != "namespace", k))
+    yield _assignments(items) + "\n"
+    for block in blocks:
+        items = sorted(kv for kv in block.__dict__.iteritems() if kv[0][0] != "_")
+        yield "%s\n{\n%s}\n\n" % (block._type, _assignments(items))
+
+def write(out, fields, blocks):
+    """Write a TEXTMAP to a file object."""
+    for piece in iterdump(fields, blocks):
+        out.write(piece)
+
+def dumps(fields, blocks):
+    """Return the text of a TEXTMAP as a string."""
+    return "".join(iterdump(fields, blocks))
@@ -4,7 +4,7 @@
 """
 
 from fnmatch import fnmatchcase as wccmp
-from struct  import pack, unpack, calcsize
+from struct  import pack, unpack, unpack_from, calcsize
 from copy    import copy, deepcopy
 
 _pack = pack
@@ -102,6 +102,133 @@ class OrderedDict:
         return a
 
 
+class LRUCache:
+    """A dict-like container holding at most `maxsize` items. When
+    full, the least recently used item is discarded to make room.
+    Lookup statistics are kept in the `hits` and `misses` fields.
+
+    The items can also be limited by size: with `maxbytes` set, the
+    least recently used items are discarded while the total of
+    sizeof(key, value) over all items, kept in `bytes`, is larger."""
+
+    def __init__(self, maxsize=65536, maxbytes=None, sizeof=None):
+        """Create new, holding at most `maxsize` items and, if maxbytes
+        is given, at most that many bytes as measured by sizeof."""
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._map = {}
+        # Circular doubly linked list of [prev, next, key, value, size]
+        # links; root[1] is the least recently used item
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, key, default=None):
+        """Retrieve an item, marking it as recently used. Returns
+        `default` and counts a miss if the key isn't present."""
+        link = self._map.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._touch(link)
+        return link[3]
+
+    def __getitem__(self, key):
+        """Retrieve an item, raising KeyError if not present."""
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        """Set an item, discarding the oldest items if full."""
+        size = 0
+        if self.sizeof is not None:
+            size = self.sizeof(key, value)
+        link = self._map.get(key)
+        if link is not None:
+            self.bytes += size - link[4]
+            link[3] = value
+            link[4] = size
+            self._touch(link)
+        else:
+            if len(self._map) >= self.maxsize:
+                oldest = self._root[1]
+                if oldest is self._root:
+                    return
+                self._unlink(oldest)
+            root = self._root
+            last = root[0]
+            link = [last, root, key, value, size]
+            last[1] = root[0] = self._map[key] = link
+            self.bytes += size
+        if self.maxbytes is not None:
+            # an item too large for the cache on its own is dropped too
+            root = self._root
+            while self.bytes > self.maxbytes and root[1] is not root:
+                self._unlink(root[1])
+
+    def __delitem__(self, key):
+        """Delete an item."""
+        self._unlink(self._map[key])
+
+    def _touch(self, link):
+        # Move the link to the most recently used end
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+        del self._map[link[2]]
+        self.bytes -= link[4]
+
+    def __contains__(self, key):
+        """Find if the cache holds the given key. Does not affect
+        the usage order or the statistics."""
+        return key in self._map
+
+    def __len__(self):
+        """len(self)"""
+        return len(self._map)
+
+    def __iter__(self):
+        """Iterate over keys, from least to most recently used."""
+        return iter(self.keys())
+
+    def keys(self):
+        """Returns a list of all keys, oldest first."""
+        keys = []
+        root = self._root
+        link = root[1]
+        while link is not root:
+            keys.append(link[2])
+            link = link[1]
+        return keys
+
+    def clear(self):
+        """Delete all items (statistics are kept)."""
+        self._map.clear()
+        self.bytes = 0
+        root = self._root
+        root[:] = [root, root, None, None]
+
+    def stats(self):
+        """Returns a (hits, misses, size, maxsize) tuple."""
+        return self.hits, self.misses, len(self._map), self.maxsize
+
+
 #----------------------------------------------------------------------
 #
 # Miscellaneous convenient function
@@ -142,6 +269,38 @@ def all(set):
 def inwclist(elem, seq):
     return any(wccmp(elem, x) for x in seq)
 
+def parallel_map(func, items, workers=None, chunksize=1,
+    initializer=None, initargs=(), ordered=True):
+    """Apply func to every item, using a pool of `workers` processes
+    (by default one per CPU), and return an iterator over the results
+    in order. With workers=1 everything runs in this process. The
+    function must be defined at module level so that it can be sent
+    to the worker processes.
+
+    With ordered=False results are returned as soon as they are ready,
+    so that a slow item does not hold back the ones after it."""
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return (func(item) for item in items)
+    return _pool_map(func, items, workers, chunksize, initializer, initargs,
+        ordered)
+
+def _pool_map(func, items, workers, chunksize, initializer, initargs, ordered):
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        imap = ordered and pool.imap or pool.imap_unordered
+        for result in imap(func, items, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
 
 #----------------------------------------------------------------------
 #
@@ -231,12 +390,9 @@ class Struct(object):
             %(initbody)s
         %(init_exec)s
 
-    def __getattribute__(self, name):
-        return object.__getattribute__(self, name)
-
     def pack(self):
         return %(packexpr)s
-
+%(trackdef)s
 %(flagdefs)s
 
 Struct.__name__ = %(name)r
@@ -255,6 +411,17 @@ _flagproperty = '''
     
     %s = property(get_%s, set_%s)'''
 
+# Template for the __setattr__ of tracked structs
+_trackdef = '''
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        owner = self.__dict__.get("_owner")
+        if owner is not None:
+            owner = owner()
+            if owner is not None:
+                owner.dirty = True
+'''
+
 def make_property(name, bit, size=1, type=bool, var="flags"):
     """Helper function for make_struct which defines properties based on
     bit fields. This is called automatically for "flags" when passing a 
@@ -268,7 +435,7 @@ def make_property(name, bit, size=1, type=bool, var="flags"):
                             name, var, setmask, getmask, var, bit, name, getmask,
                             name, name, name)
 
-def _structdef(name, doc, fields, flags=None, init_exec=""):
+def _structdef(name, doc, fields, flags=None, init_exec="", track=False):
     """Helper function for make_struct. Needed because Python doesn't
     like compile() and exec in the place when there are unknown
     variables floating around... (?)"""
@@ -305,13 +472,24 @@ def _structdef(name, doc, fields, flags=None, init_exec=""):
 
     # example:  self.x, self.y, self.foo = unpack('hh8s', bytes);
     #           self.foo = zstrip(safe_name(self.foo))
-    unpackexpr =  ', '.join('self.'+f[0] for f in fields)
+    # Tracked structs set their fields through __dict__ when created,
+    # bypassing __setattr__
+    if track:
+        attr = "d[%r]"
+        prefix = "d = self.__dict__; "
+    else:
+        attr = "self.%s"
+        prefix = ""
+    unpackexpr =  prefix + ', '.join(attr % f[0] for f in fields)
     unpackexpr += (" = unpack(%r, bytes); " % fmt)
-    unpackexpr += "; ".join("self.%s=zstrip(safe_name(self.%s))" % \
+    unpackexpr += "; ".join((attr + "=zstrip(safe_name(" + attr + "))") % \
         (f[0], f[0]) for f in fields if 's' in f[1])
 
     # example:  self.x=x; self.y=y; self.foo=foo
-    initbody = "; ".join("self.%s=%s" % (f[0], f[0]) for f in fields)
+    initbody = prefix + "; ".join((attr + "=%s") % (f[0], f[0]) for f in fields)
+
+    # __setattr__ that marks the list owning the struct as changed
+    trackdef = track and _trackdef or ""
 
     # example:  pack()
     packs = []
@@ -327,7 +505,30 @@ def _structdef(name, doc, fields, flags=None, init_exec=""):
     # print s.replace("Struct", name)
     return compile(s, "<struct>", "exec")
 
+def unpack_array(class_, data, offset=0, count=None):
+    """Unpack `count` consecutive records of a Struct class from data,
+    starting at offset (by default, as many records as there are whole
+    ones after offset). The records are unpacked many at a time, which
+    is much faster than unpacking them one by one. The Struct must not
+    have string fields."""
+    assert 's' not in class_._fmt
+    size = class_._fmtsize
+    if count is None:
+        count = (len(data) - offset) // size
+    body = class_._fmt[1:]
+    k = len(unpack(class_._fmt, "\0" * size))
+    items = []
+    for start in xrange(0, count, 1024):
+        n = min(1024, count - start)
+        values = unpack_from("<" + body*n, data, offset + start*size)
+        items.extend([class_(*values[i:i+k]) for i in xrange(0, n*k, k)])
+    return items
+
 def make_struct(*args, **kwargs):
-    """Create a Struct class according to the given format"""
+    """Create a Struct class according to the given format.
+
+    With track=True, setting an attribute of an instance sets the
+    `dirty` attribute of its owner to True, if it has been given one
+    as a weak reference in its `_owner` attribute; see MapEditor."""
     exec _structdef(*args, **kwargs)
     return Struct
@@ -3,6 +3,7 @@ import omg.palette
 from omg.lump  import *
 from omg.util import *
 from omg.wadio import WadIO
+from omg import instrument
 
 class LumpGroup(OrderedDict):
     """A dict-like object for holding a group of lumps"""
@@ -24,24 +25,124 @@ class LumpGroup(OrderedDict):
         iw = WAD(); iw.load(filename)
         self._lumps += deepcopy(iw.__dict__[self._sect_name]._lumps)
 
-    def to_file(self, filename):
+    def to_file(self, filename, dedup=False):
         """Save group as a separate WAD file."""
-        w = WadIO(filename)
+        w = WadIO(filename, dedup)
         self.save_wadio(w)
-
-    def from_glob(self, globpattern):
-        """Create lumps from files matching the glob pattern."""
-        for p in glob.glob(globpattern):
+        w.save()
+        w.close()
+
+    def from_glob(self, globpattern, workers=1, errors="raise"):
+        """Create lumps from files matching the glob pattern, adding
+        them in the order of their paths. With more than one worker the
+        files are loaded in a pool of processes (see parallel_map), all
+        starting from the lookups of the default palette made so far.
+
+        A file that fails to load raises its error. With
+        errors="collect" it is left out instead, and the returned list
+        holds a (path, error message) pair for each such file."""
+        if errors not in ("raise", "collect"):
+            raise ValueError, "errors must be 'raise' or 'collect'"
+        paths = sorted(glob.glob(globpattern))
+        jobs = [(self.lumptype, p, errors == "collect") for p in paths]
+        palette = omg.palette.default
+        failures = []
+        for p, (data, error) in zip(paths, parallel_map(_import_file, jobs,
+                workers, 4, _init_import_worker, (palette.share_inverse(),))):
+            if error is not None:
+                failures.append((p, error))
+                continue
             name = fixname(os.path.basename(p[:p.rfind('.')]))
-            self[name] = self.lumptype(from_file=p)
+            lump = self.lumptype()
+            lump.data = data
+            self[name] = lump
+        return failures
+
+    def export(self, directory, format="png", workers=None, mode='P'):
+        """Save every lump to directory as its name plus "." + format,
+        using a pool of `workers` processes (see parallel_map). Graphics
+        are converted as by Graphic.to_file, with the given mode; other
+        lumps are saved as they are.
+
+        A manifest, export.json, records a hash of each lump and of the
+        settings for every file; files that exist and match are skipped
+        when exporting again. Returns the list of files written."""
+        import json
+        from hashlib import sha1
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        manifest_path = os.path.join(directory, "export.json")
+        manifest = {}
+        if os.path.exists(manifest_path):
+            manifest = json.load(open(manifest_path))
+        ext = "." + format.lower()
+        palettes = []
+        jobs = []
+        for name in self:
+            lump = self[name]
+            filename = fix_saving_name(name) + ext
+            palette = None
+            params = [type(lump).__name__, ext, mode]
+            if isinstance(lump, Graphic):
+                p = lump.palette
+                key = (p.bytes, p.tran_index, p.tran_color)
+                if key not in palettes:
+                    palettes.append(key)
+                palette = palettes.index(key)
+                params.append(key)
+            h = sha1(repr(params))
+            h.update(lump.data)
+            digest = h.hexdigest()
+            path = os.path.join(directory, filename)
+            if manifest.get(filename) == digest and os.path.exists(path):
+                continue
+            manifest[filename] = digest
+            jobs.append((type(lump), lump.data, palette, path, mode))
+        written = []
+        if jobs:
+            if workers is None:
+                import multiprocessing
+                workers = multiprocessing.cpu_count()
+            # a few chunks per worker: fewer round trips than one lump at
+            # a time, while a chunk of big lumps does not hold up the others
+            chunksize = max(1, min(32, len(jobs) // (4 * workers)))
+            written = list(parallel_map(_export_lump, jobs, workers,
+                chunksize, _init_export_worker, (palettes,)))
+        f = open(manifest_path, "w")
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.close()
+        return written
+
+    def _read(self, wadio, i, lazy):
+        """Create a lump from entry i, by reference if lazy."""
+        rec = instrument.recorder
+        if rec is not None:
+            t = instrument.timer()
+        if lazy:
+            data = wadio.reference(i)
+        else:
+            data = wadio.read(i)
+        if rec is not None:
+            t, t0 = instrument.timer(), t
+            rec.time("read", t - t0)
+        if lazy:
+            lump = self.lumptype()
+            lump.source = data
+        else:
+            lump = self.lumptype(data)
+        if rec is not None:
+            rec.time("construct", instrument.timer() - t)
+        return lump
 
     def save_wadio(self, wadio):
         """Save to a WadIO object."""
         for m in self:
-            wadio.insert(m, self[m].data)
+            wadio.insert(m, self[m].source or self[m].data)
 
     def copy(self):
-        """Creates a deep copy."""
+        """Creates a copy holding copies of the lumps (and of the
+        groups within, for maps). The lump data is shared until it is
+        replaced, see Lump.copy."""
         a = self.__class__(self._name, self.lumptype, self.config)
         for k in self:
             a[k] = self[k].copy()
@@ -54,6 +155,42 @@ class LumpGroup(OrderedDict):
         c.update(other)
         return c
 
+def _init_import_worker(inverse):
+    omg.palette.default.update_inverse(inverse)
+
+def _import_file(job):
+    """Load a lump from a file. job is a (lumptype, path, collect)
+    tuple. Returns a (data, None) pair. If loading fails, the error is
+    raised, or with collect returned as a (None, error message) pair."""
+    lumptype, path, collect = job
+    if not collect:
+        return lumptype(from_file=path).data, None
+    try:
+        return lumptype(from_file=path).data, None
+    except Exception, e:
+        return None, "%s: %s" % (e.__class__.__name__, e)
+
+# Palettes for LumpGroup.export, set up in every worker process
+_export_palettes = []
+
+def _init_export_worker(palettes):
+    global _export_palettes
+    _export_palettes = [omg.palette.Palette(*p) for p in palettes]
+
+def _export_lump(job):
+    """Save a lump to a file. job is a (lumptype, data, palette,
+    filename, mode) tuple, where palette is an index into the palettes
+    given to the worker, or None for lumps that are not graphics.
+    Returns the filename."""
+    lumptype, data, palette, filename, mode = job
+    lump = lumptype(data)
+    if palette is None:
+        lump.to_file(filename)
+    else:
+        lump.palette = _export_palettes[palette]
+        lump.to_file(filename, mode)
+    return filename
+
 class MarkerGroup(LumpGroup):
     """Group for lumps found between markers, e.g. sprites"""
 
@@ -63,9 +200,10 @@ class MarkerGroup(LumpGroup):
         # In case group opens with XX_ and ends with X_
         self.abssuffix = self.config + "_END"
 
-    def load_wadio(self, wadio):
+    def load_wadio(self, wadio, lazy=False, predicate=None):
         """Load all matching lumps that have not already
-        been flagged as read from the given WadIO object."""
+        been flagged as read from the given WadIO object.
+        See WAD.from_file for `lazy` and `predicate`."""
         inside = False
         startedwith, endswith = "", ""
         for i in range(len(wadio.entries)):
@@ -77,8 +215,9 @@ class MarkerGroup(LumpGroup):
                 if wccmp(name, endswith) or wccmp(name, self.abssuffix):
                     inside = False
                 else:
-                    if wadio.entries[i].size != 0:
-                        self[name] = self.lumptype(wadio.read(i))
+                    if wadio.entries[i].size != 0 and (predicate is None
+                       or predicate(self._name, wadio.entries[i])):
+                        self[name] = self._read(wadio, i, lazy)
                 wadio.entries[i].been_read = True
             else:
                 # print name, self.prefix, wccmp(name, self.prefix)
@@ -98,14 +237,17 @@ class MarkerGroup(LumpGroup):
 
 
 class HeaderGroup(LumpGroup):
-    """Group for lumps arranged header-tail (e.g. maps)"""
+    """Group for lumps arranged header-tail (e.g. maps). A header
+    followed by TEXTMAP starts a UDMF map instead, which takes every
+    lump up to and including ENDMAP."""
 
     def __init2__(self):
         self.tail = self.config
 
-    def load_wadio(self, wadio):
+    def load_wadio(self, wadio, lazy=False, predicate=None):
         """Load all matching lumps that have not already
-        been flagged as read from the given WadIO object."""
+        been flagged as read from the given WadIO object.
+        See WAD.from_file for `lazy` and `predicate`."""
         numlumps = len(wadio.entries)
         i = 0
         while i < numlumps:
@@ -114,15 +256,33 @@ class HeaderGroup(LumpGroup):
                 continue
             name = wadio.entries[i].name
             added = False
+            if i < numlumps - 1 and wadio.entries[i + 1].name == "TEXTMAP":
+                added = True
+                keep = predicate is None or predicate(self._name, wadio.entries[i])
+                if keep:
+                    self[name] = NameGroup()
+                wadio.entries[i].been_read = True
+                i += 1
+                while i < numlumps:
+                    lumpname = wadio.entries[i].name
+                    if keep:
+                        self[name][lumpname] = self._read(wadio, i, lazy)
+                    wadio.entries[i].been_read = True
+                    i += 1
+                    if lumpname == "ENDMAP":
+                        break
             # now search only using tail lumps so that any map with map lumps is loaded correctly
-            if i < numlumps - 1 and inwclist(wadio.entries[i + 1].name, self.tail):
+            elif i < numlumps - 1 and inwclist(wadio.entries[i + 1].name, self.tail):
                 added = True
-                self[name] = NameGroup()
+                keep = predicate is None or predicate(self._name, wadio.entries[i])
+                if keep:
+                    self[name] = NameGroup()
                 wadio.entries[i].been_read = True
                 i += 1
                 while i < numlumps and inwclist(wadio.entries[i].name, self.tail):
-                    self[name][wadio.entries[i].name] = \
-                        self.lumptype(wadio.read(i))
+                    if keep:
+                        self[name][wadio.entries[i].name] = \
+                            self._read(wadio, i, lazy)
                     wadio.entries[i].been_read = True
                     i += 1
             if not added:
@@ -133,9 +293,15 @@ class HeaderGroup(LumpGroup):
         for h in self:
             hs = self[h]
             wadio.insert(h, "")
+            if "TEXTMAP" in hs:
+                for t in hs:
+                    if t not in ("_HEADER_", "ENDMAP"):
+                        wadio.insert(t, hs[t].source or hs[t].data)
+                wadio.insert("ENDMAP", "")
+                continue
             for t in self.tail:
                 if t in hs:
-                    wadio.insert(t, hs[t].data)
+                    wadio.insert(t, hs[t].source or hs[t].data)
 
 
 class NameGroup(LumpGroup):
@@ -144,16 +310,18 @@ class NameGroup(LumpGroup):
     def __init2__(self):
         self.names = self.config
 
-    def load_wadio(self, wadio):
+    def load_wadio(self, wadio, lazy=False, predicate=None):
         """Load all matching lumps that have not already
-        been flagged as read from the given WadIO object."""
+        been flagged as read from the given WadIO object.
+        See WAD.from_file for `lazy` and `predicate`."""
         inside = False
         for i in range(len(wadio.entries)):
             if wadio.entries[i].been_read:
                 continue
             name = wadio.entries[i].name
             if inwclist(name, self.names):
-                self[name] = self.lumptype(wadio.read(i))
+                if predicate is None or predicate(self._name, wadio.entries[i]):
+                    self[name] = self._read(wadio, i, lazy)
                 wadio.entries[i].been_read = True
 
 class TxdefGroup(NameGroup):
@@ -228,13 +396,15 @@ class WAD:
         .sprites, etc  Sections containing lumps, as specified by
                        the structure definition"""
 
-    def __init__(self, from_file=None, structure=defstruct):
+    def __init__(self, from_file=None, structure=defstruct, lazy=False,
+                 only=None, predicate=None):
         """Create a new WAD. The optional `source` argument may be a
         string specifying a path to a file or a WadIO object.
         If omitted, an empty WAD is created. A WADStructure object
         may be passed as the `structure` argument to apply a custom
         section structure. By default, the structure specified in the
-        defdata module is used."""
+        defdata module is used. See from_file for `lazy`, `only`
+        and `predicate`."""
         self.__category = 'root'
         self.palette = omg.palette.default
         self.structure = structure
@@ -244,11 +414,37 @@ class WAD:
             self.__dict__[group_def[1]] = instance
             self.groups.append(instance)
         if from_file:
-            self.from_file(from_file)
+            self.from_file(from_file, lazy, only, predicate)
 
-    def from_file(self, source):
+    def from_file(self, source, lazy=False, only=None, predicate=None):
         """Load contents from a file. `source` may be a string
-        specifying a path to a file or a WadIO object."""
+        specifying a path to a file or a WadIO object.
+
+        With lazy=True only the directory is read; each lump reads its
+        data from the file when it is first used, and lumps that are
+        never used are copied straight from the file when saving. The
+        file must not be modified while such lumps are in use. A
+        custom group whose load_wadio does not take the `lazy` argument
+        is loaded as usual.
+
+        `only` is a list of the names of the groups to load, e.g.
+        ['maps', 'txdefs']. The other groups are left as they are, and
+        their lumps are not read: their entries are only sorted out
+        from the directory, so that the selected groups get exactly
+        the lumps they would get in a full load. A custom group whose
+        load_wadio does not take the `lazy` and `predicate` arguments
+        is loaded as usual instead (lazily if it takes `lazy`).
+
+        `predicate`, if given, is called as predicate(group, entry)
+        with the name of a group and the directory entry of a lump
+        that belongs to it (the header entry for a map), and the lump
+        (or whole map) is loaded only if it returns true. Custom groups
+        must accept the `predicate` argument of load_wadio for this.
+
+        See omg.instrument for timing the phases of loading."""
+        rec = instrument.recorder
+        if rec is not None:
+            start = instrument.timer()
         if isinstance(source, WadIO):
             w = source
         elif isinstance(source, str) or isinstance(source, unicode):
@@ -256,26 +452,82 @@ class WAD:
             w = WadIO(source)
         else:
             raise TypeError, "Expected WadIO or file path string"
+        if only is not None:
+            for name in only:
+                if name not in [g[1] for g in self.structure]:
+                    raise ValueError, "No group named %s" % name
         for group in self.groups:
-            group.load_wadio(w)
-
-    def to_file(self, filename):
+            if rec is not None:
+                t, n = instrument.timer(), _lump_count(group)
+                io = rec.seconds("read") + rec.seconds("construct")
+            if only is not None and group._name not in only:
+                args = _load_args(group)
+                if args >= 3:
+                    group.load_wadio(w, True, _skip)
+                elif args == 2:
+                    group.load_wadio(w, True)
+                else:
+                    group.load_wadio(w)
+            elif predicate is not None:
+                group.load_wadio(w, lazy, predicate)
+            elif lazy and _load_args(group) >= 2:
+                group.load_wadio(w, lazy)
+            else:
+                group.load_wadio(w)
+            if rec is not None:
+                t = instrument.timer() - t
+                n = _lump_count(group) - n
+                rec.time("classify", t - (rec.seconds("read") +
+                    rec.seconds("construct") - io))
+                rec.group(group._name, n)
+                rec.event(event="load_group", group=group._name, lumps=n,
+                    seconds=t)
+        if rec is not None:
+            rec.event(event="load", path=w.basefile and w.basefile.name,
+                entries=len(w.entries), seconds=instrument.timer() - start)
+
+    def to_file(self, filename, dedup=False):
         """Save contents to a WAD file. Caution: if a file with the given name
         already exists, it will be overwritten. However, the existing file will
         be kept as <filename>.tmp until the operation has finished, to stay safe
-        in case of failure."""
+        in case of failure.
+
+        With dedup=True, lumps with identical contents are stored only
+        once (see WadIO). See omg.instrument for timing the phases
+        of saving."""
+        rec = instrument.recorder
+        if rec is not None:
+            start = instrument.timer()
         use_backup = os.path.exists(filename)
         tmpfilename = filename + ".tmp"
         if use_backup:
+            # lumps still to be read from the file being replaced
+            path = os.path.abspath(filename)
+            for lump in self.lumps():
+                if lump.source is not None and lump.source.path == path:
+                    lump.data = lump.data
             if os.path.exists(tmpfilename):
                 os.remove(tmpfilename)
             os.rename(filename, tmpfilename)
-        w = WadIO(filename)
+        w = WadIO(filename, dedup)
         for group in write_order:
+            if rec is None:
+                self.__dict__[group].save_wadio(w)
+                continue
+            t, written = instrument.timer(), rec.counters["bytes_written"]
             self.__dict__[group].save_wadio(w)
+            t = instrument.timer() - t
+            n = _lump_count(self.__dict__[group])
+            rec.time("write", t)
+            rec.group(group, n, saved=True)
+            rec.event(event="save_group", group=group, lumps=n, seconds=t,
+                bytes=rec.counters["bytes_written"] - written)
         w.save()
         if use_backup:
             os.remove(tmpfilename)
+        if rec is not None:
+            rec.event(event="save", path=filename, entries=len(w.entries),
+                seconds=instrument.timer() - start)
 
     def __add__(self, other):
         assert isinstance(other, WAD)
@@ -283,7 +535,76 @@ class WAD:
         for group_def in self.structure:
             name = group_def[1]
             w.__dict__[name] = self.__dict__[name] + other.__dict__[name]
+        w.groups = [w.__dict__[group_def[1]] for group_def in self.structure]
         return w
 
+    def lumps(self):
+        """Iterate over all lumps in the WAD, including map lumps."""
+        for group in self.groups:
+            for name in group:
+                if isinstance(group[name], LumpGroup):
+                    for lump in group[name].values():
+                        yield lump
+                else:
+                    yield group[name]
+
     def copy(self):
-        return deepcopy(self)
+        """Return a copy of the WAD with its own groups and lumps, which
+        can be changed independently of the original. The lump data
+        itself is shared until it is replaced, so copying takes time
+        and memory in proportion to the number of lumps only."""
+        w = WAD(structure=self.structure)
+        w.palette = self.palette
+        for group_def in self.structure:
+            name = group_def[1]
+            w.__dict__[name] = self.__dict__[name].copy()
+        w.groups = [w.__dict__[group_def[1]] for group_def in self.structure]
+        return w
+
+
+def _load_args(group):
+    """The number of arguments the load_wadio method of a group takes:
+    1 (the WadIO object), 2 (and lazy) or 3 (and predicate)."""
+    import inspect
+    args, varargs, keywords, defaults = inspect.getargspec(group.load_wadio)
+    if varargs is not None:
+        return 3
+    return len(args) - 1
+
+def _skip(group, entry):
+    return False
+
+def _lump_count(group):
+    """Number of lumps in a group, counting those in maps."""
+    n = 0
+    for name in group:
+        if isinstance(group[name], LumpGroup):
+            n += len(group[name])
+        else:
+            n += 1
+    return n
+
+def _has_textures(group):
+    return "PNAMES" in group and bool(group.find("TEXTURE?"))
+
+def merge_files(inputs, output, dedup=False):
+    """Merge WAD files into a new file, later inputs overriding earlier
+    ones as when adding WAD objects. Only the directories of the inputs
+    are read into memory; the lumps are copied from the input files to
+    the output in large chunks. Texture definitions are combined when
+    two inputs both have TEXTUREx and PNAMES, otherwise the later lumps
+    replace the earlier ones."""
+    merged = WAD()
+    for path in inputs:
+        wad = WAD(path, lazy=True)
+        for group_def in merged.structure:
+            name = group_def[1]
+            a, b = merged.__dict__[name], wad.__dict__[name]
+            if isinstance(a, TxdefGroup) and \
+               not (_has_textures(a) and _has_textures(b)):
+                a = LumpGroup.__add__(a, b)
+            else:
+                a = a + b
+            merged.__dict__[name] = a
+        merged.groups = [merged.__dict__[g[1]] for g in merged.structure]
+    merged.to_file(output, dedup)
@@ -1,5 +1,11 @@
 import os, md5, time
+from hashlib import md5 as _md5
 from omg.util import *
+from omg import instrument
+
+# Most input files kept open at once for copying lumps by reference
+# (see WadIO._copy); the least recently used one is closed beyond that
+max_readers = 64
 
 Header = make_struct(
   "Header",
@@ -19,6 +25,63 @@ Entry = make_struct(
 )
 
 
+def _read_directory(f):
+    """Read the header and directory of an open WAD file."""
+    rec = instrument.recorder
+    if rec is not None:
+        t = instrument.timer()
+    filesize = os.fstat(f.fileno())[6]
+    if filesize < Header._fmtsize:
+        raise IOError, "The file is not a valid WAD file."
+    f.seek(0)
+    h = Header(bytes=f.read(Header._fmtsize))
+    if not h.type in ("PWAD", "IWAD"):
+        raise IOError, "The file is not a valid WAD file."
+    if filesize < h.dir_ptr + h.dir_len*Entry._fmtsize:
+        raise IOError, "Invalid directory information in header."
+    f.seek(h.dir_ptr)
+    data = f.read(h.dir_len*Entry._fmtsize)
+    s = Entry._fmtsize
+    entries = [Entry(bytes=data[i:i+s]) for i in xrange(0, len(data), s)]
+    if rec is not None:
+        rec.read(Header._fmtsize)
+        rec.read(len(data))
+        rec.time("directory", instrument.timer() - t)
+    return h, entries
+
+def read_directory(filename):
+    """Read only the header and directory of a WAD file, without
+    opening it for writing or reading any lump data. Returns a
+    (Header, list of Entry) tuple; raises IOError if the file is not
+    a valid WAD."""
+    f = open(filename, 'rb')
+    try:
+        return _read_directory(f)
+    finally:
+        f.close()
+
+
+class LumpRef:
+    """Refers to the data of a lump stored in a WAD file, so that it
+    can be read or copied later without keeping it in memory."""
+
+    def __init__(self, path, ptr, size):
+        self.path = path
+        self.ptr  = ptr
+        self.size = size
+
+    def read(self):
+        """Read the data from the file."""
+        if instrument.recorder is not None:
+            instrument.recorder.read(self.size)
+        f = open(self.path, 'rb')
+        try:
+            f.seek(self.ptr)
+            return f.read(self.size)
+        finally:
+            f.close()
+
+
 # WadIO.open() behaves just like open(). Sometimes it is
 # useful to specifically either open an existing file
 # or create a new one.
@@ -64,13 +127,21 @@ class WadIO:
     is that changes can't be undone (so back up first!) and that
     file content will get fragmented when you edit lumps (unused
     space will appear). To get rid of the wasted space, use the
-    rewrite() method (which rewrites the entire file)."""
+    rewrite() method (which rewrites the entire file).
+
+    With dedup=True, a lump whose bytes are identical to those of a
+    lump inserted earlier (through this object) is not written again;
+    its entry points at the stored copy instead. The file stays a
+    valid WAD, since nothing requires entries to be disjoint."""
 
-    def __init__(self, openfrom=None):
+    def __init__(self, openfrom=None, dedup=False):
         self.basefile = None
         self.issafe = True
         self.header = Header()
         self.entries = []
+        self.dedup = dedup
+        self._stored = {}   # (size, md5) -> ptr of lumps written
+        self._readers = LRUCache(max_readers)  # path -> open file, for copying LumpRefs
         if openfrom is not None:
             self.open(openfrom)
 
@@ -82,15 +153,7 @@ class WadIO:
         # Open an existing WAD
         if os.path.exists(filename):
             self.basefile = open(filename, 'r+b')
-            filesize = os.stat(self.basefile.name)[6]
-            self.header = h = Header(bytes=self.basefile.read(Header._fmtsize))
-            if (not h.type in ("PWAD", "IWAD")) or filesize < 12:
-                raise IOError, "The file is not a valid WAD file."
-            if filesize < h.dir_ptr + h.dir_len*Entry._fmtsize:
-                raise IOError, "Invalid directory information in header."
-            self.basefile.seek(h.dir_ptr)
-            self.entries = [Entry(bytes=self.basefile.read(Entry._fmtsize)) \
-                for i in range(h.dir_len)]
+            self.header, self.entries = _read_directory(self.basefile)
         # Create new
         else:
             self.basefile = open(filename, 'w+b')
@@ -104,6 +167,7 @@ class WadIO:
         if not self.issafe:
             raise IOError, \
                 "closing a modified file may corrupt it. use save() first"
+        self._close_readers()
         self.basefile.close()
         self.basefile = None
 
@@ -147,9 +211,18 @@ class WadIO:
         """Read an entry and return the data as a binary string."""
         assert self.basefile
         id = self.select(id)
+        if instrument.recorder is not None:
+            instrument.recorder.read(self.entries[id].size)
         self.basefile.seek(self.entries[id].ptr)
         return self.basefile.read(self.entries[id].size)
 
+    def reference(self, id):
+        """Return a LumpRef to the data of an entry, for reading it
+        later (as long as the file is not modified)."""
+        assert self.basefile
+        entry = self.entries[self.select(id)]
+        return LumpRef(os.path.abspath(self.basefile.name), entry.ptr, entry.size)
+
     def remove(self, id):
         """Remove an entry."""
         assert self.basefile
@@ -163,30 +236,39 @@ class WadIO:
 
     def write_at(self, pos, data):
         """Write data at the given position."""
+        if instrument.recorder is not None:
+            instrument.recorder.write(len(data))
         self.basefile.seek(pos)
         self.basefile.write(data)
 
     def write_append(self, data):
         """Write data at the end of the file"""
+        if instrument.recorder is not None:
+            instrument.recorder.write(len(data))
         self.basefile.seek(0, 2)
         self.basefile.write(data)
 
     def insert(self, name, data, index=None):
         """Insert a new entry at the optional index (defaults to
-        appending)."""
+        appending). `data` may also be a LumpRef, in which case the
+        data is copied straight from the other file in large chunks."""
         assert self.basefile
         try:
             index = self.select(index)
         except:
             index = None
         self.issafe = False
-        self.basefile.seek(0, 2)
-        pos = self.basefile.tell()
-        self.basefile.write(data)
+        if isinstance(data, LumpRef):
+            if self.dedup:
+                data = data.read()
+            else:
+                pos, size = self._copy(data), data.size
+        if not isinstance(data, LumpRef):
+            pos, size = self._store(data), len(data)
         if index is None:
-            self.entries.append(Entry(pos, len(data), name))
+            self.entries.append(Entry(pos, size, name))
         else:
-            self.entries.insert(index, Entry(pos, len(data), name))
+            self.entries.insert(index, Entry(pos, size, name))
         self.basefile.flush()
 
     def update(self, id, data):
@@ -195,32 +277,103 @@ class WadIO:
         allocated for the lump."""
         assert self.basefile
         id = self.select(id)
-        if len(data) != self.entries[id].size:
+        entry = self.entries[id]
+        if isinstance(data, LumpRef):
+            data = data.read()
+        if len(data) != entry.size:
             self.issafe = False
-        if len(data) <= self.entries[id].size:
-            self.write_at(self.entries[id].ptr, data)
+        # Lumps may share their data with other entries (see dedup),
+        # in which case it must not be overwritten in place.
+        shared = entry.size and [e for e in self.entries if e is not entry
+            and e.size and e.ptr < entry.ptr + entry.size
+            and entry.ptr < e.ptr + e.size]
+        if len(data) <= entry.size and not shared and \
+           not (self.dedup and self._key(data) in self._stored):
+            for key, ptr in self._stored.items():
+                if ptr == entry.ptr:
+                    del self._stored[key]
+            self.write_at(entry.ptr, data)
         else:
             # Currently, the lump simply gets placed at the end of the file.
             # Instead, calc_waste() could be used to find empty space
-            self.basefile.seek(0, 2)
-            self.entries[id].ptr = self.basefile.tell()
-            self.basefile.write(data)
-        self.entries[id].size = len(data)
+            self.issafe = False
+            entry.ptr = self._store(data)
+        entry.size = len(data)
         self.basefile.flush()
 
+    def _copy(self, ref, bufsize=1<<20):
+        """Append the data a LumpRef refers to, reading and writing
+        `bufsize` bytes at a time. Returns its position."""
+        readers = self._readers
+        f = readers.get(ref.path)
+        if f is None:
+            # close a file before the cache would drop it unclosed
+            if len(readers) >= readers.maxsize:
+                oldest = readers.keys()[0]
+                readers[oldest].close()
+                del readers[oldest]
+            f = readers[ref.path] = open(ref.path, 'rb')
+        self.basefile.seek(0, 2)
+        pos = self.basefile.tell()
+        f.seek(ref.ptr)
+        left = ref.size
+        while left > 0:
+            chunk = f.read(min(bufsize, left))
+            if not chunk:
+                raise IOError, "%s is shorter than its directory says" % ref.path
+            self.basefile.write(chunk)
+            left -= len(chunk)
+        rec = instrument.recorder
+        if rec is not None:
+            rec.read(ref.size)
+            rec.write(ref.size)
+        return pos
+
+    def _close_readers(self):
+        for path in self._readers.keys():
+            self._readers[path].close()
+        self._readers.clear()
+
+    def _key(self, data):
+        return len(data), _md5(data).digest()
+
+    def _store(self, data):
+        """Write data at the end of the file and return its position,
+        or return the position of an identical copy if deduplicating."""
+        if self.dedup and data:
+            key = self._key(data)
+            if key in self._stored:
+                return self._stored[key]
+        if instrument.recorder is not None:
+            instrument.recorder.write(len(data))
+        self.basefile.seek(0, 2)
+        pos = self.basefile.tell()
+        self.basefile.write(data)
+        if self.dedup and data:
+            self._stored[key] = pos
+        return pos
+
     def save(self):
         """Save directory and header changes to the WAD file."""
         assert self.basefile
         if self.issafe: return
+        rec = instrument.recorder
+        if rec is not None:
+            t = instrument.timer()
         self.basefile.seek(0, 2)
         endpos = self.basefile.tell()
         for entry in self.entries:
             self.basefile.write(entry.pack())
         self.header.dir_len = len(self.entries)
         self.header.dir_ptr = endpos
+        if rec is not None:
+            rec.write(len(self.entries)*Entry._fmtsize)
         self.write_at(0, self.header.pack())
         self.basefile.flush()
+        self._close_readers()
         self.issafe = True
+        if rec is not None:
+            rec.time("write_directory", instrument.timer() - t)
 
     def rewrite(self):
         """Rewrite the entire WAD file. This removes all garbage
@@ -232,6 +385,7 @@ class WadIO:
         tmppath = md5.md5(str(time.time())).hexdigest()[:8] + ".tmp"
         tmppath = os.path.join(os.path.dirname(fpath), tmppath)
         outwad = create_wad(tmppath)
+        outwad.dedup = self.dedup
         for i in range(len(self.entries)):
             outwad.insert(self.entries[i].name, self.read(i))
         outwad.save()
@@ -240,6 +394,7 @@ class WadIO:
         os.remove(fpath)
         os.rename(tmppath, fpath)
         self.entries = []
+        self._stored = {}
         self.open(fpath)
         self.issafe = True
 